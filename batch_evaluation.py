@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch evaluation of many prediction runs. The implementation is in
+codiesp_eval.batch; this script is equivalent to:
+
+    codiesp-eval batch [options]
+"""
+
+import sys
+
+from codiesp_eval.batch import *  # noqa: F401,F403
+
+
+if __name__ == '__main__':
+    from codiesp_eval.batch import main
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark of the evaluators on synthetic corpora of growing size.
+
+For every size a corpus is generated with codiesp_eval.synthetic and written
+to disk (in a process of its own: on Linux a child process inherits the peak
+memory of its parent), and every evaluator runs from the command line in a fresh process
+with --profile, so that its wall time (importing pandas and reading the
+files included, the interpreter start-up excluded) and its peak resident
+memory are measured in isolation. Throughput is in prediction rows per second.
+
+Usage:
+    python benchmarks/bench_evaluators.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# name -> (command line arguments, prediction file)
+EVALUATORS = {
+    'map-d': (['d', '-g', '{gs_D}', '-p', '{pred_D}', '-c', '{codes_D}'], 'pred_D'),
+    'map-p': (['p', '-g', '{gs_P}', '-p', '{pred_P}', '-c', '{codes_P}'], 'pred_P'),
+    'f1-d': (['f1', '-g', '{gs_D}', '-p', '{pred_D}', '-c', '{codes_D}'], 'pred_D'),
+    'f1-p': (['f1', '-g', '{gs_P}', '-p', '{pred_P}', '-c', '{codes_P}'], 'pred_P'),
+    'ranked-d': (['ranked', '-g', '{gs_D}', '-p', '{pred_D}', '-c', '{codes_D}'], 'pred_D'),
+    'x': (['x', '-g', '{gs_X}', '-p', '{pred_X}', '-cD', '{codes_D}', '-cP', '{codes_P}'],
+          'pred_X'),
+}
+
+
+def write_corpus(n_docs, seed, out_dir):
+    '''
+    DESCRIPTION: Write a synthetic corpus in a fresh process and return the
+    path and number of rows of every file, by name.
+    '''
+    out = subprocess.run([sys.executable, '-m', 'codiesp_eval.synthetic', '-o', out_dir,
+                          '-n', str(n_docs), '-s', str(seed)],
+                         cwd=ROOT, check=True, stdout=subprocess.PIPE,
+                         universal_newlines=True).stdout
+    paths, n_rows = {}, {}
+    for line in out.strip().split('\n'):
+        name, rows, path = line.split('\t')
+        paths[name], n_rows[name] = path, int(rows)
+    return paths, n_rows
+
+
+def run_evaluator(arguments, paths):
+    '''
+    DESCRIPTION: Run one evaluation in a fresh process and return its
+    profiling report.
+    '''
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        report_path = f.name
+    try:
+        subprocess.run([sys.executable, '-m', 'codiesp_eval'] +
+                       [a.format(**paths) for a in arguments] +
+                       ['--profile', report_path],
+                       cwd=ROOT, check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        with open(report_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(report_path)
+
+
+def parse_arguments():
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+    parser = argparse.ArgumentParser(description='process user given parameters')
+    parser.add_argument("--sizes", dest = "sizes", type = int, nargs = '+',
+                        default = [1000, 10000, 100000],
+                        help = "number of clinical cases of each synthetic corpus")
+    parser.add_argument("--evaluators", dest = "evaluators", nargs = '+',
+                        default = list(EVALUATORS), choices = list(EVALUATORS),
+                        help = "evaluators to time")
+    parser.add_argument("--seed", dest = "seed", type = int, default = 0,
+                        help = "random seed of the corpora")
+    parser.add_argument("--stages", action = "store_true", dest = "stages",
+                        help = "also print the time of every pipeline stage")
+    parser.add_argument("-o", "--output", dest = "output", default = None,
+                        help = "also write the results as TSV to this path")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+
+    header = ['n_docs', 'evaluator', 'gs_rows', 'pred_rows', 'seconds', 'rows/s',
+              'peak_rss_mb']
+    rows = []
+    print('\t'.join(header))
+    for n_docs in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            paths, n_rows = write_corpus(n_docs, args.seed, tmp)
+            print('# corpus of {} clinical cases generated in {:.1f} s'.format(
+                n_docs, time.perf_counter() - start))
+
+            for name in args.evaluators:
+                arguments, pred_name = EVALUATORS[name]
+                report = run_evaluator(arguments, paths)
+                n_pred = n_rows[pred_name]
+                row = [n_docs, name, n_rows['gs_' + pred_name[-1]], n_pred,
+                       '{:.3f}'.format(report['wall_time_s']),
+                       '{:.0f}'.format(n_pred / report['wall_time_s']),
+                       '{:.1f}'.format(report['peak_rss_mb'] or float('nan'))]
+                rows.append(row)
+                print('\t'.join(map(str, row)))
+                if args.stages:
+                    for stage in report['stages']:
+                        print('#   {:24s} {:8.3f} s'.format(stage['name'],
+                                                           stage['wall_time_s']))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write('\t'.join(header) + '\n')
+            for row in rows:
+                f.write('\t'.join(map(str, row)) + '\n')
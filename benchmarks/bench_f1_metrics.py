@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of comp_f1_diag_proc.calculate_metrics against the previous
+per-document loop, on synthetic CodiEsp-D corpora of growing size
+(codiesp_eval.synthetic).
+
+Usage:
+    python benchmarks/bench_f1_metrics.py --sizes 1000 10000 100000 --legacy_max 3000
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from codiesp_eval import synthetic
+from codiesp_eval.f1_eval import calculate_metrics
+
+
+def legacy_calculate_metrics(df_gs, df_pred):
+    '''
+    DESCRIPTION: Previous True Positives computation (one pass per document).
+    '''
+    cc = set(df_gs.clinical_case.tolist())
+    TP_per_cc = pd.Series(dtype=float)
+    for c in cc:
+        pred = set(df_pred.loc[df_pred['clinical_case'] == c, 'code'].values)
+        gs = set(df_gs.loc[df_gs['clinical_case'] == c, 'code'].values)
+        TP_per_cc[c] = len(pred.intersection(gs))
+    return TP_per_cc
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='CodiEsp-D/P F1 benchmark')
+    parser.add_argument("--sizes", type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="number of clinical cases of each synthetic corpus")
+    parser.add_argument("--legacy_max", type=int, default=3000,
+                        help="largest corpus on which the legacy loop is timed")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    warnings.simplefilter('ignore')
+
+    print('n_docs\trows\timplementation\tseconds\tdocs/s')
+    for n_docs in args.sizes:
+        df_gs, df_pred = synthetic.to_frames(synthetic.make_corpus(n_docs), 'd')
+
+        start = time.perf_counter()
+        calculate_metrics(df_gs, df_pred)
+        elapsed = time.perf_counter() - start
+        print('{}\t{}\tgrouped\t{:.3f}\t{:.0f}'.format(n_docs, df_gs.shape[0],
+                                                       elapsed, n_docs / elapsed))
+
+        if n_docs <= args.legacy_max:
+            start = time.perf_counter()
+            legacy_calculate_metrics(df_gs, df_pred)
+            elapsed = time.perf_counter() - start
+            print('{}\t{}\tlegacy\t{:.3f}\t{:.0f}'.format(n_docs, df_gs.shape[0],
+                                                          elapsed, n_docs / elapsed))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of discontinuous Gold Standard references in CodiEsp-X: reading
+the GS with the vectorized offset parser against the previous row-wise
+apply, and matching in the default (first start to last end) and strict
+(every fragment) modes, on synthetic corpora whose references have many
+fragments.
+
+The corpus of codiesp_eval.synthetic is rewritten so that every reference
+has N fragments, and half of the references are also predicted fragment by
+fragment (so that the strict mode finds them).
+
+Usage:
+    python benchmarks/bench_fragments.py --n_docs 20000 --fragments 1 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from codiesp_eval import synthetic
+from codiesp_eval.codes_cache import load_valid_codes
+from codiesp_eval.x_eval import count_run, read_gs
+
+
+def legacy_read_gs(filepath, gs_headers=["clinical_case","label_gs", "code", "ref", "pos_gs"]):
+    '''
+    DESCRIPTION: Previous implementation (split + row-wise apply).
+    '''
+    gs_data = pd.read_csv(filepath, sep="\t", names=gs_headers)
+    gs_data.code = gs_data.code.str.lower()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        gs_data['start_pos_gs'], gs_data['aux_end_gs'] = gs_data['pos_gs'].str.split(' ', n=1).str
+    gs_data["end_pos_gs"] = gs_data['aux_end_gs'].apply(lambda x: x.split(' ')[-1])
+    gs_data = gs_data.drop(["aux_end_gs"], axis=1)
+    gs_data['start_pos_gs'] = gs_data['start_pos_gs'].astype("int")
+    gs_data['end_pos_gs'] = gs_data['end_pos_gs'].astype("int")
+    return gs_data
+
+
+def fragmented_corpus(n_docs, n_fragments, seed=0):
+    '''
+    DESCRIPTION: Synthetic corpus whose references have n_fragments
+    fragments each, with one prediction per fragment for half of them.
+    '''
+    corpus = synthetic.make_corpus(n_docs, discontinuous=0.0, seed=seed)
+    rng = np.random.default_rng(seed)
+    gs = corpus['gs_X']
+    n_refs = gs.shape[0]
+    first = gs['pos'].str.split(' ', n=1).str[0].astype(int).to_numpy()
+
+    # Fragments of 3 to 11 characters separated by gaps of 1 to 9
+    length = rng.integers(3, 12, (n_refs, n_fragments))
+    step = length + rng.integers(1, 10, (n_refs, n_fragments))
+    start = first[:, None] + np.cumsum(step, axis=1) - step
+    end = start + length
+    fragment_pos = [synthetic._positions(start[:, j], end[:, j]) for j in range(n_fragments)]
+    pos = fragment_pos[0]
+    for j in range(1, n_fragments):
+        pos = pos + ';' + fragment_pos[j]
+    corpus['gs_X'] = gs.assign(pos=pos)
+
+    # Predictions of every fragment of half of the references
+    predicted = np.flatnonzero(rng.random(n_refs) < 0.5)
+    extra = pd.DataFrame({
+        'clinical_case': np.repeat(gs['clinical_case'].to_numpy()[predicted], n_fragments),
+        'pos': synthetic._positions(start[predicted].ravel(), end[predicted].ravel()),
+        'label': np.repeat(gs['label'].to_numpy()[predicted], n_fragments),
+        'code': np.repeat(gs['code'].to_numpy()[predicted], n_fragments)})
+    corpus['pred_X'] = pd.concat([corpus['pred_X'], extra], ignore_index=True)
+    return corpus
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    out = function(*args, **kwargs)
+    return out, time.perf_counter() - start
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='CodiEsp-X discontinuous references benchmark')
+    parser.add_argument("--n_docs", type=int, default=20000,
+                        help="clinical cases in the synthetic corpus")
+    parser.add_argument("--fragments", type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="fragments per reference")
+    parser.add_argument("--tol", type=int, default=10, help="error tolerance")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+
+    print('fragments\tgs_refs\tpred_spans\tstage\tseconds\tF1')
+    for n_fragments in args.fragments:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = synthetic.write_corpus(fragmented_corpus(args.n_docs, n_fragments), tmp)
+            valid_codes = (load_valid_codes(paths['codes_D']) |
+                           load_valid_codes(paths['codes_P']))
+            n_pred = sum(1 for _ in open(paths['pred_X']))
+
+            old, t_old = timed(legacy_read_gs, paths['gs_X'])
+            df_gs, t_new = timed(read_gs, paths['gs_X'])
+            assert (old[['start_pos_gs', 'end_pos_gs']].to_numpy() ==
+                    df_gs[['start_pos_gs', 'end_pos_gs']].to_numpy()).all()
+            rows = [('read_gs (legacy apply)', t_old, ''), ('read_gs (vectorized)', t_new, '')]
+            for strict in (False, True):
+                counts, t = timed(count_run, df_gs, paths['pred_X'], valid_codes, args.tol,
+                                  strict=strict)
+                P, R = counts.TP / counts.Pred_Pos, counts.TP / counts.GS_Pos
+                F1 = 0 if (P + R) == 0 else 2 * P * R / (P + R)
+                rows.append(('count_run ({})'.format('strict' if strict else 'default'), t,
+                             '{:.3f}'.format(F1)))
+            for stage, seconds, F1 in rows:
+                print('{}\t{}\t{}\t{}\t{:.3f}\t{}'.format(n_fragments, df_gs.shape[0], n_pred,
+                                                         stage, seconds, F1))
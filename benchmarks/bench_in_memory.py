@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the in-memory evaluation API (codiesp_eval.evaluator) against
+the file round trip it replaces: predictions held in memory are written to
+a TSV file and scored from it (f1_eval.count_run and
+map_eval.calculate_map_from_file for CodiEsp-D, x_eval.count_run for
+CodiEsp-X), with the Gold Standard already loaded. Every evaluation is
+repeated, as after every epoch of a training loop, on synthetic corpora of
+growing size (codiesp_eval.synthetic).
+
+Usage:
+    python benchmarks/bench_in_memory.py --sizes 1000 10000 --repeat 5
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from codiesp_eval import f1_eval, map_eval, synthetic, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from codiesp_eval.evaluator import Evaluator
+from codiesp_eval.metrics import compute_metrics
+
+
+def file_round_trip(task, df_gs, qrels, df_pred, valid_codes, pred_path):
+    '''
+    DESCRIPTION: Write the predictions to a TSV file and score the file.
+    '''
+    if task == 'x':
+        df_pred[['clinical_case', 'pos', 'label', 'code']].to_csv(pred_path, sep='\t',
+                                                                  header=False, index=False)
+        _, P, _, R, _, F1 = compute_metrics(x_eval.count_run(df_gs, pred_path, valid_codes))
+        return P, R, F1, None
+    df_pred[['clinical_case', 'code']].to_csv(pred_path, sep='\t', header=False, index=False)
+    _, P, _, R, _, F1 = compute_metrics(f1_eval.count_run(df_gs, pred_path, valid_codes))
+    MAP = map_eval.calculate_map_from_file(qrels, pred_path, valid_codes)
+    return P, R, F1, MAP
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='CodiEsp in-memory evaluation benchmark')
+    parser.add_argument("--sizes", type=int, nargs='+', default=[1000, 10000],
+                        help="number of clinical cases of each synthetic corpus")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="evaluations of the same predictions")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    warnings.simplefilter('ignore')
+
+    print('n_docs\ttask\tpred_rows\timplementation\tseconds/eval\tsame')
+    for n_docs in args.sizes:
+        corpus = synthetic.make_corpus(n_docs)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = synthetic.write_corpus(corpus, tmp)
+            codes = {'d': load_valid_codes(paths['codes_D']),
+                     'x': load_valid_codes(paths['codes_D']) | load_valid_codes(paths['codes_P'])}
+            pred_path = os.path.join(tmp, 'run.tsv')
+            for task in ('d', 'x'):
+                suffix = task.upper()
+                df_gs = (x_eval.read_gs if task == 'x' else f1_eval.read_gs)(paths['gs_' + suffix])
+                qrels = map_eval.format_gs(paths['gs_' + suffix]) if task == 'd' else None
+                df_pred = corpus['pred_' + suffix]
+                if task == 'x':
+                    # Raw predictions, as a model would output them
+                    pos = df_pred['pos'].str.split(' ', n=1, expand=True)
+                    df_pred = df_pred.assign(start_pos_pred=pos[0].astype(int),
+                                             end_pos_pred=pos[1].astype(int))
+
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    expected = file_round_trip(task, df_gs, qrels, df_pred, codes[task],
+                                               pred_path)
+                t_file = (time.perf_counter() - start) / args.repeat
+
+                start = time.perf_counter()
+                evaluator = Evaluator(task, df_gs, codes[task])
+                t_bind = time.perf_counter() - start
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    scores = evaluator.evaluate(df_pred)
+                t_memory = (time.perf_counter() - start) / args.repeat
+
+                same = all((a is None and b is None) or abs(a - b) < 1e-12
+                           for a, b in zip(scores, expected))
+                for implementation, seconds in (('file round trip', t_file),
+                                                ('Evaluator (bind once)', t_bind),
+                                                ('Evaluator.evaluate', t_memory)):
+                    print('{}\t{}\t{}\t{}\t{:.4f}\t{}'.format(n_docs, task, df_pred.shape[0],
+                                                             implementation, seconds, same))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Start-up cost of the codiesp_eval package and of the codiesp-eval command.
+
+Every case is timed in a fresh interpreter (best of several repeats) and the
+time of a bare interpreter is subtracted. It fails (exit status 1) when
+importing the package or parsing a command line exceeds its budget, or when
+those steps import a heavy module (pandas, numpy, trectools).
+
+Usage:
+    python benchmarks/bench_startup.py --budget_ms 50
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY_MODULES = ['pandas', 'numpy', 'trectools', 'scipy', 'matplotlib']
+
+# name -> (code run in a fresh interpreter, whether it is bound by the budget)
+CASES = {
+    'import codiesp_eval': ('import codiesp_eval', True),
+    'codiesp-eval --help': (
+        'import sys; from codiesp_eval.cli import main\n'
+        'try:\n    main(["x", "--help"])\nexcept SystemExit:\n    pass', True),
+    'import codiesp_eval.map_eval': ('import codiesp_eval.map_eval', False),
+    'import codiesp_eval.x_eval': ('import codiesp_eval.x_eval', False),
+}
+
+
+def time_code(code, repeats):
+    '''
+    DESCRIPTION: Best wall time, in milliseconds, of running code in a fresh
+    interpreter, and the heavy modules it imported.
+    '''
+    probe = code + ('\nimport sys\nsys.stderr.write(",".join(m for m in {!r} '
+                    'if m in sys.modules))'.format(HEAVY_MODULES))
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        heavy = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               universal_newlines=True).stderr
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, [m for m in heavy.strip().split(',') if m]
+
+
+def parse_arguments():
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+    parser = argparse.ArgumentParser(description='process user given parameters')
+    parser.add_argument("--budget_ms", dest = "budget_ms", type = float, default = 50,
+                        help = "maximum start-up time above a bare interpreter")
+    parser.add_argument("--repeats", dest = "repeats", type = int, default = 7,
+                        help = "runs per case (the best one is reported)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+
+    baseline, _ = time_code('pass', args.repeats)
+    print('bare interpreter: {:.1f} ms'.format(baseline))
+
+    failed = False
+    for name, (code, bounded) in CASES.items():
+        elapsed, heavy = time_code(code, args.repeats)
+        status = ''
+        if bounded:
+            over = elapsed - baseline > args.budget_ms
+            failed |= over | (len(heavy) > 0)
+            status = 'FAIL' if over | (len(heavy) > 0) else 'ok'
+        print('{:32s} +{:8.1f} ms  heavy imports: {:30s} {}'.format(
+            name, elapsed - baseline, ','.join(heavy) or '-', status))
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the CodiEsp-X interval-matching engine against the previous
+merge + row-wise apply implementation, on a synthetic corpus
+(codiesp_eval.synthetic).
+
+Usage:
+    python benchmarks/bench_x_matching.py --n_docs 200000 --legacy_docs 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from codiesp_eval import synthetic
+from codiesp_eval.span_matching import covered_codes
+
+
+def legacy_covered_codes(df_gs, df_pred, tol=10):
+    '''
+    DESCRIPTION: Previous implementation (cartesian merge + row-wise apply).
+    '''
+    df_sel = pd.merge(df_pred, df_gs, how="right", on=["clinical_case", "code"])
+    df_sel["start_space"] = (df_sel["start_pos_gs"] - df_sel["start_pos_pred"])
+    df_sel["end_space"] = (df_sel["end_pos_pred"] - df_sel["end_pos_gs"])
+    df_sel["is_valid"] = df_sel.apply(lambda x: ((x["start_space"] <= tol) &
+                                                 (x["start_space"] >= 0) &
+                                                 (x["end_space"] <= tol) &
+                                                 (x["end_space"] >= 0)), axis=1)
+    return df_sel.sort_values(by="is_valid", ascending=True).drop_duplicates(
+        subset=["clinical_case", "code"], keep="last")
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    out = function(*args)
+    return out, time.perf_counter() - start
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='CodiEsp-X matching benchmark')
+    parser.add_argument("--n_docs", type=int, default=200000,
+                        help="clinical cases in the synthetic corpus")
+    parser.add_argument("--legacy_docs", type=int, default=5000,
+                        help="clinical cases used to time the legacy implementation")
+    parser.add_argument("--tol", type=int, default=10, help="error tolerance")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+
+    print('n_docs\tgs_spans\tpred_spans\timplementation\tseconds\tspans/s')
+    for n_docs, legacy in ((args.legacy_docs, True), (args.n_docs, False)):
+        df_gs, df_pred = synthetic.to_frames(
+            synthetic.make_corpus(n_docs, refs_per_code=3, tol=args.tol), 'x')
+        n_spans = df_gs.shape[0] + df_pred.shape[0]
+        new, t_new = timed(covered_codes, df_gs, df_pred, args.tol)
+        print('{}\t{}\t{}\tvectorized\t{:.3f}\t{:.0f}'.format(
+            n_docs, df_gs.shape[0], df_pred.shape[0], t_new, n_spans / t_new))
+        if legacy:
+            old, t_old = timed(legacy_covered_codes, df_gs, df_pred, args.tol)
+            print('{}\t{}\t{}\tlegacy\t{:.3f}\t{:.0f}'.format(
+                n_docs, df_gs.shape[0], df_pred.shape[0], t_old, n_spans / t_old))
+            assert (old.set_index(['clinical_case', 'code'])['is_valid'].sort_index().values ==
+                    new.set_index(['clinical_case', 'code'])['is_valid'].sort_index().values).all()
+            print('# speedup: {:.1f}x'.format(t_old / t_new))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation library of the CodiEsp track (Clinical Cases Coding in Spanish).
+
+Modules:
+    map_eval       MAP of CodiEsp-D and CodiEsp-P (format_gs, calculate_map, ...)
+    f1_eval        Precision, Recall and F-score of CodiEsp-D and CodiEsp-P
+    x_eval         Precision, Recall and F-score of CodiEsp-X
+    metrics        Counts and compute_metrics, shared by f1_eval and x_eval
+    codes_cache    load_valid_codes
+    gold_cache     load_gs (Gold Standards compiled into memory-mapped columns)
+    evaluator      Evaluator (scores predictions held in memory)
+    result_cache   ResultCache (results of predictions already evaluated)
+    cli            the codiesp-eval command
+
+Submodules and the names below are imported on first access, so importing
+the package does not import pandas, numpy or trectools.
+"""
+
+import importlib
+
+__version__ = '1.0.0'
+
+# Public name -> submodule that defines it
+_LAZY_NAMES = {
+    'load_valid_codes': 'codes_cache',
+    'load_gs': 'gold_cache',
+    'Evaluator': 'evaluator',
+    'Scores': 'evaluator',
+    'Counts': 'metrics',
+    'compute_metrics': 'metrics',
+    'calculate_map': 'map_eval',
+    'calculate_map_from_file': 'map_eval',
+}
+
+_SUBMODULES = ['batch', 'cli', 'codes_cache', 'encoding', 'error_analysis', 'evaluator',
+               'f1_eval', 'gold_cache', 'hierarchy', 'incremental', 'map_eval', 'metrics',
+               'output', 'profiling', 'ranked_eval', 'result_cache', 'server', 'shards',
+               'significance', 'span_matching', 'splits', 'streaming', 'synthetic', 'x_eval']
+
+__all__ = sorted(_LAZY_NAMES) + _SUBMODULES
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name in _LAZY_NAMES:
+        module = importlib.import_module('.' + _LAZY_NAMES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+python -m codiesp_eval {d,p,f1,x} ...
+"""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Evaluate many prediction runs against one Gold Standard.
+
+The Gold Standard and the valid codes lists are parsed once and shared with
+a pool of worker processes, which score one run each. The output is a single
+table with one row per run. A run that can not be read (wrong format,
+malformed positions...) gets a row with the error and no scores, and the
+command exits with status 1; any other exception stops the batch.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from . import f1_eval, map_eval, x_eval
+from .codes_cache import load_valid_codes
+from .gold_cache import load_gs
+from .metrics import compute_metrics
+
+# Gold Standard and valid codes of the batch, set in every worker process by
+# _init_worker
+_shared = {}
+
+# Errors of a predictions file that can not be evaluated: those raised by the
+# readers on wrong formats and values (see streaming and the readers of every
+# subtask). Other exceptions are bugs and are not caught.
+INPUT_ERRORS = (ValueError, pd.errors.ParserError, ImportError)
+
+# Columns of the output table
+COLUMNS = ['run', 'P', 'R', 'F1', 'MAP', 'error']
+
+
+def find_runs(pred_path):
+    '''
+    DESCRIPTION: List prediction files.
+
+    INPUT:
+        pred_path: str
+            directory (all its TSV files are used) or glob pattern.
+
+    OUTPUT:
+        runs: list
+            sorted list of paths to prediction files.
+    '''
+    if os.path.isdir(pred_path):
+        pred_path = os.path.join(pred_path, '*.tsv')
+    runs = sorted(p for p in glob.glob(pred_path) if os.path.isfile(p))
+    if len(runs) == 0:
+        raise FileNotFoundError('No prediction files found in {}'.format(pred_path))
+    return runs
+
+
+def load_gold(task, gs_path):
+    '''
+    DESCRIPTION: Parse the Gold Standard once for the whole batch.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        gs_path: str
+            route to TSV file with Gold Standard.
+
+    OUTPUT:
+        gold: dict
+            parsed Gold Standard, in the formats expected by the metrics of
+            the task.
+    '''
+    if task == 'x':
+        return {'gs': load_gs(gs_path, 'x')}
+    return {'gs': load_gs(gs_path, 'f1'),
+            'qrels': load_gs(gs_path, 'map')}
+
+
+def _init_worker(task, gold, valid_codes):
+    _shared['task'] = task
+    _shared['gold'] = gold
+    _shared['valid_codes'] = valid_codes
+
+
+def _init_pool_worker(task, gs_path, valid_codes):
+    # Every worker maps the Gold Standard compiled by the parent (see
+    # gold_cache) instead of unpickling a copy of it
+    _init_worker(task, load_gold(task, gs_path), valid_codes)
+
+
+def evaluate_run(pred_path):
+    '''
+    DESCRIPTION: Score one run against the Gold Standard of the batch.
+
+    INPUT:
+        pred_path: str
+            route to TSV file with Predictions.
+
+    OUTPUT:
+        row: dict
+            with keys run, P, R, F1, MAP (None for CodiEsp-X) and error
+            (None, or the error of a run that could not be evaluated).
+    '''
+    row = {'run': pred_path, 'P': None, 'R': None, 'F1': None, 'MAP': None, 'error': None}
+    try:
+        row.update(score_run(_shared['task'], _shared['gold'], pred_path,
+                             _shared['valid_codes']))
+    except INPUT_ERRORS as e:
+        warnings.warn('{} was not evaluated: {}'.format(pred_path, e))
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+    return row
+
+
+def score_run(task, gold, pred_path, valid_codes):
+    '''
+    DESCRIPTION: Score one run. The predictions file is read once, also for
+    the two metrics of CodiEsp-D/P.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        gold: dict
+            as output by load_gold.
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask.
+
+    OUTPUT:
+        scores: dict
+            with keys P, R, F1 and MAP (None for CodiEsp-X).
+    '''
+    if task == 'x':
+        _, P, _, R, _, F1 = compute_metrics(x_eval.count_run(gold['gs'], pred_path,
+                                                             valid_codes))
+        return {'P': P, 'R': R, 'F1': F1, 'MAP': None}
+
+    # Both metrics are computed from the same parsed predictions
+    pred = map_eval.format_predictions(pred_path, None, valid_codes)
+    MAP = map_eval.calculate_map(gold['qrels'], pred)
+    df_run = pred[['query', 'docid']].rename(columns={'query': 'clinical_case',
+                                                      'docid': 'code'})
+    _, P, _, R, _, F1 = f1_eval.calculate_metrics(gold['gs'], df_run)
+    return {'P': P, 'R': R, 'F1': F1, 'MAP': MAP}
+
+
+def evaluate_batch(task, gs_path, runs, valid_codes, workers=None):
+    '''
+    DESCRIPTION: Score several runs against one Gold Standard in parallel.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        gs_path: str
+            route to TSV file with Gold Standard.
+        runs: list
+            routes to TSV files with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask.
+        workers: int
+            size of the process pool. If None, one worker per CPU.
+
+    OUTPUT:
+        results: pandas dataframe
+            one row per run, with columns ['run', 'P', 'R', 'F1', 'MAP',
+            'error'].
+    '''
+    gold = load_gold(task, gs_path)
+    workers = min(workers or os.cpu_count() or 1, len(runs))
+
+    if workers == 1:
+        _init_worker(task, gold, valid_codes)
+        rows = [evaluate_run(r) for r in runs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker,
+                                 initargs=(task, gs_path, valid_codes)) as executor:
+            rows = list(executor.map(evaluate_run, runs))
+
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def parse_arguments(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+
+    parser = argparse.ArgumentParser(description='process user given parameters')
+    parser.add_argument("-t", "--task", required = True, dest = "task",
+                        choices = ['d', 'p', 'x'], help = "CodiEsp subtask")
+    parser.add_argument("-g", "--gs_path", required = True, dest = "gs_path",
+                        help = "path to GS file")
+    parser.add_argument("-p", "--pred_path", required = True, dest = "pred_path",
+                        help = "directory or glob pattern of predictions files")
+    parser.add_argument("-c", "--valid_codes_path", dest = "codes_path",
+                        help = "path to valid codes TSV (CodiEsp-D and CodiEsp-P)")
+    parser.add_argument("-cD", "--valid_codes_D_path", dest = "codes_D_path",
+                        help = "path to valid CIE10 Diagnostico codes TSV (CodiEsp-X)")
+    parser.add_argument("-cP", "--valid_codes_P_path", dest = "codes_P_path",
+                        help = "path to valid CIE10 Procedimiento codes TSV (CodiEsp-X)")
+    parser.add_argument("-w", "--workers", dest = "workers", type = int, default = None,
+                        help = "number of worker processes (default: number of CPUs)")
+    parser.add_argument("-o", "--output", dest = "output", default = None,
+                        help = "path to output TSV (default: standard output)")
+
+    args = parser.parse_args(argv)
+    if (args.task == 'x') & ((args.codes_D_path is None) | (args.codes_P_path is None)):
+        parser.error('CodiEsp-X requires --valid_codes_D_path and --valid_codes_P_path')
+    if (args.task != 'x') & (args.codes_path is None):
+        parser.error('CodiEsp-D and CodiEsp-P require --valid_codes_path')
+
+    return args
+
+
+def main(argv=None):
+
+    args = parse_arguments(argv)
+
+    ###### 0. Load valid codes lists: ######
+    if args.task == 'x':
+        valid_codes = load_valid_codes(args.codes_D_path).union(
+            load_valid_codes(args.codes_P_path))
+    else:
+        valid_codes = load_valid_codes(args.codes_path)
+
+    ###### 1. Evaluate runs ######
+    results = evaluate_batch(args.task, args.gs_path, find_runs(args.pred_path),
+                             valid_codes, args.workers)
+
+    ###### 2. Show results ######
+    results.to_csv(args.output if args.output is not None else sys.stdout,
+                   sep='\t', index=False, float_format='%.3f')
+    return 1 if results['error'].notna().any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
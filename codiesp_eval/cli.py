@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line interface of the CodiEsp evaluation.
+
+    codiesp-eval d  -g gs.tsv -p pred.tsv -c codes.tsv      MAP (CodiEsp-D)
+    codiesp-eval p  -g gs.tsv -p pred.tsv -c codes.tsv      MAP (CodiEsp-P)
+    codiesp-eval f1 -g gs.tsv -p pred.tsv -c codes.tsv      P, R, F1 (CodiEsp-D/P)
+                    [--levels category subcategory code]
+    codiesp-eval ranked -g gs.tsv -p pred.tsv -c codes.tsv  MAP, P@k, nDCG... and F1
+    codiesp-eval x  -g gs.tsv -p pred.tsv -cD codes-D.tsv -cP codes-P.tsv
+                    [--tol 10 | --tol_sweep 0 50 | --levels category code] [--strict]
+                    [--workers 8]
+
+d, p, f1 and x keep the results of every predictions file in a cache with
+--result_cache: resubmitting identical predictions does not evaluate them again.
+
+f1 and x also write their results as JSON, TSV or Parquet with -o results.json,
+and only print the micro-averages with --quiet. --per_code codes.tsv and
+--errors errors.tsv write the per-code results and the False Positives and
+False Negatives of every clinical case, and print the macro-averages over codes.
+
+The tools batch, compile, significance, serve, splits and synthetic take the
+options of their modules.
+
+Only argparse is imported to parse the command line: pandas, numpy and the
+evaluation modules are imported once the subcommand is known, and trectools
+only with --cross_check.
+"""
+
+import argparse
+import importlib
+import sys
+import warnings
+
+# Tools with a command line of their own: codiesp-eval <tool> [options]
+TOOLS = {'batch': 'codiesp_eval.batch',
+         'compile': 'codiesp_eval.gold_cache',
+         'significance': 'codiesp_eval.significance',
+         'serve': 'codiesp_eval.server',
+         'splits': 'codiesp_eval.splits',
+         'synthetic': 'codiesp_eval.synthetic'}
+
+
+def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
+    return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
+
+
+def build_parser():
+    '''
+    DESCRIPTION: Command line parser, with one subcommand per evaluation.
+    '''
+    parser = argparse.ArgumentParser(
+        prog='codiesp-eval', description='CodiEsp evaluation',
+        epilog='other tools: {} (run codiesp-eval <tool> -h)'.format(', '.join(TOOLS)))
+    subparsers = parser.add_subparsers(dest='command', metavar='{d,p,f1,ranked,x}')
+    subparsers.required = True
+
+    commands = {'d': 'MAP of CodiEsp-D', 'p': 'MAP of CodiEsp-P',
+                'f1': 'Precision, Recall and F-score of CodiEsp-D or CodiEsp-P',
+                'ranked': 'MAP, MAP@k, P@k, R-precision, nDCG, Precision, Recall ' +
+                'and F-score of CodiEsp-D or CodiEsp-P',
+                'x': 'Precision, Recall and F-score of CodiEsp-X'}
+    for command, description in commands.items():
+        sub = subparsers.add_parser(command, help=description, description=description)
+        sub.add_argument("-g", "--gs_path", required = True, dest = "gs_path",
+                         help = "path to GS file")
+        sub.add_argument("-p", "--pred_path", required = True, dest = "pred_path",
+                         help = "path to predictions file")
+        if command == 'x':
+            sub.add_argument("-cD", "--valid_codes_D_path", required = True,
+                             dest = "codes_D_path",
+                             help = "path to valid CIE10 Diagnostico codes TSV")
+            sub.add_argument("-cP", "--valid_codes_P_path", required = True,
+                             dest = "codes_P_path",
+                             help = "path to valid CIE10 Procedimiento codes TSV")
+        else:
+            sub.add_argument("-c", "--valid_codes_path", required = True,
+                             dest = "codes_path", help = "path to valid codes TSV")
+        if command in ('d', 'p'):
+            sub.add_argument("--cross_check", action = "store_true",
+                             dest = "cross_check",
+                             help = "also compute MAP with trectools and compare")
+        elif command == 'ranked':
+            sub.add_argument("-k", "--cutoffs", dest = "cutoffs", type = int, nargs = '+',
+                             default = [5, 10],
+                             help = "cutoffs of P@k, MAP@k and nDCG@k (default: 5 10)")
+        else:
+            # The tolerance sweep and the granularity levels do not keep
+            # per-document state
+            group = sub.add_mutually_exclusive_group()
+            group.add_argument("-s", "--state_path", dest = "state_path", default = None,
+                               help = "path to state file of incremental re-evaluation")
+            group.add_argument("-l", "--levels", dest = "levels", nargs = '+', default = None,
+                               metavar = "LEVEL",
+                               help = "print Precision, Recall and F-score at every " +
+                               "granularity level (category, subcategory, code or a " +
+                               "number of characters), reading the predictions once")
+        if command == 'x':
+            sub.add_argument("--tol", dest = "tol", type = int, default = 10,
+                             help = "error tolerance of the references, in " +
+                             "characters (default: 10)")
+            sub.add_argument("--strict", action = "store_true", dest = "strict",
+                             help = "match every fragment of discontinuous references " +
+                             "(default: from the start of the first fragment to the " +
+                             "end of the last one)")
+            group.add_argument("--tol_sweep", dest = "tol_sweep", type = int, nargs = 2,
+                               metavar = ("MIN", "MAX"), default = None,
+                               help = "print Precision, Recall and F-score for every " +
+                               "tolerance from MIN to MAX, with a single matching pass")
+            sub.add_argument("-w", "--workers", dest = "workers", type = int, default = 1,
+                             help = "number of worker processes that read and match " +
+                             "the predictions file (default: 1; 0: one per CPU)")
+        if command in ('f1', 'x'):
+            sub.add_argument("-o", "--output", dest = "output", default = None,
+                             help = "also write the results to this file ('-': " +
+                             "standard output), as JSON, TSV or Parquet")
+            sub.add_argument("--output_format", dest = "output_format", default = None,
+                             choices = ['json', 'tsv', 'parquet'],
+                             help = "format of --output (default: from its extension)")
+            sub.add_argument("-q", "--quiet", action = "store_true", dest = "quiet",
+                             help = "only print the micro-averages, not the " +
+                             "results of every clinical case")
+            sub.add_argument("--per_code", dest = "per_code", default = None,
+                             help = "write TP, FP, FN, Precision, Recall and F-score " +
+                             "of every code to this file (JSON, TSV or Parquet, from " +
+                             "its extension) and print the macro-averages over codes")
+            sub.add_argument("--errors", dest = "errors", default = None,
+                             help = "write the False Positives and False Negatives of " +
+                             "every clinical case to this file (JSON, TSV or Parquet; " +
+                             "'-': TSV to the standard output)")
+        if command != 'ranked':
+            sub.add_argument("--result_cache", dest = "result_cache", nargs = '?',
+                             const = '', default = None, metavar = "PATH",
+                             help = "read the results of predictions already evaluated " +
+                             "with the same GS, codes and parameters from this SQLite " +
+                             "cache, and store new ones (default PATH: " +
+                             "$CODIESP_CACHE_DIR/results.sqlite)")
+            sub.add_argument("--result_cache_size", dest = "result_cache_size", type = int,
+                             default = 256,
+                             help = "size of the result cache, in MiB; the least " +
+                             "recently used results are evicted (default: 256)")
+        sub.add_argument("--profile", dest = "profile", default = None,
+                         help = "write a JSON report of time, rows and memory per " +
+                         "stage to this path ('-': standard error)")
+        sub.add_argument("--profile_cprofile", action = "store_true",
+                         dest = "profile_cprofile",
+                         help = "include the top cProfile functions in the report")
+        sub.add_argument("--profile_tracemalloc", action = "store_true",
+                         dest = "profile_tracemalloc",
+                         help = "measure the peak Python memory of every stage " +
+                         "with tracemalloc (slower)")
+    return parser
+
+
+def run_map(args):
+    '''
+    DESCRIPTION: CodiEsp-D and CodiEsp-P evaluation (MAP).
+    '''
+    from . import profiling
+    from .map_eval import (calculate_map_from_file, calculate_map_trectools,
+                           format_predictions)
+
+    if args.result_cache is not None:
+        ###### 0-3. Read MAP from the result cache, or compute it ######
+        def evaluate():
+            valid_codes, gs = load_inputs(args, 'map')
+            return {'MAP': calculate_map_from_file(gs, args.pred_path, valid_codes)}
+        MAP = cached_evaluation(args, 'map', [args.gs_path, args.codes_path], evaluate)['MAP']
+    else:
+        ###### 0-1. Load valid codes lists and format GS as TrecQrel format: ######
+        valid_codes, gs = load_inputs(args, 'map')
+
+        ###### 2-3. Read predictions and calculate MAP ######
+        MAP = calculate_map_from_file(gs, args.pred_path, valid_codes)
+    if args.cross_check:
+        with profiling.stage('cross_check'):
+            pred = format_predictions(args.pred_path, None, valid_codes)
+            MAP_trectools = calculate_map_trectools(gs, pred)
+        if abs(MAP - MAP_trectools) > 1e-9:
+            warnings.warn('MAP differs from trectools MAP ({})'.format(MAP_trectools))
+
+    ###### 4. Show results ######
+    with profiling.stage('print_results'):
+        print('\nMAP estimate: {}\n'.format(round(MAP, 3)))
+        if args.cross_check:
+            print('trectools MAP estimate: {}\n'.format(round(MAP_trectools, 3)))
+
+
+def run_f1(args):
+    '''
+    DESCRIPTION: CodiEsp-D and CodiEsp-P evaluation (Precision, Recall and
+    F-score).
+    '''
+    from . import profiling
+    from .f1_eval import count_run
+    from .metrics import compute_metrics
+
+    analysis = None
+    if args.result_cache is not None:
+        ###### 0-1. Read the counts from the result cache, or count ######
+        def evaluate():
+            valid_codes, df_gs = load_inputs(args, 'f1')
+            return {'counts': count_run(df_gs, args.pred_path, valid_codes)}
+        counts = cached_evaluation(args, 'f1', [args.gs_path, args.codes_path],
+                                   evaluate)['counts']
+    else:
+        ###### 0-1. Load valid codes lists, GS and Predictions ######
+        valid_codes, df_gs = load_inputs(args, 'f1')
+        if args.levels is not None:
+            from .f1_eval import count_run_levels
+            print_levels(args, count_run_levels(df_gs, args.pred_path, valid_codes,
+                                                args.levels))
+            return
+        if (args.per_code is not None) | (args.errors is not None):
+            from .f1_eval import analyse_run
+            counts, analysis = analyse_run(df_gs, args.pred_path, valid_codes)
+        elif args.state_path is not None:
+            # Only count again the clinical cases changed since the last run
+            # (CodiEsp-D and CodiEsp-P are counted the same way)
+            from .incremental import count_run_incremental
+            counts, _ = count_run_incremental('d', df_gs, args.pred_path, valid_codes,
+                                              args.state_path)
+        else:
+            counts = count_run(df_gs, args.pred_path, valid_codes)
+
+    ###### 2. Calculate score ######
+    with profiling.stage('compute_metrics'):
+        P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = compute_metrics(counts)
+
+    ###### 3. Show results ######
+    report_results(args, P_per_cc, P, R_per_cc, R, F1_per_cc, F1,
+                   '\n{}|{}|{}\n'.format(round(P, 3), round(R, 3), round(F1, 3)))
+    if analysis is not None:
+        report_analysis(args, analysis)
+
+
+def load_inputs(args, reader):
+    '''
+    DESCRIPTION: Load the valid codes list and the GS of a CodiEsp-D or
+    CodiEsp-P evaluation.
+    '''
+    from . import profiling
+    from .codes_cache import load_valid_codes
+    from .gold_cache import load_gs
+
+    ###### 0. Load valid codes lists: ######
+    with profiling.stage('load_valid_codes') as record:
+        valid_codes = load_valid_codes(args.codes_path)
+        record['rows_out'] = len(valid_codes)
+
+    ###### 1. Load GS ######
+    with profiling.stage('read_gs') as record:
+        gs = load_gs(args.gs_path, reader)
+        record['rows_out'] = gs.shape[0]
+    return valid_codes, gs
+
+
+def cached_evaluation(args, command, source_paths, evaluate, **params):
+    '''
+    DESCRIPTION: Result of an evaluation from --result_cache: predictions
+    identical to some already evaluated with the same GS, valid codes and
+    parameters are not read again (see result_cache).
+
+    INPUT:
+        args: argparse namespace
+        command: str
+            name of the evaluation in the cache key.
+        source_paths: list
+            routes to the GS and valid codes files.
+        evaluate: function
+            evaluation, returning a dict with the keys counts and/or MAP.
+        params: dict
+            parameters of the evaluation.
+
+    OUTPUT:
+        result: dict
+            as output by result_cache.ResultCache.evaluate.
+    '''
+    from . import profiling
+    from .codes_cache import file_sha256
+    from .result_cache import ResultCache, result_key
+
+    with profiling.stage('result_key'):
+        key = result_key(command, file_sha256(args.pred_path),
+                         [file_sha256(path) for path in source_paths], **params)
+    cache = ResultCache(args.result_cache or None, args.result_cache_size * 1024 * 1024)
+    try:
+        return cache.evaluate(key, evaluate)
+    finally:
+        cache.close()
+
+
+def run_ranked(args):
+    '''
+    DESCRIPTION: CodiEsp-D and CodiEsp-P ranked evaluation (every metric
+    from a single encoding of the run).
+    '''
+    from . import profiling
+    from .codes_cache import load_valid_codes
+    from .gold_cache import load_gs
+    from .ranked_eval import ranked_metrics, read_ranked_run
+
+    ###### 0. Load valid codes lists: ######
+    with profiling.stage('load_valid_codes') as record:
+        valid_codes = load_valid_codes(args.codes_path)
+        record['rows_out'] = len(valid_codes)
+
+    ###### 1. Load GS and Predictions ######
+    with profiling.stage('read_gs') as record:
+        gs = load_gs(args.gs_path, 'map')
+        record['rows_out'] = gs.shape[0]
+    run = read_ranked_run(gs, args.pred_path, valid_codes)
+
+    ###### 2. Calculate score ######
+    metrics = ranked_metrics(run, ks=args.cutoffs)
+
+    ###### 3. Show results ######
+    with profiling.stage('print_results'):
+        for name, value in metrics.items():
+            print('{}\t{}'.format(name, round(value, 3)))
+
+
+def run_x(args):
+    '''
+    DESCRIPTION: CodiEsp-X evaluation (Precision, Recall and F-score).
+    '''
+    from . import profiling
+    from .metrics import compute_metrics
+    from .x_eval import count_run
+
+    def count(df_gs, valid_codes):
+        if args.workers != 1:
+            # One range of the predictions file per worker process
+            from .shards import count_run_sharded
+            return count_run_sharded(df_gs, args.pred_path, valid_codes, args.tol,
+                                     strict=args.strict, workers=args.workers or None)
+        return count_run(df_gs, args.pred_path, valid_codes, args.tol, strict=args.strict)
+
+    analysis = None
+    if args.result_cache is not None:
+        ###### 0-1. Read the counts from the result cache, or count ######
+        def evaluate():
+            _, _, valid_codes, df_gs = load_x_inputs(args)
+            return {'counts': count(df_gs, valid_codes)}
+        counts = cached_evaluation(args, 'x', [args.gs_path, args.codes_D_path,
+                                               args.codes_P_path],
+                                   evaluate, tol=args.tol, strict=args.strict)['counts']
+    else:
+        ###### 0-1. Load valid codes lists, GS and Predictions ######
+        valid_codes_D, valid_codes_P, valid_codes, df_gs = load_x_inputs(args)
+        if args.tol_sweep is not None:
+            run_tol_sweep(args, df_gs, valid_codes)
+            return
+        if args.levels is not None:
+            from .x_eval import count_run_levels
+            print_levels(args, count_run_levels(df_gs, args.pred_path, valid_codes,
+                                                args.levels, args.tol, strict=args.strict))
+            return
+        if (args.per_code is not None) | (args.errors is not None):
+            from .x_eval import analyse_run
+            counts, analysis = analyse_run(df_gs, args.pred_path, valid_codes, args.tol,
+                                           strict=args.strict,
+                                           code_types={'DIAGNOSTICO': valid_codes_D,
+                                                       'PROCEDIMIENTO': valid_codes_P})
+        elif args.state_path is not None:
+            # Only count again the clinical cases changed since the last run
+            from .incremental import count_run_incremental
+            counts, _ = count_run_incremental('x', df_gs, args.pred_path, valid_codes,
+                                              args.state_path, args.tol)
+        else:
+            counts = count(df_gs, valid_codes)
+
+    ###### 2. Calculate score ######
+    with profiling.stage('compute_metrics'):
+        P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = compute_metrics(counts)
+
+    ###### 3. Show results ######
+    report_results(args, P_per_cc, P, R_per_cc, R, F1_per_cc, F1)
+    if analysis is not None:
+        report_analysis(args, analysis)
+
+
+def load_x_inputs(args):
+    '''
+    DESCRIPTION: Load the valid codes lists (and their union) and the GS of a
+    CodiEsp-X evaluation.
+    '''
+    from . import profiling
+    from .codes_cache import load_valid_codes
+    from .gold_cache import load_gs
+
+    ###### 0. Load valid codes lists: ######
+    with profiling.stage('load_valid_codes') as record:
+        valid_codes_D = load_valid_codes(args.codes_D_path)
+        valid_codes_P = load_valid_codes(args.codes_P_path)
+
+        valid_codes = valid_codes_D.union(valid_codes_P)
+        record['rows_out'] = len(valid_codes)
+
+    ###### 1. Load GS ######
+    with profiling.stage('read_gs') as record:
+        df_gs = load_gs(args.gs_path, 'x')
+        record['rows_out'] = df_gs.shape[0]
+    return valid_codes_D, valid_codes_P, valid_codes, df_gs
+
+
+def run_tol_sweep(args, df_gs, valid_codes):
+    '''
+    DESCRIPTION: CodiEsp-X micro-average metrics for a range of error
+    tolerances (one row per tolerance).
+    '''
+    from . import profiling
+    from .x_eval import sweep_run
+
+    tol_min, tol_max = args.tol_sweep
+    curve = sweep_run(df_gs, args.pred_path, valid_codes, range(tol_min, tol_max + 1),
+                      strict=args.strict)
+
+    with profiling.stage('print_results'):
+        lines = ['tol\tP\tR\tF1']
+        lines += ['{}\t{}\t{}\t{}'.format(row.tol, round(row.P, 3), round(row.R, 3),
+                                          round(row.F1, 3)) for row in curve.itertuples()]
+        sys.stdout.write('\n'.join(lines) + '\n')
+    write_output(args, curve)
+
+
+def print_levels(args, counts):
+    '''
+    DESCRIPTION: Print micro-average Precision, Recall and F-score of every
+    granularity level (one row per level).
+    '''
+    import pandas as pd
+    from . import profiling
+    from .metrics import compute_metrics
+
+    with profiling.stage('compute_metrics'):
+        rows = [(name,) + compute_metrics(level_counts)[1::2]
+                for name, level_counts in counts.items()]
+        table = pd.DataFrame(rows, columns=['level', 'P', 'R', 'F1'])
+
+    with profiling.stage('print_results'):
+        lines = ['level\tP\tR\tF1']
+        lines += ['{}\t{}\t{}\t{}'.format(name, round(P, 3), round(R, 3), round(F1, 3))
+                  for name, P, R, F1 in rows]
+        sys.stdout.write('\n'.join(lines) + '\n')
+    write_output(args, table)
+
+
+def report_results(args, P_per_cc, P, R_per_cc, R, F1_per_cc, F1, footer=''):
+    '''
+    DESCRIPTION: Print the results (only the micro-averages with --quiet),
+    followed by footer, and write them to --output.
+    '''
+    from . import profiling
+    from .output import results_table, summary
+
+    with profiling.stage('print_results'):
+        if args.quiet:
+            text = format_summary(P, R, F1)
+        else:
+            text = format_results(P_per_cc, P, R_per_cc, R, F1_per_cc, F1)
+        sys.stdout.write(text + footer)
+    if args.output is not None:
+        with profiling.stage('results_table', P_per_cc.shape[0]):
+            table = results_table(P_per_cc, R_per_cc, F1_per_cc)
+        write_output(args, table, summary(P, R, F1))
+
+
+def report_analysis(args, analysis):
+    '''
+    DESCRIPTION: Print the macro-averages over codes of an error analysis,
+    and write its per-code table to --per_code and its errors to --errors.
+    '''
+    from . import profiling
+    from .output import write_table
+
+    with profiling.stage('print_results'):
+        lines = ['\nMACRO-AVERAGE STATISTICS (over codes):\n', 'group\tcodes\tP\tR\tF1']
+        lines += ['{}\t{}\t{}\t{}\t{}'.format(row.group, row.codes, round(row.P, 3),
+                                              round(row.R, 3), round(row.F1, 3))
+                  for row in analysis.macro.itertuples()]
+        sys.stdout.write('\n'.join(lines) + '\n')
+    for path, table in ((args.per_code, analysis.codes), (args.errors, analysis.errors)):
+        if path is not None:
+            with profiling.stage('write_output', table.shape[0]):
+                if path == '-':
+                    sys.stdout.flush()
+                write_table(table, path, analysis_format(path))
+
+
+def analysis_format(path):
+    '''
+    DESCRIPTION: Format of --per_code and --errors: TSV on the standard
+    output, otherwise taken from the extension.
+    '''
+    return 'tsv' if path == '-' else None
+
+
+def write_output(args, table, summary=None):
+    '''
+    DESCRIPTION: Write a result table to --output, if given.
+    '''
+    if getattr(args, 'output', None) is None:
+        return
+    from . import profiling
+    from .output import write_table
+
+    with profiling.stage('write_output', table.shape[0]):
+        if args.output == '-':
+            sys.stdout.flush()
+        write_table(table, args.output, args.output_format, summary)
+
+
+def print_results(P_per_cc, P, R_per_cc, R, F1_per_cc, F1):
+    '''
+    DESCRIPTION: Print Precision, Recall and F-score per clinical case and
+    micro-averaged.
+    '''
+    sys.stdout.write(format_results(P_per_cc, P, R_per_cc, R, F1_per_cc, F1))
+
+
+def format_results(P_per_cc, P, R_per_cc, R, F1_per_cc, F1):
+    '''
+    DESCRIPTION: Text of Precision, Recall and F-score per clinical case and
+    micro-averaged, built at once so that it is written in a single call.
+    '''
+    rule = '-----------------------------------------------------'
+
+    def per_cc(values, name):
+        lines = ['', rule, 'Clinical case name\t\t\t' + name, rule]
+        for index, val in values.items():
+            lines += [str(index) + '\t\t' + str(round(val, 3)), rule]
+        return lines
+
+    lines = per_cc(P_per_cc, 'Precision')
+    if any(P_per_cc.isna()):
+        warnings.warn('Some documents do not have predicted codes, ' +
+                      'document-wise Precision not computed for them.')
+    lines += ['\nMicro-average precision = {}\n'.format(round(P, 3))]
+
+    lines += per_cc(R_per_cc, 'Recall')
+    if any(R_per_cc.isna()):
+        warnings.warn('Some documents do not have Gold Standard codes, ' +
+                      'document-wise Recall not computed for them.')
+    lines += ['\nMicro-average recall = {}\n'.format(round(R, 3))]
+
+    lines += per_cc(F1_per_cc, 'F-score')
+    if any(P_per_cc.isna()):
+        warnings.warn('Some documents do not have predicted codes, ' +
+                      'document-wise F-score not computed for them.')
+    if any(R_per_cc.isna()):
+        warnings.warn('Some documents do not have Gold Standard codes, ' +
+                      'document-wise F-score not computed for them.')
+    lines += ['\nMicro-average F-score = {}\n'.format(round(F1, 3))]
+
+    return '\n'.join(lines) + '\n' + format_summary(P, R, F1)
+
+
+def format_summary(P, R, F1):
+    '''
+    DESCRIPTION: Text of the micro-average Precision, Recall and F-score.
+    '''
+    return ('\n__________________________________________________________\n' +
+            '\nMICRO-AVERAGE STATISTICS:\n' +
+            '\nMicro-average precision = {}\n'.format(round(P, 3)) +
+            '\nMicro-average recall = {}\n'.format(round(R, 3)) +
+            '\nMicro-average F-score = {}\n\n'.format(round(F1, 3)))
+
+
+COMMANDS = {'d': run_map, 'p': run_map, 'f1': run_f1, 'ranked': run_ranked, 'x': run_x}
+
+
+def main(argv=None):
+    '''
+    DESCRIPTION: Entry point of the codiesp-eval command.
+
+    INPUT:
+        argv: list
+            command line arguments (default: sys.argv[1:]).
+
+    OUTPUT:
+        status: int
+            exit status.
+    '''
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if (len(argv) > 0) and (argv[0] in TOOLS):
+        return importlib.import_module(TOOLS[argv[0]]).main(argv[1:]) or 0
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'tol', 0) < 0:
+        parser.error('--tol needs a number >= 0')
+    tol_sweep = getattr(args, 'tol_sweep', None)
+    if (tol_sweep is not None) and not (0 <= tol_sweep[0] <= tol_sweep[1]):
+        parser.error('--tol_sweep needs 0 <= MIN <= MAX')
+    if getattr(args, 'strict', False) and (args.state_path is not None):
+        parser.error('--strict can not be used with --state_path')
+    if getattr(args, 'workers', 1) != 1:
+        if args.workers < 0:
+            parser.error('--workers needs a number >= 0')
+        if (args.state_path is not None) | (args.levels is not None) | (tol_sweep is not None):
+            parser.error('--workers can not be used with --state_path, --levels or --tol_sweep')
+    if getattr(args, 'output', None) is not None:
+        from .output import check_parquet_engine, output_format
+        try:
+            if output_format(args.output, args.output_format) == 'parquet':
+                check_parquet_engine()
+        except (ImportError, ValueError) as e:
+            parser.error(str(e))
+    if (getattr(args, 'per_code', None) is not None) | (getattr(args, 'errors', None) is not None):
+        if ((args.state_path is not None) | (args.levels is not None) |
+                (getattr(args, 'tol_sweep', None) is not None) |
+                (getattr(args, 'workers', 1) != 1)):
+            parser.error('--per_code and --errors can not be used with --state_path, ' +
+                         '--levels, --tol_sweep or --workers')
+        from .output import check_parquet_engine, output_format
+        try:
+            for path in (args.per_code, args.errors):
+                if (path is not None) and (output_format(path, analysis_format(path)) ==
+                                           'parquet'):
+                    check_parquet_engine()
+        except (ImportError, ValueError) as e:
+            parser.error(str(e))
+    if getattr(args, 'levels', None) is not None:
+        from .hierarchy import parse_level
+        try:
+            for level in args.levels:
+                parse_level(level)
+        except ValueError as e:
+            parser.error(str(e))
+    if getattr(args, 'result_cache', None) is not None:
+        if args.result_cache_size < 1:
+            parser.error('--result_cache_size needs a number >= 1')
+        if ((getattr(args, 'state_path', None) is not None) |
+                (getattr(args, 'levels', None) is not None) |
+                (getattr(args, 'tol_sweep', None) is not None) |
+                (getattr(args, 'per_code', None) is not None) |
+                (getattr(args, 'errors', None) is not None) |
+                getattr(args, 'cross_check', False)):
+            parser.error('--result_cache can not be used with --state_path, --levels, ' +
+                         '--tol_sweep, --per_code, --errors or --cross_check')
+    warnings.formatwarning = warning_on_one_line
+    if args.profile is None:
+        COMMANDS[args.command](args)
+        return 0
+
+    from .profiling import Profiler, write_report
+    profiler = Profiler(cprofile=args.profile_cprofile,
+                        trace_memory=args.profile_tracemalloc)
+    profiler.start()
+    try:
+        COMMANDS[args.command](args)
+    finally:
+        profiler.stop()
+        write_report(profiler.report(command=args.command, argv=argv), args.profile)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Loader of the lists of valid codes with a persistent on-disk cache.
+
+The first column of a codes TSV is parsed once, lowercased and compiled into
+a small index file in the cache directory ($CODIESP_CACHE_DIR, by default
+~/.cache/codiesp-eval). Later loads read the index directly. The index is
+keyed by the path, size, modification time and SHA-256 of the source TSV,
+and it is recompiled automatically when the source changes.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+
+import pandas as pd
+
+CACHE_VERSION = 1
+
+
+def default_cache_dir():
+    '''
+    DESCRIPTION: Directory where compiled indexes are stored.
+    '''
+    return os.environ.get('CODIESP_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'codiesp-eval'))
+
+
+def file_sha256(filepath, block_size=1 << 20):
+    '''
+    DESCRIPTION: SHA-256 hex digest of a file content.
+    '''
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(filepath):
+    '''
+    DESCRIPTION: Absolute path, size and modification time of a file.
+    '''
+    st = os.stat(filepath)
+    return {'path': os.path.abspath(filepath), 'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns}
+
+
+def parse_valid_codes(codes_path):
+    '''
+    DESCRIPTION: Parse list of valid codes (first column of the TSV).
+
+    INPUT:
+        codes_path: str
+            route to TSV file with valid codes.
+
+    OUTPUT:
+        valid_codes: set
+            set of lowercased valid codes.
+    '''
+    codes = pd.read_csv(codes_path, sep='\t', header=None, usecols=[0],
+                        dtype=str, keep_default_na=False)[0]
+    return set(codes.str.lower().tolist())
+
+
+def _index_path(codes_path, cache_dir):
+    key = hashlib.sha1(os.path.abspath(codes_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, key + '.codes')
+
+
+def _read_index(index_path):
+    '''
+    DESCRIPTION: Read header and codes of a compiled index, or (None, None)
+    if it does not exist or cannot be read.
+    '''
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            body = f.read()
+    except (OSError, ValueError):
+        return None, None
+    if header.get('version') != CACHE_VERSION:
+        return None, None
+    return header, body
+
+
+def _write_index(index_path, header, codes):
+    '''
+    DESCRIPTION: Atomically write a compiled index (header line + one code
+    per line), so that concurrent readers never see a partial file.
+    '''
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header) + '\n')
+            f.write('\n'.join(sorted(codes)))
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_valid_codes(codes_path, cache_dir=None):
+    '''
+    DESCRIPTION: Load list of valid codes, using the compiled index when it
+    is up to date.
+
+    The index is reused without rehashing when path, size and modification
+    time match. Otherwise the source is hashed: if the content did not
+    change only the header is refreshed, if it did the TSV is parsed again.
+
+    INPUT:
+        codes_path: str
+            route to TSV file with valid codes.
+        cache_dir: str
+            directory of compiled indexes. If None, default_cache_dir().
+
+    OUTPUT:
+        valid_codes: set
+            set of lowercased valid codes.
+    '''
+    cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+    index_path = _index_path(codes_path, cache_dir)
+    fingerprint = file_fingerprint(codes_path)
+
+    header, body = _read_index(index_path)
+    if header is not None:
+        if all(header.get(k) == v for k, v in fingerprint.items()):
+            return set(body.split('\n')) if body else set()
+        content_hash = file_sha256(codes_path)
+        if header.get('sha256') == content_hash:
+            codes = set(body.split('\n')) if body else set()
+            _try_write_index(index_path, dict(header, **fingerprint), codes)
+            return codes
+    else:
+        content_hash = file_sha256(codes_path)
+
+    codes = parse_valid_codes(codes_path)
+    header = dict(fingerprint, sha256=content_hash, version=CACHE_VERSION)
+    _try_write_index(index_path, header, codes)
+    return codes
+
+
+def _try_write_index(index_path, header, codes):
+    try:
+        _write_index(index_path, header, codes)
+    except OSError as e:
+        warnings.warn('Valid codes cache could not be written ({})'.format(e))
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dictionary encoding of clinical cases and codes.
+
+Clinical case names and codes are mapped once to int32 ids and every
+(clinical_case, code) pair is packed in a single int64 key (case id in the
+high 32 bits, code id in the low 32 bits). Deduplication, joins and
+per-case counts then work on integer arrays instead of object-string
+columns.
+
+The code vocabulary is the list of valid codes (sorted), followed by the
+Gold Standard codes that are not in it. Case ids follow the order of first
+appearance in the Gold Standard, followed by the clinical cases that only
+appear in the predictions, in the order they are read.
+"""
+
+import numpy as np
+import pandas as pd
+
+from . import profiling
+from .metrics import Counts
+
+_CODE_MASK = 0xFFFFFFFF
+
+
+class Encoding:
+    '''
+    DESCRIPTION: Vocabularies of clinical cases and codes of an evaluation.
+
+    INPUT:
+        valid_codes: set
+            set of valid codes of the subtask. If None, the code vocabulary
+            starts with the Gold Standard codes and grows with the codes
+            of the predictions.
+        gs_cases: pandas series
+            clinical case of every Gold Standard row.
+        gs_codes: pandas series
+            code of every Gold Standard row.
+    '''
+
+    def __init__(self, valid_codes, gs_cases, gs_codes):
+        codes = pd.Index(sorted(valid_codes) if valid_codes is not None else [],
+                         dtype=object)
+        extra = pd.unique(gs_codes[~gs_codes.isin(codes)])
+        self.codes = codes.append(pd.Index(extra, dtype=object))
+        self.cases = pd.Index(pd.unique(gs_cases))
+        self.n_gs_cases = len(self.cases)
+
+    @property
+    def has_missing(self):
+        '''
+        DESCRIPTION: Whether a clinical case or code is missing (NaN). The
+        string implementations define how those rows are counted.
+        '''
+        return self.cases.hasnans | self.codes.hasnans
+
+    def encode_codes(self, values):
+        '''
+        DESCRIPTION: Ids of codes. Codes seen for the first time are added
+        to the vocabulary.
+        '''
+        self.codes, ids = _lookup(self.codes, values)
+        return ids
+
+    def encode_cases(self, values):
+        '''
+        DESCRIPTION: Ids of clinical cases. Cases seen for the first time are
+        added to the vocabulary.
+        '''
+        self.cases, ids = _lookup(self.cases, values)
+        return ids
+
+    def encode(self, df, case_column='clinical_case', code_column='code'):
+        '''
+        DESCRIPTION: Packed (clinical_case, code) key of every row of df.
+        '''
+        return pack(self.encode_cases(df[case_column]), self.encode_codes(df[code_column]))
+
+    def case_names(self, case_ids):
+        '''
+        DESCRIPTION: Index of clinical case names of case_ids.
+        '''
+        return self.cases.take(case_ids)
+
+    def decode(self, keys, columns=['clinical_case', 'code']):
+        '''
+        DESCRIPTION: Dataframe of the (clinical_case, code) pairs of keys.
+        '''
+        case_ids, code_ids = unpack(keys)
+        return pd.DataFrame({columns[0]: self.cases.take(case_ids),
+                             columns[1]: self.codes.take(code_ids)})
+
+    def per_case(self, case_ids, name, minimum=1):
+        '''
+        DESCRIPTION: Number of occurrences of every clinical case, as a
+        series sorted by clinical case name, like
+        df.groupby('clinical_case')[name].count().
+
+        INPUT:
+            case_ids: numpy array
+                case id of every counted row.
+            name: str
+                name of the series.
+            minimum: int
+                only clinical cases with at least this count are included.
+
+        OUTPUT:
+            counts: pandas series
+                indexed by clinical case (index name clinical_case).
+        '''
+        counts = np.bincount(case_ids, minlength=len(self.cases))
+        selected = np.flatnonzero(counts >= minimum)
+        index = self.cases.take(selected).rename('clinical_case')
+        return pd.Series(counts[selected], index=index, name=name).sort_index()
+
+
+def _lookup(vocabulary, values):
+    '''
+    DESCRIPTION: Ids of values in a vocabulary (pandas index), adding the
+    values that are not in it.
+
+    OUTPUT:
+        vocabulary: pandas index
+            the vocabulary, extended.
+        ids: numpy array
+            int32 id of every value.
+    '''
+    ids = vocabulary.get_indexer(values)
+    unknown = ids < 0
+    if unknown.any():
+        values = np.asarray(values)[unknown]
+        vocabulary = vocabulary.append(pd.Index(pd.unique(values)))
+        ids[unknown] = vocabulary.get_indexer(values)
+    return vocabulary, ids.astype(np.int32)
+
+
+def pack(case_ids, code_ids):
+    '''
+    DESCRIPTION: Pack case and code ids in int64 keys.
+    '''
+    return (case_ids.astype(np.int64) << 32) | code_ids.astype(np.int64)
+
+
+def unpack(keys):
+    '''
+    DESCRIPTION: Case and code ids of int64 keys.
+    '''
+    return (keys >> 32).astype(np.int32), (keys & _CODE_MASK).astype(np.int32)
+
+
+def key_cases(keys):
+    '''
+    DESCRIPTION: Case ids of int64 keys.
+    '''
+    return (keys >> 32).astype(np.int32)
+
+
+def isin(keys, other):
+    '''
+    DESCRIPTION: Boolean array telling which keys are in other (hash based).
+    '''
+    return pd.Index(keys).isin(other)
+
+
+class DistinctKeys:
+    '''
+    DESCRIPTION: Distinct packed keys of a file read in chunks, in order of
+    first appearance. Memory is bounded by the number of distinct pairs, not
+    by the number of rows.
+    '''
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+
+    def update(self, keys):
+        '''
+        DESCRIPTION: Register the keys of a new chunk.
+
+        OUTPUT:
+            new_keys: numpy array
+                keys of the chunk that had not been seen before, in order of
+                first appearance.
+        '''
+        with profiling.stage('distinct_pairs', keys.shape[0]) as record:
+            n_seen = self.keys.shape[0]
+            self.keys = pd.unique(np.concatenate([self.keys, keys]))
+            record['rows_out'] = self.keys.shape[0] - n_seen
+        return self.keys[n_seen:]
+
+
+def pair_counts(encoding, gs_keys, pred_keys):
+    '''
+    DESCRIPTION: True Positives, Predicted Positives and Gold Standard
+    Positives of CodiEsp-D/P, per document and in total, identical to those
+    of f1_eval.calculate_counts.
+
+    INPUT:
+        encoding: Encoding
+        gs_keys: numpy array
+            key of every Gold Standard row.
+        pred_keys: numpy array
+            key of every (valid) prediction row.
+
+    OUTPUT:
+        counts: metrics.Counts
+    '''
+    gs_keys = pd.unique(gs_keys)
+    pred_keys = pd.unique(pred_keys)
+
+    # Predicted Positives and Gold Standard Positives
+    Pred_Pos_per_cc = encoding.per_case(key_cases(pred_keys), 'code')
+    GS_Pos_per_cc = encoding.per_case(key_cases(gs_keys), 'code')
+
+    # True Positives: GS pairs that are also predicted
+    TP_per_cc = (encoding.per_case(key_cases(gs_keys[isin(gs_keys, pred_keys)]), 'code')
+                 .reindex(GS_Pos_per_cc.index, fill_value=0)
+                 .astype(float))
+    TP = sum(TP_per_cc.values)
+
+    return Counts(TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc, TP,
+                  pred_keys.shape[0], gs_keys.shape[0])
+
+
+def span_counts(encoding, gs_keys, is_valid, pred_keys):
+    '''
+    DESCRIPTION: True Positives, Predicted Positives and Gold Standard
+    Positives of CodiEsp-X, per document and in total, identical to those
+    of x_eval.calculate_counts (clinical cases predicted without True
+    Positives are missing from TP_per_cc and clinical cases that are not in
+    the GS are missing from Pred_Pos_per_cc).
+
+    INPUT:
+        encoding: Encoding
+        gs_keys: numpy array
+            key of every Gold Standard reference.
+        is_valid: numpy array
+            whether every Gold Standard reference is matched.
+        pred_keys: numpy array
+            key of every (valid) prediction row.
+
+    OUTPUT:
+        counts: metrics.Counts
+    '''
+    pred_keys = pd.unique(pred_keys)
+    pred_cases = key_cases(pred_keys)
+    Pred_Pos_per_cc = encoding.per_case(pred_cases[pred_cases < encoding.n_gs_cases], 'code')
+
+    gs_pairs = pd.unique(gs_keys)
+    GS_Pos_per_cc = encoding.per_case(key_cases(gs_pairs), 'code')
+
+    # A code is correctly predicted when one of its references is
+    tp_pairs = pd.unique(gs_keys[is_valid])
+    TP_per_cc = encoding.per_case(key_cases(tp_pairs), 'is_valid')
+
+    # Clinical cases of the GS that are not predicted, in GS order
+    predicted = np.zeros(len(encoding.cases), dtype=bool)
+    predicted[pred_cases] = True
+    not_predicted = np.flatnonzero(~predicted[:encoding.n_gs_cases])
+    if not_predicted.shape[0] > 0:
+        TP_per_cc = pd.concat([TP_per_cc, pd.Series(
+            0, index=encoding.case_names(not_predicted).rename('clinical_case'),
+            name='is_valid')])
+
+    return Counts(TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc, tp_pairs.shape[0],
+                  pred_keys.shape[0], gs_pairs.shape[0])
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-code error analysis of a run.
+
+The (clinical_case, code) pairs of the Gold Standard, of the predictions
+and of the True Positives are the packed integer keys of the evaluation
+(see encoding), so the counts of every code are one bincount of the code
+ids of each set of keys, whatever the number of distinct codes:
+
+    TP   True Positive pairs of the code
+    FP   predicted pairs of the code that are not True Positives
+    FN   Gold Standard pairs of the code that are not True Positives
+
+The sums over codes are the micro-average counts of the run. Per code,
+P = TP / (TP + FP) and R = TP / (TP + FN) are missing (NaN) when the code
+is not predicted or not in the Gold Standard, and F1 = 2 TP / (2 TP + FP +
+FN) is defined for every code, so codes that are only predicted count as
+an F-score of 0. Macro-averages are the means over codes of the defined
+values, for all the codes and for every code type (DIAGNOSTICO and
+PROCEDIMIENTO in CodiEsp-X).
+
+The errors table lists the False Positives and False Negatives of every
+clinical case: (clinical_case, code) pairs in CodiEsp-D/P, and the
+prediction and reference spans of those pairs in CodiEsp-X.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .encoding import isin, unpack
+
+# Per-code table, macro-averages and False Positives / False Negatives of a
+# run
+ErrorAnalysis = namedtuple('ErrorAnalysis', ['codes', 'macro', 'errors'])
+
+
+def code_table(encoding, gs_pairs, pred_pairs, tp_pairs, code_types=None):
+    '''
+    DESCRIPTION: True Positives, False Positives, False Negatives,
+    Precision, Recall and F-score of every code.
+
+    INPUT:
+        encoding: encoding.Encoding
+            that packed the keys.
+        gs_pairs: numpy array
+            distinct keys of the Gold Standard.
+        pred_pairs: numpy array
+            distinct keys of the predictions.
+        tp_pairs: numpy array
+            distinct keys of the True Positives.
+        code_types: dict
+            type name -> set of codes (see code_type_names), or None.
+
+    OUTPUT:
+        codes: pandas dataframe
+            one row per code of the GS or the predictions, sorted by code,
+            with columns [code, (type,) TP, FP, FN, P, R, F1].
+    '''
+    n_codes = len(encoding.codes)
+    TP = np.bincount(unpack(tp_pairs)[1], minlength=n_codes)
+    GS_Pos = np.bincount(unpack(gs_pairs)[1], minlength=n_codes)
+    Pred_Pos = np.bincount(unpack(pred_pairs)[1], minlength=n_codes)
+    ids = np.flatnonzero((GS_Pos + Pred_Pos) > 0)
+    TP, GS_Pos, Pred_Pos = TP[ids], GS_Pos[ids], Pred_Pos[ids]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = pd.DataFrame({'code': encoding.codes.take(ids),
+                              'TP': TP, 'FP': Pred_Pos - TP, 'FN': GS_Pos - TP,
+                              'P': np.where(Pred_Pos > 0, TP / Pred_Pos, np.nan),
+                              'R': np.where(GS_Pos > 0, TP / GS_Pos, np.nan),
+                              'F1': 2 * TP / (Pred_Pos + GS_Pos)})
+    if code_types is not None:
+        table.insert(1, 'type', code_type_names(table['code'], code_types))
+    return table.sort_values('code', kind='mergesort').reset_index(drop=True)
+
+
+def code_type_names(codes, code_types):
+    '''
+    DESCRIPTION: Type of every code (the first type whose set has it, None
+    if no set has it).
+    '''
+    names = np.full(len(codes), None, dtype=object)
+    for name, type_codes in reversed(list(code_types.items())):
+        names[pd.Index(codes).isin(type_codes)] = name
+    return names
+
+
+def macro_averages(codes):
+    '''
+    DESCRIPTION: Macro-average Precision, Recall and F-score over all the
+    codes and over the codes of every type.
+
+    INPUT:
+        codes: pandas dataframe
+            as output by code_table.
+
+    OUTPUT:
+        macro: pandas dataframe
+            one row per group (all, then every type), with columns
+            [group, codes, P, R, F1].
+    '''
+    metrics = ['P', 'R', 'F1']
+    macro = pd.DataFrame([[codes.shape[0]] + codes[metrics].mean().tolist()],
+                         index=pd.Index(['all'], name='group'), columns=['codes'] + metrics)
+    if 'type' in codes.columns:
+        per_type = codes.groupby('type')[metrics].mean()
+        per_type.insert(0, 'codes', codes.groupby('type').size())
+        macro = pd.concat([macro, per_type.rename_axis('group')])
+    return macro.reset_index()
+
+
+def analyse_pairs(encoding, gs_keys, pred_keys, code_types=None):
+    '''
+    DESCRIPTION: Error analysis of a CodiEsp-D/P run.
+
+    INPUT:
+        encoding: encoding.Encoding
+        gs_keys: numpy array
+            key of every Gold Standard row.
+        pred_keys: numpy array
+            key of every (valid) prediction row.
+        code_types: dict
+            type name -> set of codes, or None.
+
+    OUTPUT:
+        analysis: ErrorAnalysis
+            errors has columns [clinical_case, error, code], with error FP
+            or FN.
+    '''
+    gs_pairs = pd.unique(gs_keys)
+    pred_pairs = pd.unique(pred_keys)
+    tp_pairs = gs_pairs[isin(gs_pairs, pred_pairs)]
+    codes = code_table(encoding, gs_pairs, pred_pairs, tp_pairs, code_types)
+
+    fp = pred_pairs[~isin(pred_pairs, tp_pairs)]
+    fn = gs_pairs[~isin(gs_pairs, tp_pairs)]
+    errors = pd.concat([encoding.decode(fp).assign(error='FP'),
+                        encoding.decode(fn).assign(error='FN')], ignore_index=True)
+    errors = (errors[['clinical_case', 'error', 'code']]
+              .sort_values(['clinical_case', 'error', 'code'], kind='mergesort')
+              .reset_index(drop=True))
+    return ErrorAnalysis(codes, macro_averages(codes), errors)
+
+
+def analyse_spans(encoding, gs_keys, is_valid, df_gs, pred_keys, pred_start, pred_end,
+                  code_types=None):
+    '''
+    DESCRIPTION: Error analysis of a CodiEsp-X run. A code is a True
+    Positive in a clinical case when one of its references is matched; the
+    spans of the other predicted pairs are False Positives and the
+    references of the other GS pairs are False Negatives.
+
+    INPUT:
+        encoding: encoding.Encoding
+        gs_keys: numpy array
+            key of every Gold Standard reference.
+        is_valid: numpy array
+            whether every Gold Standard reference is matched.
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by
+            x_eval.read_gs.
+        pred_keys: numpy array
+            key of every (valid) prediction row.
+        pred_start, pred_end: numpy array
+            offsets of every (valid) prediction row.
+        code_types: dict
+            type name -> set of codes, or None.
+
+    OUTPUT:
+        analysis: ErrorAnalysis
+            errors has columns [clinical_case, error, code, start, end,
+            reference], with error FP or FN (reference is the text of the
+            GS references, missing for FP).
+    '''
+    gs_pairs = pd.unique(gs_keys)
+    pred_pairs = pd.unique(pred_keys)
+    tp_pairs = pd.unique(gs_keys[is_valid])
+    codes = code_table(encoding, gs_pairs, pred_pairs, tp_pairs, code_types)
+
+    fp = np.flatnonzero(~isin(pred_keys, tp_pairs))
+    fn = np.flatnonzero(~isin(gs_keys, tp_pairs))
+    errors = pd.concat([
+        encoding.decode(pred_keys[fp]).assign(error='FP', start=pred_start[fp],
+                                               end=pred_end[fp], reference=np.nan),
+        encoding.decode(gs_keys[fn]).assign(
+            error='FN', start=df_gs['start_pos_gs'].to_numpy()[fn],
+            end=df_gs['end_pos_gs'].to_numpy()[fn], reference=df_gs['ref'].to_numpy()[fn])],
+        ignore_index=True)
+    errors = (errors[['clinical_case', 'error', 'code', 'start', 'end', 'reference']]
+              .sort_values(['clinical_case', 'start', 'end', 'error'], kind='mergesort')
+              .reset_index(drop=True))
+    return ErrorAnalysis(codes, macro_averages(codes), errors)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory evaluation API.
+
+An Evaluator binds the Gold Standard and the valid codes of a subtask and
+encodes them once (see encoding.Encoding). Predictions are then scored
+straight from memory, without writing them to a TSV file and parsing it
+back. They can be given as:
+
+    pandas dataframe   with columns clinical_case and code, and for
+                       CodiEsp-X start_pos_pred and end_pos_pred (as output
+                       by f1_eval.read_run and x_eval.read_run; other
+                       columns are ignored)
+    numpy arrays       a tuple (clinical_case, code) or, for CodiEsp-X,
+                       (clinical_case, code, start, end)
+    iterator           of tuples (clinical_case, code[, start, end])
+
+Codes are lowercased and filtered against the valid codes as the file
+readers do. Only the distinct codes of the predictions are lowercased, and
+one lookup in the code vocabulary (the valid codes come first, see
+encoding) gives both the id of every code and whether it is valid, so the
+prediction columns are never copied into a filtered table. Every call works
+on its own copy of the vocabularies: an Evaluator can be called any number
+of times, also from several threads, and the scores are those of the
+evaluation of the same predictions written to a file.
+
+    evaluator = Evaluator('d', 'gold/toy_data/gs_D.tsv', 'codiesp_codes/codiesp-D_codes.tsv')
+    for epoch in range(n_epochs):
+        ...
+        evaluator.evaluate(df_pred)  # Scores(P=..., R=..., F1=..., MAP=...)
+"""
+
+import copy
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from . import f1_eval, profiling
+from .codes_cache import load_valid_codes
+from .encoding import Encoding, pack, pair_counts
+from .gold_cache import load_gs
+from .map_eval import map_from_keys
+from .metrics import compute_metrics
+from .span_matching import int32_offsets, match_groups, pred_groups
+from .streaming import warn_predictions
+from .x_eval import count_encoded, encode_gs, matched_references
+
+# Micro-average Precision, Recall and F-score and MAP (None for CodiEsp-X)
+# of a run, as Python floats
+Scores = namedtuple('Scores', ['P', 'R', 'F1', 'MAP'])
+
+# Prediction columns of every subtask
+PREDICTION_COLUMNS = {'d': ['clinical_case', 'code'],
+                      'p': ['clinical_case', 'code'],
+                      'x': ['clinical_case', 'code', 'start_pos_pred', 'end_pos_pred']}
+
+
+class Evaluator:
+    '''
+    DESCRIPTION: Gold Standard and valid codes of a subtask, encoded once to
+    score predictions held in memory.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        gs: str or pandas dataframe
+            route to TSV file with the Gold Standard (loaded with
+            gold_cache.load_gs), or the Gold Standard as output by
+            f1_eval.read_gs (CodiEsp-D/P) or x_eval.read_gs (CodiEsp-X).
+        valid_codes: str or set
+            route to TSV file with the valid codes (loaded with
+            codes_cache.load_valid_codes), or set of lowercased valid codes.
+            CodiEsp-X takes the union of the CodiEsp-D and CodiEsp-P codes.
+        tol: int
+            error tolerance, in characters (CodiEsp-X).
+        strict: bool
+            if True, every fragment of a discontinuous reference has to be
+            matched (CodiEsp-X).
+        depth: int
+            MAP evaluation depth (CodiEsp-D/P).
+    '''
+
+    def __init__(self, task, gs, valid_codes, tol=10, strict=False, depth=1000):
+        if task not in PREDICTION_COLUMNS:
+            raise ValueError('Unknown task {!r}: use d, p or x'.format(task))
+        if isinstance(gs, (str, os.PathLike)):
+            gs = load_gs(gs, 'x' if task == 'x' else 'f1')
+        if isinstance(valid_codes, (str, os.PathLike)):
+            valid_codes = load_valid_codes(valid_codes)
+        self.task = task
+        self.df_gs = gs
+        self.valid_codes = set(valid_codes)
+        self.tol = tol
+        self.depth = depth
+
+        if task == 'x':
+            self.gs = encode_gs(gs, self.valid_codes, strict)
+            self.encoding = self.gs.encoding
+        else:
+            self.encoding = Encoding(self.valid_codes, gs['clinical_case'], gs['code'])
+            self.gs_keys = pd.unique(self.encoding.encode(gs))
+        # The code vocabulary starts with the (sorted) valid codes
+        self.n_valid = len(self.valid_codes)
+
+    def encode(self, predictions):
+        '''
+        DESCRIPTION: Encode the predictions with valid codes, in their order,
+        with a copy of the vocabularies of the Gold Standard.
+
+        INPUT:
+            predictions: pandas dataframe, tuple of arrays or iterator of
+                tuples (see the module docstring).
+
+        OUTPUT:
+            encoding: encoding.Encoding
+                the vocabularies of the Gold Standard, extended with the
+                clinical cases of the predictions.
+            keys: numpy array
+                key of every prediction row with a valid code.
+            spans: tuple
+                start and end offsets of those rows (CodiEsp-X), or None.
+        '''
+        columns = prediction_arrays(predictions, PREDICTION_COLUMNS[self.task])
+        with profiling.stage('filter_valid_codes', columns[0].shape[0]) as record:
+            code_ids, uniques = pd.factorize(columns[1])
+            lowercased = pd.Series(uniques, dtype=object).str.lower()
+            # Missing codes (factorized as -1) take the last id, -1
+            unique_ids = np.append(self.encoding.codes.get_indexer(lowercased), -1)
+            code_ids = unique_ids[code_ids]
+            valid = np.flatnonzero((code_ids >= 0) & (code_ids < self.n_valid))
+            record['rows_out'] = valid.shape[0]
+        warn_predictions(columns[0].shape[0], valid.shape[0])
+
+        encoding = copy.copy(self.encoding)
+        keys = pack(encoding.encode_cases(columns[0][valid]), code_ids[valid])
+        spans = None
+        if self.task == 'x':
+            spans = tuple(int32_offsets(column[valid]) for column in columns[2:])
+        return encoding, keys, spans
+
+    def counts(self, predictions, tol=None):
+        '''
+        DESCRIPTION: Count True Positives, Predicted Positives and Gold
+        Standard Positives of predictions held in memory.
+
+        INPUT:
+            predictions: pandas dataframe, tuple of arrays or iterator of
+                tuples (see the module docstring).
+            tol: int
+                error tolerance (CodiEsp-X). If None, the one of the
+                evaluator.
+
+        OUTPUT:
+            counts: metrics.Counts
+        '''
+        return self._counts(*self.encode(predictions), tol)
+
+    def evaluate(self, predictions, tol=None):
+        '''
+        DESCRIPTION: Score predictions held in memory.
+
+        INPUT:
+            predictions: pandas dataframe, tuple of arrays or iterator of
+                tuples (see the module docstring).
+            tol: int
+                error tolerance (CodiEsp-X). If None, the one of the
+                evaluator.
+
+        OUTPUT:
+            scores: Scores
+                micro-average Precision, Recall and F-score, and MAP for
+                CodiEsp-D/P. Without valid predictions, Precision and
+                F-score are NaN (with a warning), as in the evaluation of a
+                file.
+        '''
+        encoding, keys, spans = self.encode(predictions)
+        counts = self._counts(encoding, keys, spans, tol)
+        _, P, _, R, _, F1 = compute_metrics(counts)
+        MAP = None
+        if self.task != 'x':
+            with profiling.stage('calculate_map', keys.shape[0]):
+                MAP = map_from_keys(encoding, self.gs_keys, keys, self.depth)
+        return Scores(float(P), float(R), float(F1), MAP)
+
+    def _counts(self, encoding, keys, spans, tol):
+        with profiling.stage('calculate_counts', keys.shape[0]):
+            if self.task != 'x':
+                if encoding.has_missing:
+                    return f1_eval.calculate_counts(self.df_gs,
+                                                    encoding.decode(pd.unique(keys)))
+                return pair_counts(encoding, self.gs_keys, keys)
+
+            gs = self.gs._replace(encoding=encoding)
+            rows, group = pred_groups(gs.groups, keys)
+            is_valid = match_groups(gs.group, gs.start, gs.end, group, spans[0][rows],
+                                    spans[1][rows], self.tol if tol is None else tol)
+            return count_encoded(self.df_gs, gs, matched_references(gs, is_valid), keys)
+
+
+def prediction_arrays(predictions, columns):
+    '''
+    DESCRIPTION: Columns of predictions held in memory, as numpy arrays
+    (views of the dataframe or arrays when possible).
+
+    INPUT:
+        predictions: pandas dataframe, tuple of arrays or iterator of tuples
+            (see the module docstring).
+        columns: list
+            names of the columns, in order.
+
+    OUTPUT:
+        arrays: list
+            one numpy array per column, all of the same length.
+    '''
+    if isinstance(predictions, pd.DataFrame):
+        missing = [c for c in columns if c not in predictions.columns]
+        if missing:
+            raise ValueError('The predictions do not have the columns {}'.format(missing))
+        return [predictions[c].to_numpy() for c in columns]
+
+    if isinstance(predictions, tuple) and all(
+            isinstance(c, (np.ndarray, pd.Series, pd.Index, list)) for c in predictions):
+        if len(predictions) != len(columns):
+            raise ValueError('The predictions do not have {} columns'.format(len(columns)))
+        arrays = [np.asarray(c) for c in predictions]
+        if len(set(a.shape[0] for a in arrays)) > 1:
+            raise ValueError('The columns of the predictions do not have the same length')
+        return arrays
+
+    rows = list(predictions)
+    if any(len(row) != len(columns) for row in rows):
+        raise ValueError('The predictions do not have {} columns'.format(len(columns)))
+    arrays = [np.empty(len(rows), dtype=object) for _ in columns]
+    for i, values in enumerate(zip(*rows)):
+        arrays[i][:] = values
+    return arrays
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue May 12 09:45:01 2020
+
+@author: antonio
+"""
+import pandas as pd
+from . import profiling
+from .error_analysis import analyse_pairs
+from .encoding import DistinctKeys, Encoding, pair_counts
+from .hierarchy import DEFAULT_LEVELS, PrefixIndex, parse_level
+from .metrics import Counts, compute_metrics
+from .streaming import DEFAULT_CHUNKSIZE, read_predictions
+
+def read_gs(gs_path):
+    gs_data = pd.read_csv(gs_path, sep="\t", names=['clinical_case', 'code'],
+                          dtype={'clinical_case': object, 'code':object})
+    gs_data.code = gs_data.code.str.lower()
+    return gs_data
+
+def read_run(pred_path, valid_codes, chunksize=DEFAULT_CHUNKSIZE):
+    '''
+    DESCRIPTION: Load Predictions table. The file is read once, in chunks.
+    '''
+    return pd.concat(list(read_predictions(pred_path, ['clinical_case', 'code'],
+                                           valid_codes, chunksize=chunksize,
+                                           check_types=False,
+                                           dtype={'clinical_case': object})),
+                     ignore_index=True)
+
+def count_run(df_gs, pred_path, valid_codes, chunksize=DEFAULT_CHUNKSIZE):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives of a predictions file, reading it in chunks. Only the distinct
+    (clinical_case, code) pairs of the predictions are kept in memory, as
+    packed integer keys (see encoding.Encoding).
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        chunksize: int
+            number of rows read at once.
+    
+    OUTPUT: 
+        counts: metrics.Counts
+    '''
+    encoding, pred_keys = read_keys(df_gs, pred_path, valid_codes, chunksize)
+    with profiling.stage('calculate_counts', pred_keys.shape[0]):
+        if encoding.has_missing:
+            return _calculate_counts_frames(df_gs, encoding.decode(pred_keys))
+        return pair_counts(encoding, encoding.encode(df_gs), pred_keys)
+
+def count_run_levels(df_gs, pred_path, valid_codes, levels=DEFAULT_LEVELS,
+                     chunksize=DEFAULT_CHUNKSIZE):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives of a predictions file at several granularity levels (see
+    hierarchy), reading it once. Codes are replaced by their prefix at 
+    every level, so a prediction is correct at the category level when its
+    category is a category of the GS codes of the clinical case.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        levels: list
+            granularity levels, as taken by hierarchy.parse_level.
+        chunksize: int
+            number of rows read at once.
+    
+    OUTPUT: 
+        counts: dict
+            level name -> metrics.Counts, in the order of levels.
+    '''
+    names, lengths = zip(*map(parse_level, levels))
+    encoding, pred_keys = read_keys(df_gs, pred_path, valid_codes, chunksize)
+    gs_keys = encoding.encode(df_gs)
+    index = PrefixIndex(lengths)
+    counts = {}
+    with profiling.stage('calculate_counts', pred_keys.shape[0] * len(names)):
+        for level, name in enumerate(names):
+            level_gs = index.map_keys(encoding, gs_keys, level)
+            level_pred = index.map_keys(encoding, pred_keys, level)
+            if encoding.has_missing:
+                counts[name] = _calculate_counts_frames(index.decode(encoding, level_gs, level),
+                                                        index.decode(encoding, level_pred, level))
+            else:
+                counts[name] = pair_counts(encoding, level_gs, level_pred)
+    return counts
+
+def analyse_run(df_gs, pred_path, valid_codes, chunksize=DEFAULT_CHUNKSIZE, code_types=None):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives of a predictions file, as count_run, and analyse its errors
+    per code (see error_analysis) from the same keys.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        chunksize: int
+            number of rows read at once.
+        code_types: dict
+            type name -> set of codes, or None.
+    
+    OUTPUT: 
+        counts: metrics.Counts
+        analysis: error_analysis.ErrorAnalysis
+    '''
+    encoding, pred_keys = read_keys(df_gs, pred_path, valid_codes, chunksize)
+    gs_keys = encoding.encode(df_gs)
+    with profiling.stage('calculate_counts', pred_keys.shape[0]):
+        if encoding.has_missing:
+            counts = _calculate_counts_frames(df_gs, encoding.decode(pred_keys))
+        else:
+            counts = pair_counts(encoding, gs_keys, pred_keys)
+    with profiling.stage('error_analysis', pred_keys.shape[0]):
+        analysis = analyse_pairs(encoding, gs_keys, pred_keys, code_types)
+    return counts, analysis
+
+def read_keys(df_gs, pred_path, valid_codes, chunksize=DEFAULT_CHUNKSIZE):
+    '''
+    DESCRIPTION: Read a predictions file in chunks and keep the distinct
+    (clinical_case, code) pairs as packed integer keys.
+    
+    OUTPUT: 
+        encoding: encoding.Encoding
+            of the GS clinical cases and the valid codes.
+        pred_keys: numpy array
+            distinct keys of the predictions, in order of first appearance.
+    '''
+    encoding = Encoding(valid_codes, df_gs['clinical_case'], df_gs['code'])
+    pairs = DistinctKeys()
+    for chunk in read_predictions(pred_path, ['clinical_case', 'code'], valid_codes,
+                                  chunksize=chunksize, check_types=False,
+                                  dtype={'clinical_case': object}):
+        pairs.update(encoding.encode(chunk))
+    return encoding, pairs.keys
+
+def calculate_counts(df_gs, df_pred):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives, per document and in total. Codes predicted several times in 
+    the same clinical case are counted once.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        df_pred: pandas dataframe
+            with the predictions. Columns are those output by the function read_run.
+    
+    OUTPUT: 
+        counts: metrics.Counts
+    '''
+    encoding = Encoding(None, df_gs['clinical_case'], df_gs['code'])
+    pred_keys = encoding.encode(df_pred)
+    if encoding.has_missing:
+        return _calculate_counts_frames(df_gs, df_pred)
+    return pair_counts(encoding, encoding.encode(df_gs), pred_keys)
+
+def _calculate_counts_frames(df_gs, df_pred):
+    '''
+    DESCRIPTION: calculate_counts on the string columns. Used when a
+    clinical case or code is missing, as groupby and merge define how those
+    rows are counted.
+    '''
+    # Predicted Positives:
+    df_pred = df_pred.drop_duplicates(subset=['clinical_case', "code"])
+    Pred_Pos_per_cc = df_pred.groupby("clinical_case")["code"].count()
+    Pred_Pos = df_pred.shape[0]
+    
+    # Gold Standard Positives:
+    df_gs = df_gs.drop_duplicates(subset=['clinical_case', "code"])
+    GS_Pos_per_cc = df_gs.groupby("clinical_case")["code"].count()
+    GS_Pos = df_gs.shape[0]
+    
+    # True Positives: intersect the deduplicated (clinical_case, code) pairs
+    # in one join instead of comparing the code sets of every clinical case
+    TP_per_cc = (df_gs.merge(df_pred[['clinical_case', 'code']], how='inner',
+                             on=['clinical_case', 'code'])
+                 .groupby("clinical_case")["code"].count()
+                 .reindex(GS_Pos_per_cc.index, fill_value=0)
+                 .astype(float))
+        
+    TP = sum(TP_per_cc.values)
+    
+    return Counts(TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc, TP, Pred_Pos, GS_Pos)
+
+def calculate_metrics(df_gs, df_pred):
+    '''
+    DESCRIPTION: Calculate Precision, Recall and F-score, per document and
+    micro-averaged. Codes predicted several times in the same clinical case
+    are counted once.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        df_pred: pandas dataframe
+            with the predictions. Columns are those output by the function read_run.
+    
+    OUTPUT: 
+        P_per_cc, P, R_per_cc, R, F1_per_cc, F1
+    '''
+    return compute_metrics(calculate_counts(df_gs, df_pred))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Loader of the Gold Standards with a persistent, memory-mapped cache.
+
+The Gold Standard files never change, but every evaluation used to read
+them, lowercase the codes, split the offsets and deduplicate them again. The
+table returned by a reader (f1_eval.read_gs, map_eval.format_gs or
+x_eval.read_gs) is now compiled once into a directory of .npy columns in
+the cache directory ($CODIESP_CACHE_DIR, by default ~/.cache/codiesp-eval):
+
+    numeric columns   one .npy file, memory-mapped when loaded
+    string columns    ids in a .npy file (-1: missing) and the vocabulary of
+                      distinct values in a JSON file, loaded as a pandas
+                      Categorical whose codes are the memory-mapped ids
+
+Compiled directories are named after the SHA-256 of the source, the reader
+and the version of the reader, so identical copies of a Gold Standard share
+them, and they are written atomically. As with the valid codes (see codes_cache), a small
+header keyed by the path of the source remembers its size, modification time
+and hash, so later loads do not hash the file again. Concurrent evaluator
+processes map the same files and share their pages.
+
+    codiesp-eval compile -t x gold/codiesp-X/*.tsv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from . import f1_eval, map_eval, x_eval
+from .codes_cache import default_cache_dir, file_fingerprint, file_sha256
+
+CACHE_VERSION = 2
+
+# Name of the reader -> function that parses a Gold Standard file
+READERS = {'f1': f1_eval.read_gs, 'map': map_eval.format_gs, 'x': x_eval.read_gs}
+
+# Version of every reader, part of the name of its compiled tables: bumped
+# whenever the reader returns a different table for the same file
+READER_VERSIONS = {'f1': 1, 'map': 1, 'x': 2}
+
+# Readers used by the evaluations of every task
+TASK_READERS = {'d': ['f1', 'map'], 'p': ['f1', 'map'], 'x': ['x']}
+
+
+class _Uncacheable(Exception):
+    '''
+    DESCRIPTION: The table has a column that can not be stored as .npy
+    (values other than numbers or strings).
+    '''
+
+
+def load_gs(gs_path, reader, cache_dir=None):
+    '''
+    DESCRIPTION: Load a Gold Standard, using the compiled table when it is
+    up to date.
+
+    INPUT:
+        gs_path: str
+            route to TSV file with Gold Standard.
+        reader: str
+            f1, map or x (see READERS).
+        cache_dir: str
+            directory of compiled tables. If None, default_cache_dir().
+
+    OUTPUT:
+        gs: pandas dataframe
+            as output by the reader. Numeric columns are read-only memory
+            maps of the compiled files, and string columns are categorical
+            (their codes are memory-mapped).
+    '''
+    gs, _ = _load(gs_path, reader, cache_dir)
+    return gs
+
+
+def compile_gs(gs_path, task, cache_dir=None):
+    '''
+    DESCRIPTION: Compile a Gold Standard for all the readers of a task.
+
+    INPUT:
+        gs_path: str
+            route to TSV file with Gold Standard.
+        task: str
+            'd', 'p' or 'x'.
+        cache_dir: str
+            directory of compiled tables. If None, default_cache_dir().
+
+    OUTPUT:
+        compiled: dict
+            reader -> directory of the compiled table (None if the table
+            could not be compiled).
+    '''
+    return {reader: _load(gs_path, reader, cache_dir)[1] for reader in TASK_READERS[task]}
+
+
+def _load(gs_path, reader, cache_dir):
+    cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+    header_path = _header_path(gs_path, reader, cache_dir)
+    fingerprint = file_fingerprint(gs_path)
+
+    header = _read_header(header_path)
+    if (header is not None) and all(header.get(k) == v for k, v in fingerprint.items()):
+        content_hash = header['sha256']
+    else:
+        content_hash = file_sha256(gs_path)
+    table_path = os.path.join(cache_dir, 'gs-{}-{}-{}'.format(content_hash, reader,
+                                                             READER_VERSIONS[reader]))
+
+    gs = _read_table(table_path)
+    if gs is None:
+        gs = READERS[reader](gs_path)
+        try:
+            _write_table(table_path, gs)
+        except _Uncacheable:
+            return gs, None
+        except OSError as e:
+            warnings.warn('Gold Standard cache could not be written ({})'.format(e))
+            return gs, None
+    if (header is None) or (header != dict(header, **fingerprint, sha256=content_hash)):
+        _try_write_header(header_path, dict(fingerprint, sha256=content_hash, reader=reader,
+                                            version=CACHE_VERSION))
+    return gs, table_path
+
+
+def _header_path(gs_path, reader, cache_dir):
+    key = hashlib.sha1(os.path.abspath(gs_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, '{}.{}.gs'.format(key, reader))
+
+
+def _read_header(header_path):
+    '''
+    DESCRIPTION: Header of a source file, or None if it does not exist or
+    cannot be read.
+    '''
+    try:
+        with open(header_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if header.get('version') != CACHE_VERSION:
+        return None
+    return header
+
+
+def _try_write_header(header_path, header):
+    try:
+        os.makedirs(os.path.dirname(header_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(header_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        os.replace(tmp_path, header_path)
+    except OSError as e:
+        warnings.warn('Gold Standard cache could not be written ({})'.format(e))
+
+
+def _read_table(table_path):
+    '''
+    DESCRIPTION: Load a compiled table, or None if it does not exist or
+    cannot be read.
+    '''
+    try:
+        with open(os.path.join(table_path, 'table.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != CACHE_VERSION:
+            return None
+        columns = {}
+        for i, column in enumerate(meta['columns']):
+            values = np.load(os.path.join(table_path, '{}.npy'.format(i)), mmap_mode='r')
+            if column['vocabulary'] is not None:
+                values = pd.Categorical.from_codes(values, column['vocabulary'])
+            columns[column['name']] = values
+        if meta['index'] is None:
+            index = pd.RangeIndex(meta['n_rows'])
+        else:
+            index = pd.Index(np.load(os.path.join(table_path, 'index.npy'), mmap_mode='r'))
+    except (OSError, ValueError, KeyError):
+        return None
+    return pd.DataFrame(columns, index=index, columns=[c['name'] for c in meta['columns']],
+                        copy=False)
+
+
+def _write_table(table_path, gs):
+    '''
+    DESCRIPTION: Atomically write a compiled table (the directory is built
+    under a temporary name and renamed), so that concurrent readers never
+    see a partial table.
+    '''
+    cache_dir = os.path.dirname(table_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=cache_dir, suffix='.tmp')
+    try:
+        columns = []
+        for i, name in enumerate(gs.columns):
+            values, vocabulary = _column_arrays(gs[name])
+            np.save(os.path.join(tmp_path, '{}.npy'.format(i)), values)
+            columns.append({'name': name, 'vocabulary': vocabulary})
+        index = None
+        if not gs.index.equals(pd.RangeIndex(gs.shape[0])):
+            if gs.index.dtype.kind not in 'iu':
+                raise _Uncacheable()
+            index = 'index.npy'
+            np.save(os.path.join(tmp_path, index), gs.index.to_numpy())
+        with open(os.path.join(tmp_path, 'table.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'n_rows': gs.shape[0], 'index': index,
+                       'columns': columns}, f)
+        try:
+            os.rename(tmp_path, table_path)
+        except OSError:
+            # Compiled meanwhile by another process
+            if not os.path.isdir(table_path):
+                raise
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def _column_arrays(column):
+    '''
+    DESCRIPTION: Array and vocabulary (None for numeric columns) stored for
+    a column.
+    '''
+    if column.dtype.kind in 'biuf':
+        return np.ascontiguousarray(column.to_numpy()), None
+    if column.dtype != object:
+        raise _Uncacheable()
+    ids, vocabulary = pd.factorize(column)
+    vocabulary = vocabulary.tolist()
+    if not all(isinstance(value, str) for value in vocabulary):
+        raise _Uncacheable()
+    # Ids are stored with the integer type of the codes of a Categorical of
+    # that many categories, so that loading them does not copy them
+    for dtype in (np.int8, np.int16, np.int32):
+        if len(vocabulary) < np.iinfo(dtype).max:
+            return ids.astype(dtype), vocabulary
+    return ids.astype(np.int64), vocabulary
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='codiesp-eval compile',
+        description='compile Gold Standards into the memory-mapped cache')
+    parser.add_argument("gs_paths", nargs = '+', metavar = "GS",
+                        help = "paths to GS files")
+    parser.add_argument("-t", "--task", required = True, dest = "task",
+                        choices = ['d', 'p', 'x'], help = "subtask of the GS files")
+    parser.add_argument("--cache_dir", dest = "cache_dir", default = None,
+                        help = "cache directory (default: $CODIESP_CACHE_DIR or " +
+                        "~/.cache/codiesp-eval)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    for gs_path in args.gs_paths:
+        for reader, table_path in compile_gs(gs_path, args.task, args.cache_dir).items():
+            print('{}\t{}\t{}'.format(gs_path, reader,
+                                      table_path if table_path is not None else '-'))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-granularity scoring of ICD-10 codes.
+
+A granularity level truncates every code to its first characters (the dot
+of the CIE10-Diagnosticos codes is not counted): the category is the first
+3 characters (n20), the subcategory the first 4 (n20.0 -> n200) and the
+full code is not truncated. CIE10-Procedimiento codes have one axis per
+character, so a level of N characters is the N-th axis (4 is the body
+part, the last axis of the prefixes of the codiesp-P codes list).
+
+A PrefixIndex maps the id of every code of an encoding vocabulary (see
+encoding.Encoding, which starts with the lists of valid codes) to the id of
+its prefix at every level. Packed (clinical_case, code) keys of the Gold
+Standard and of the predictions are then mapped to (clinical_case, prefix)
+keys with one array lookup per level, and all levels are scored from a
+single reading of the files.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .encoding import _lookup, pack, unpack
+
+# Named levels -> number of characters (None: full code)
+LEVEL_NAMES = {'category': 3, 'subcategory': 4, 'code': None}
+
+DEFAULT_LEVELS = ['category', 'subcategory', 'code']
+
+
+def parse_level(level):
+    '''
+    DESCRIPTION: Parse a granularity level.
+
+    INPUT:
+        level: str
+            category, subcategory, code or a positive number of characters.
+
+    OUTPUT:
+        name: str
+            name of the level.
+        length: int
+            number of characters of the prefix, or None for the full code.
+    '''
+    if level in LEVEL_NAMES:
+        return level, LEVEL_NAMES[level]
+    if not (str(level).isdigit() and int(level) > 0):
+        raise ValueError('invalid granularity level {!r}: use {} or a positive number '
+                         'of characters'.format(level, ', '.join(LEVEL_NAMES)))
+    return str(int(level)), int(level)
+
+
+def truncate_codes(codes, length):
+    '''
+    DESCRIPTION: Prefix of every code at a granularity level.
+
+    INPUT:
+        codes: pandas index or series
+            codes (missing codes stay missing).
+        length: int
+            number of characters (dots are not counted), or None.
+
+    OUTPUT:
+        prefixes: numpy array
+    '''
+    codes = pd.Series(np.asarray(codes, dtype=object), dtype=object)
+    if length is None:
+        return codes.to_numpy()
+    return codes.str.replace('.', '', regex=False).str[:length].to_numpy()
+
+
+class PrefixIndex:
+    '''
+    DESCRIPTION: Prefix id of every code of an encoding vocabulary, at
+    several granularity levels. The index follows the vocabulary as it
+    grows.
+
+    INPUT:
+        lengths: list
+            number of characters of every level (None: full code).
+    '''
+
+    def __init__(self, lengths):
+        self.lengths = list(lengths)
+        self.prefixes = [pd.Index([], dtype=object) for _ in self.lengths]
+        self.prefix_ids = [np.empty(0, dtype=np.int32) for _ in self.lengths]
+        self.n_codes = 0
+
+    def update(self, codes):
+        '''
+        DESCRIPTION: Index the codes of the vocabulary added since the last
+        update.
+
+        INPUT:
+            codes: pandas index
+                code vocabulary (Encoding.codes).
+        '''
+        if len(codes) == self.n_codes:
+            return
+        new = codes[self.n_codes:]
+        for i, length in enumerate(self.lengths):
+            if length is None:
+                ids = np.arange(self.n_codes, len(codes), dtype=np.int32)
+                self.prefixes[i] = codes
+            else:
+                self.prefixes[i], ids = _lookup(self.prefixes[i], truncate_codes(new, length))
+            self.prefix_ids[i] = np.concatenate([self.prefix_ids[i], ids])
+        self.n_codes = len(codes)
+
+    def map_keys(self, encoding, keys, level):
+        '''
+        DESCRIPTION: (clinical_case, prefix) keys of packed
+        (clinical_case, code) keys.
+
+        INPUT:
+            encoding: encoding.Encoding
+                that packed the keys.
+            keys: numpy array
+                packed keys.
+            level: int
+                position of the level in lengths.
+
+        OUTPUT:
+            keys: numpy array
+                packed keys with the prefix id in place of the code id.
+        '''
+        if self.lengths[level] is None:
+            return keys
+        self.update(encoding.codes)
+        case_ids, code_ids = unpack(keys)
+        return pack(case_ids, self.prefix_ids[level][code_ids])
+
+    def decode(self, encoding, keys, level, columns=['clinical_case', 'code']):
+        '''
+        DESCRIPTION: Dataframe of the (clinical_case, prefix) pairs of keys
+        mapped by map_keys.
+        '''
+        self.update(encoding.codes)
+        case_ids, prefix_ids = unpack(keys)
+        return pd.DataFrame({columns[0]: encoding.cases.take(case_ids),
+                             columns[1]: self.prefixes[level].take(prefix_ids)})
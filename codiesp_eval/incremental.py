@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental re-evaluation of prediction runs.
+
+The True Positives and Predicted Positives of every clinical case only depend
+on the predictions and Gold Standard of that clinical case. A state file
+keeps them, together with a content hash of the prediction rows of every
+clinical case, from the previous evaluation of a run. On the next evaluation
+only the clinical cases whose rows changed are counted again; the per-case
+and micro-averaged counts are then re-aggregated exactly as a full run does.
+
+The state also records a fingerprint of the Gold Standard, the valid codes,
+the subtask and the tolerance: when any of them changes, every clinical case
+is counted again. It is stored as JSON, and a state file that can not be
+parsed is ignored (every clinical case is counted again).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from . import f1_eval, profiling, x_eval
+from .metrics import Counts
+from .span_matching import covered_codes
+
+# Version of the state files: bumped whenever the counts of the evaluation
+# change, so that states written by a previous version are counted again
+STATE_VERSION = 3
+
+# Prediction columns that determine the counts of every subtask
+HASH_COLUMNS = {'x': ['clinical_case', 'code', 'start_pos_pred', 'end_pos_pred'],
+                'd': ['clinical_case', 'code'],
+                'p': ['clinical_case', 'code']}
+
+_HASH_FIELDS = ['hash', 'n_rows']
+
+# Columns of the per-case state
+_STATE_FIELDS = _HASH_FIELDS + ['pred_pos', 'tp']
+
+
+def evaluation_fingerprint(task, df_gs, valid_codes, tol=10):
+    '''
+    DESCRIPTION: SHA-256 of everything but the predictions that the counts
+    depend on.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        df_gs: pandas dataframe
+            with the Gold Standard.
+        valid_codes: set
+            set of valid codes of this subtask.
+        tol: int
+            error tolerance, in characters (CodiEsp-X).
+
+    OUTPUT:
+        fingerprint: str
+            hex digest.
+    '''
+    digest = hashlib.sha256()
+    digest.update('{}|{}|{}'.format(STATE_VERSION, task,
+                                    tol if task == 'x' else '').encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df_gs, index=False).to_numpy().tobytes())
+    digest.update('\n'.join(sorted(valid_codes)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def case_hashes(df_pred, columns):
+    '''
+    DESCRIPTION: Content hash of the prediction rows of every clinical case.
+
+    The hash does not depend on the order of the rows nor on repeated rows,
+    as the counts do not either.
+
+    INPUT:
+        df_pred: pandas dataframe
+            with the (valid) predictions.
+        columns: list
+            columns hashed, clinical_case among them.
+
+    OUTPUT:
+        hashes: pandas dataframe
+            indexed by clinical case, with columns hash (BLAKE2b of the
+            sorted row hashes of the clinical case, hex) and n_rows.
+    '''
+    rows = df_pred[columns].drop_duplicates()
+    rows = rows[rows['clinical_case'].notna()]
+    row_hash = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+    case_ids, cases = pd.factorize(rows['clinical_case'], sort=True)
+
+    # Sort the row hashes of every clinical case and digest them together
+    order = np.lexsort((row_hash, case_ids))
+    row_hash, case_ids = row_hash[order], case_ids[order]
+    bounds = np.searchsorted(case_ids, np.arange(len(cases) + 1))
+    digests = [hashlib.blake2b(row_hash[start:end].tobytes(), digest_size=16).hexdigest()
+               for start, end in zip(bounds[:-1], bounds[1:])]
+    return pd.DataFrame({'hash': digests, 'n_rows': np.diff(bounds)},
+                        index=pd.Index(cases, name='clinical_case'))
+
+
+def case_counts(task, df_gs, df_pred, tol=10):
+    '''
+    DESCRIPTION: True Positives and Predicted Positives of the clinical
+    cases of df_pred.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        df_gs: pandas dataframe
+            with the Gold Standard of (at least) those clinical cases.
+        df_pred: pandas dataframe
+            with the (valid) predictions.
+        tol: int
+            error tolerance, in characters (CodiEsp-X).
+
+    OUTPUT:
+        counts: pandas dataframe
+            indexed by clinical case, with columns pred_pos and tp.
+    '''
+    pairs = df_pred.drop_duplicates(subset=['clinical_case', 'code'])
+    pred_pos = pairs.groupby('clinical_case')['code'].count()
+
+    df_gs = df_gs[df_gs['clinical_case'].isin(pred_pos.index)]
+    if task == 'x':
+        df_final = covered_codes(df_gs, df_pred, tol)
+        tp = df_final[df_final['is_valid'] == True].groupby('clinical_case')['code'].count()
+    else:
+        tp = (df_gs.drop_duplicates(subset=['clinical_case', 'code'])
+              .merge(pairs[['clinical_case', 'code']], how='inner',
+                     on=['clinical_case', 'code'])
+              .groupby('clinical_case')['code'].count())
+
+    return pd.DataFrame({'pred_pos': pred_pos,
+                         'tp': tp.reindex(pred_pos.index, fill_value=0)})
+
+
+def assemble_counts(task, df_gs, cases):
+    '''
+    DESCRIPTION: Per-case and total counts of a run from the counts of its
+    clinical cases, identical to those of the calculate_counts function of
+    the subtask.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        df_gs: pandas dataframe
+            with the Gold Standard.
+        cases: pandas dataframe
+            indexed by the predicted clinical cases, with columns pred_pos
+            and tp.
+
+    OUTPUT:
+        counts: metrics.Counts
+    '''
+    gs_pairs = df_gs.drop_duplicates(subset=['clinical_case', 'code'])
+    GS_Pos_per_cc = gs_pairs.groupby('clinical_case')['code'].count()
+    GS_Pos = gs_pairs.shape[0]
+
+    cases = cases.sort_index()
+    cases.index.name = 'clinical_case'
+    Pred_Pos = int(cases['pred_pos'].sum())
+
+    if task != 'x':
+        Pred_Pos_per_cc = cases['pred_pos'].rename('code')
+        TP_per_cc = (cases['tp'].reindex(GS_Pos_per_cc.index, fill_value=0)
+                     .astype(float).rename('code'))
+        TP = sum(TP_per_cc.values)
+        return Counts(TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc, TP, Pred_Pos, GS_Pos)
+
+    # CodiEsp-X: clinical cases without True Positives are missing from
+    # TP_per_cc unless they were not predicted at all, and clinical cases
+    # that are not in the GS are missing from Pred_Pos_per_cc
+    Pred_Pos_per_cc = cases.loc[cases.index.isin(GS_Pos_per_cc.index),
+                                'pred_pos'].rename('code')
+    TP_per_cc = cases.loc[cases['tp'] > 0, 'tp'].rename('is_valid')
+    TP = int(TP_per_cc.sum())
+    cc_not_predicted = df_gs['clinical_case'].drop_duplicates()
+    for cc in cc_not_predicted[~cc_not_predicted.isin(cases.index)]:
+        TP_per_cc[cc] = 0
+
+    return Counts(TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc, TP, Pred_Pos, GS_Pos)
+
+
+def load_state(state_path, fingerprint):
+    '''
+    DESCRIPTION: Load the per-case state of a previous evaluation, or None
+    if it does not exist, can not be parsed or was computed with another
+    Gold Standard, valid codes, subtask or tolerance.
+    '''
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        if (state['version'] != STATE_VERSION) or (state['fingerprint'] != fingerprint):
+            return None
+        cases = pd.DataFrame({field: state['cases'][field] for field in _STATE_FIELDS},
+                             index=pd.Index(state['cases']['clinical_case'],
+                                            dtype=object, name='clinical_case'))
+        cases = cases.astype({'hash': object, 'n_rows': np.int64, 'pred_pos': np.int64,
+                              'tp': np.int64})
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if not cases.index.is_unique:
+        return None
+    return cases
+
+
+def save_state(state_path, fingerprint, cases):
+    '''
+    DESCRIPTION: Atomically write the per-case state of an evaluation.
+    '''
+    directory = os.path.dirname(os.path.abspath(state_path))
+    os.makedirs(directory, exist_ok=True)
+    state = {'version': STATE_VERSION, 'fingerprint': fingerprint,
+             'cases': {'clinical_case': cases.index.tolist(),
+                       'hash': cases['hash'].tolist(),
+                       'n_rows': cases['n_rows'].astype(np.int64).tolist(),
+                       'pred_pos': cases['pred_pos'].astype(np.int64).tolist(),
+                       'tp': cases['tp'].astype(np.int64).tolist()}}
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def update_counts(task, df_gs, df_pred, previous=None, tol=10):
+    '''
+    DESCRIPTION: Count the clinical cases whose predictions changed since
+    the previous evaluation and reuse the counts of the others.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        df_gs: pandas dataframe
+            with the Gold Standard.
+        df_pred: pandas dataframe
+            with the (valid) predictions.
+        previous: pandas dataframe
+            per-case state of the previous evaluation (None: count all).
+        tol: int
+            error tolerance, in characters (CodiEsp-X).
+
+    OUTPUT:
+        cases: pandas dataframe
+            new per-case state: hash fields, pred_pos and tp.
+        n_recomputed: int
+            number of clinical cases counted again.
+    '''
+    hashes = case_hashes(df_pred, HASH_COLUMNS[task])
+    if previous is None:
+        changed = np.ones(hashes.shape[0], dtype=bool)
+    else:
+        before = previous[_HASH_FIELDS].reindex(hashes.index)
+        changed = ~(before == hashes).all(axis=1).to_numpy()
+
+    changed_cases = hashes.index[changed]
+    recomputed = case_counts(task, df_gs, df_pred[df_pred['clinical_case']
+                                                  .isin(changed_cases)], tol)
+    counts = pd.concat([previous.loc[hashes.index[~changed], ['pred_pos', 'tp']]
+                        if previous is not None else None,
+                        recomputed.reindex(changed_cases)])
+    return hashes.join(counts), len(changed_cases)
+
+
+def count_run_incremental(task, df_gs, pred_path, valid_codes, state_path, tol=10):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives of a predictions file, reusing the counts of the clinical
+    cases that did not change since the last evaluation stored in
+    state_path, and update the state.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        df_gs: pandas dataframe
+            with the Gold Standard, as output by the read_gs function of the
+            subtask (f1_eval for CodiEsp-D/P).
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask.
+        state_path: str
+            route to the state file (created if it does not exist).
+        tol: int
+            error tolerance, in characters (CodiEsp-X).
+
+    OUTPUT:
+        counts: metrics.Counts
+            identical to those of a full run.
+        n_recomputed: int
+            number of clinical cases counted again.
+    '''
+    if task == 'x':
+        df_pred = x_eval.read_run(pred_path, valid_codes)
+    else:
+        df_pred = f1_eval.read_run(pred_path, valid_codes)
+
+    with profiling.stage('incremental_update', df_pred.shape[0]) as record:
+        fingerprint = evaluation_fingerprint(task, df_gs, valid_codes, tol)
+        cases, n_recomputed = update_counts(task, df_gs, df_pred,
+                                            load_state(state_path, fingerprint), tol)
+        save_state(state_path, fingerprint, cases)
+        record['rows_out'] = n_recomputed
+
+    with profiling.stage('calculate_counts', cases.shape[0]):
+        return assemble_counts(task, df_gs, cases[['pred_pos', 'tp']]), n_recomputed
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Dec 18 15:22:29 2019
+
+@author: antonio
+"""
+
+import warnings
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from . import profiling
+from .encoding import DistinctKeys, Encoding, isin, key_cases, unpack
+from .streaming import DEFAULT_CHUNKSIZE, read_chunks, read_predictions
+
+
+def format_gs(filepath, output_path=None, gs_names = ['qid', 'docno']):
+    '''
+    DESCRIPTION: Load Gold Standard table.
+    
+    INPUT: 
+        filepath: str
+            route to TSV file with Gold Standard.
+        output_path: str
+            route to TSV where intermediate file is stored. If None, 
+            nothing is written.
+    
+    OUTPUT: 
+        gs: pandas dataframe
+            with columns ["qid", "q0", "docno", "rel"]. It is also stored
+            as TSV file in output_path.
+    
+    Note: Dataframe headers chosen to match library standards. 
+          More informative headers for the INPUT would be: 
+          ["clinical case","label","code","relevance"]
+    
+    # https://github.com/joaopalotti/trectools#file-formats
+    '''
+    # Check GS format:
+    check = pd.read_csv(filepath, sep='\t', header = None, nrows=1)
+    if check.shape[1] != 2:
+        raise ImportError('The GS file does not have 2 columns. Then, it was not imported')
+    
+    # Import GS
+    gs = pd.read_csv(filepath, sep='\t', header = None, names = gs_names)  
+        
+    # Preprocessing
+    # Column with all zeros (q0), needed for the library to properly import
+    # the dataframe
+    gs["q0"] = str(0)
+    gs["rel"] = str(1) # column indicating the relevance of the code (in GS, all codes are relevant)
+    gs.docno = gs.docno.str.lower() # Lowercase codes
+    gs = gs[['qid', 'q0', 'docno', 'rel']]
+    
+    # Remove codes predicted twice in the same clinical case 
+    # (they are present in GS because one code may have several references)
+    gs = gs.drop_duplicates(subset=['qid','docno'],  
+                            keep='first')  # Keep first of the predictions
+
+    # Write dataframe to Qrel file
+    if output_path is not None:
+        gs.to_csv(output_path, index=False, header=None, sep=' ')
+    
+    return gs
+    
+def format_predictions(filepath, output_path, valid_codes, 
+                       system_name = 'xx', pred_names = ['query','docid']):
+    '''
+    DESCRIPTION: Load Predictions table and add extra columns to match 
+    trectools library standards.
+        
+    INPUT: 
+        filepath: str
+                route to TSV file with Predictions.
+        output_path: str
+            route to TSV where intermediate file is stored. If None, 
+            nothing is written.
+        valid_codes: set
+            set of valid codes of this subtask
+
+    OUTPUT: 
+        pred: pandas dataframe
+            with columns ['query', "q0", 'docid', 'rank', 'score', 'system'],
+            in the order of the predictions file. It is also stored as TSV 
+            file in output_path.
+    
+    Note: Dataframe headers chosen to match library standards.
+          More informative INPUT headers would be: 
+          ["clinical case","code"]
+
+    https://github.com/joaopalotti/trectools#file-formats
+    '''
+    # Import predictions (the number of columns is checked while reading)
+    pred = pd.concat(list(read_chunks(filepath, pred_names)))
+    
+    # Check predictions types
+    if all(pred.dtypes == pd.Series({'query': object,'docid': object})) == False:
+        warnings.warn('The predictions file has wrong types')
+        
+    # Check if predictions file is empty
+    if pred.shape[0] == 0:
+        is_empty = 1
+        warnings.warn('The predictions file is empty')
+    else:
+        is_empty = 0
+        
+    # Add columns needed for the library to properly import the dataframe
+    pred['rank'] = 1
+    pred['rank'] = pred.groupby('query')['rank'].cumsum()
+    pred['q0'] = 'Q0'
+    pred['score'] = float(10) 
+    pred['system'] = system_name 
+    
+    # Reorder and rename columns
+    pred = pred[['query', "q0", 'docid', 'rank', 'score', 'system']]
+    
+    # Lowercase codes
+    pred["docid"] = pred["docid"].str.lower() 
+    
+    # Remove codes predicted twice in the same clinical case
+    pred = pred.drop_duplicates(subset=["query","docid"], 
+                                keep='first')  # Keep first of the predictions
+    
+    # Remove codes predicted but not in list of valid codes
+    pred = pred[pred['docid'].isin(valid_codes)]
+    if (pred.shape[0] == 0) & (is_empty == 0):
+        warnings.warn('None of the predicted codes are considered valid codes')
+  
+    # Write dataframe to Run file
+    if output_path is not None:
+        pred.to_csv(output_path, index=False, header=None, sep = '\t')
+    
+    return pred
+
+def calculate_map(gs, pred, depth=1000, per_query=False):
+    '''
+    DESCRIPTION: Compute Mean Average Precision. Rank order is taken from the
+    given document order, as TrecEval.get_map(trec_eval=False) does.
+    
+    All queries are processed at once: relevance flags, ranks and the 
+    cumulative number of relevant codes are computed with grouped 
+    operations over the whole predictions table.
+    
+    INPUT: 
+        gs: pandas dataframe
+            with the Gold Standard, as output by the function format_gs.
+        pred: pandas dataframe
+            with the predictions, as output by the function format_predictions.
+        depth: int
+            evaluation depth (number of codes per query that are considered).
+        per_query: bool
+            if True, return the Average Precision of every query instead.
+    
+    OUTPUT: 
+        MAP: float
+            Mean Average Precision. Queries of the predictions that are not 
+            in the Gold Standard count as zero, queries of the Gold Standard
+            that are not predicted are ignored (as in trectools).
+        or, if per_query is True,
+        ap_per_query: pandas series
+            Average Precision per query of the predictions (NaN for queries 
+            that are not in the Gold Standard).
+    '''
+    if pred.shape[0] == 0:
+        return pd.Series(dtype=float) if per_query else 0.0
+    
+    # Ranks in file order, cut at the evaluation depth
+    pred = pred.groupby('query', sort=False).head(depth)
+    rank = pred.groupby('query', sort=False).cumcount() + 1
+    
+    # Relevance of every predicted code and number of relevant codes up to it
+    is_rel = pd.Series(pd.MultiIndex.from_frame(pred[['query', 'docid']])
+                       .isin(pd.MultiIndex.from_frame(gs[['qid', 'docno']])),
+                       index=pred.index)
+    cum_rel = is_rel.astype(int).groupby(pred['query'], sort=False).cumsum()
+    
+    # Average precision per query
+    prec_at_rel = (cum_rel / rank).where(is_rel, 0)
+    n_rel_per_query = gs.groupby('qid')['docno'].count()
+    ap_per_query = prec_at_rel.groupby(pred['query']).sum()
+    ap_per_query = ap_per_query / n_rel_per_query.reindex(ap_per_query.index)
+    if per_query:
+        return ap_per_query
+    
+    return ap_per_query.sum() / pred['query'].nunique()
+
+def calculate_map_from_file(gs, filepath, valid_codes, depth=1000, 
+                            chunksize=DEFAULT_CHUNKSIZE, per_query=False):
+    '''
+    DESCRIPTION: Compute Mean Average Precision reading the predictions file
+    in chunks. Only the distinct (query, code) pairs, as packed integer keys 
+    (see encoding.Encoding), are kept in memory. They are ranked at the end 
+    by map_from_keys.
+    
+    INPUT: 
+        gs: pandas dataframe
+            with the Gold Standard, as output by the function format_gs.
+        filepath: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        depth: int
+            evaluation depth (number of codes per query that are considered).
+        chunksize: int
+            number of rows read at once.
+        per_query: bool
+            if True, return the Average Precision of every query instead.
+    
+    OUTPUT: 
+        MAP: float
+            Mean Average Precision, as output by calculate_map.
+        or, if per_query is True,
+        ap_per_query: pandas series
+            Average Precision per query, as output by calculate_map.
+    '''
+    encoding = Encoding(valid_codes, gs['qid'], gs['docno'])
+    relevant = pd.unique(encoding.encode(gs, 'qid', 'docno'))
+    pairs = DistinctKeys()
+    
+    for chunk in read_predictions(filepath, ['query', 'docid'], valid_codes,
+                                  code_column='docid', chunksize=chunksize):
+        # Remove codes predicted twice in the same clinical case (also when
+        # the first prediction was in a previous chunk)
+        pairs.update(encoding.encode(chunk, 'query', 'docid'))
+    
+    with profiling.stage('rank_predictions', pairs.keys.shape[0]):
+        return map_from_keys(encoding, relevant, pairs.keys, depth, per_query)
+
+def map_from_keys(encoding, relevant, keys, depth=1000, per_query=False):
+    '''
+    DESCRIPTION: Compute Mean Average Precision of encoded predictions. Codes
+    are ranked in the order of their first prediction in every query, as in
+    calculate_map.
+    
+    INPUT: 
+        encoding: encoding.Encoding
+            vocabularies of the Gold Standard and the predictions.
+        relevant: numpy array
+            key of every Gold Standard (query, code) pair.
+        keys: numpy array
+            key of every prediction, in file order (repeated pairs are 
+            ignored after their first appearance).
+        depth: int
+            evaluation depth (number of codes per query that are considered).
+        per_query: bool
+            if True, return the Average Precision of every query instead.
+    
+    OUTPUT: 
+        MAP: float
+            Mean Average Precision, as output by calculate_map.
+        or, if per_query is True,
+        ap_per_query: pandas series
+            Average Precision per query, sorted by query name, as output by 
+            calculate_map.
+    '''
+    keys = pd.unique(keys)
+    query = key_cases(keys)
+    is_rel = isin(keys, relevant)
+    n_queries = len(encoding.cases)
+    
+    # Sort by query, keeping the rank order, and number the codes of every
+    # query from 1
+    order = np.argsort(query, kind='stable')
+    query, is_rel = query[order], is_rel[order]
+    n_ranked = np.bincount(query, minlength=n_queries)
+    first_row = (np.cumsum(n_ranked) - n_ranked)[query]
+    rank = np.arange(query.shape[0]) - first_row + 1
+    cum_rel = np.cumsum(is_rel)
+    cum_rel = cum_rel - (cum_rel[first_row] - is_rel[first_row])
+    
+    prec_at_rel = (cum_rel / rank) * (is_rel & (rank <= depth))
+    ap_sum = np.bincount(query, weights=prec_at_rel, minlength=n_queries)
+    
+    # Queries with predictions, sorted by name (missing names are ignored)
+    ranked = np.flatnonzero(n_ranked > 0)
+    names = encoding.case_names(ranked)
+    ranked, names = ranked[~names.isna()], names[~names.isna()]
+    if ranked.shape[0] == 0:
+        return pd.Series(dtype=float) if per_query else 0.0
+    
+    # Relevant codes per query (missing codes are not counted). Queries that
+    # are not in the Gold Standard get NaN and count as zero in the MAP
+    case_ids, code_ids = unpack(pd.unique(relevant))
+    counted = ~pd.isna(encoding.codes.take(code_ids))
+    n_rel = np.bincount(case_ids[counted], minlength=n_queries)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ap = ap_sum[ranked] / n_rel[ranked]
+    if per_query:
+        return pd.Series(ap, index=names).sort_index()
+    
+    return float(np.nansum(ap) / ranked.shape[0])
+
+def calculate_map_trectools(gs, pred):
+    '''
+    DESCRIPTION: Compute Mean Average Precision with trectools. Intermediate
+    files are written to a private temporary directory. Only used to cross 
+    check calculate_map.
+    
+    INPUT: 
+        gs: pandas dataframe
+            with the Gold Standard, as output by the function format_gs.
+        pred: pandas dataframe
+            with the predictions, as output by the function format_predictions.
+    
+    OUTPUT: 
+        MAP: float
+            Mean Average Precision.
+    '''
+    from trectools import TrecQrel, TrecRun, TrecEval
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gs_file = os.path.join(tmp_dir, 'intermediate_gs_file.txt')
+        pred_file = os.path.join(tmp_dir, 'intermediate_predictions_file.txt')
+        gs.to_csv(gs_file, index=False, header=None, sep=' ')
+        pred.to_csv(pred_file, index=False, header=None, sep = '\t')
+        
+        # Load GS from qrel file
+        qrels = TrecQrel(gs_file)
+    
+        # Load pred from run file
+        run = TrecRun(pred_file)
+    
+        # Calculate MAP
+        te = TrecEval(run, qrels)
+        # With this option False, rank order is taken from the given document order
+        MAP = te.get_map(trec_eval=False)
+    
+    return MAP
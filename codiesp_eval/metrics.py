@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precision, Recall and F-score from True Positive, Predicted Positive and
+Gold Standard Positive counts, shared by the CodiEsp-D/P and CodiEsp-X
+evaluations.
+"""
+
+import warnings
+from collections import namedtuple
+
+# Per clinical case (pandas series indexed by clinical case name) and total
+# counts of a run
+Counts = namedtuple('Counts', ['TP_per_cc', 'Pred_Pos_per_cc', 'GS_Pos_per_cc',
+                               'TP', 'Pred_Pos', 'GS_Pos'])
+
+
+def compute_metrics(counts):
+    '''
+    DESCRIPTION: Calculate Precision, Recall and F-score, per document and
+    micro-averaged.
+
+    INPUT:
+        counts: Counts
+            True Positives, Predicted Positives and Gold Standard Positives,
+            per clinical case and in total.
+
+    OUTPUT:
+        P_per_cc: pandas series
+            Precision per clinical case (index contains clinical case names)
+        P: float
+            Micro-average precision
+        R_per_cc: pandas series
+            Recall per clinical case (index contains clinical case names)
+        R: float
+            Micro-average recall
+        F1_per_cc: pandas series
+            F-score per clinical case (index contains clinical case names)
+        F1: float
+            Micro-average F-score
+    '''
+    TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc, TP, Pred_Pos, GS_Pos = counts
+
+    P_per_cc =  TP_per_cc / Pred_Pos_per_cc
+    # A run without valid predictions (or an empty GS) scores NaN, whether
+    # the totals are Python or numpy numbers
+    P = TP / Pred_Pos if Pred_Pos > 0 else float('nan')
+    R_per_cc = TP_per_cc / GS_Pos_per_cc
+    R = TP / GS_Pos if GS_Pos > 0 else float('nan')
+    F1_per_cc = (2 * P_per_cc * R_per_cc) / (P_per_cc + R_per_cc)
+    if (P+R) == 0:
+        F1 = 0
+        warnings.warn('Global F1 score automatically set to zero to avoid division by zero')
+        return P_per_cc, P, R_per_cc, R, F1_per_cc, F1
+    F1 = (2 * P * R) / (P + R)
+
+    return P_per_cc, P, R_per_cc, R, F1_per_cc, F1
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Structured result files of the evaluations (JSON, TSV and Parquet).
+
+Results are built column-wise as a dataframe (one row per clinical case, or
+per tolerance or granularity level) and written in a single buffered
+operation:
+
+    JSON      {"summary": {"P": ..., "R": ..., "F1": ...}, "table": {column: [values]}}
+              (missing values are null)
+    TSV       header and one row per table row; the micro-average is the
+              last row, with clinical_case = micro-average
+    Parquet   as TSV (needs pyarrow or fastparquet)
+
+The format is taken from the file extension unless it is given.
+"""
+
+import importlib.util
+import json
+import math
+import os
+import sys
+
+import pandas as pd
+
+FORMATS = ['json', 'tsv', 'parquet']
+
+_EXTENSIONS = {'.json': 'json', '.tsv': 'tsv', '.txt': 'tsv', '.parquet': 'parquet',
+               '.pq': 'parquet'}
+
+# clinical_case of the micro-average row of TSV and Parquet files
+MICRO_AVERAGE = 'micro-average'
+
+
+def output_format(path, fmt=None):
+    '''
+    DESCRIPTION: Format of a result file.
+
+    INPUT:
+        path: str
+            route to the result file ('-': standard output).
+        fmt: str
+            json, tsv or parquet. If None, it is taken from the extension.
+
+    OUTPUT:
+        fmt: str
+    '''
+    if fmt is None:
+        fmt = _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if fmt is None:
+            raise ValueError('cannot tell the format of {!r} from its extension: use '
+                             'one of {} or give the format'.format(
+                                 path, ', '.join(sorted(_EXTENSIONS))))
+    if fmt not in FORMATS:
+        raise ValueError('unknown output format {!r}: use one of {}'.format(
+            fmt, ', '.join(FORMATS)))
+    if (fmt == 'parquet') & (path == '-'):
+        raise ValueError('Parquet results can not be written to the standard output')
+    return fmt
+
+
+def check_parquet_engine():
+    '''
+    DESCRIPTION: Raise ImportError if no Parquet engine is installed.
+    '''
+    if not any(importlib.util.find_spec(engine) is not None
+               for engine in ('pyarrow', 'fastparquet')):
+        raise ImportError('Parquet output needs pyarrow: pip install codiesp-eval[parquet]')
+
+
+def results_table(P_per_cc, R_per_cc, F1_per_cc):
+    '''
+    DESCRIPTION: Per clinical case Precision, Recall and F-score in one
+    dataframe (clinical cases missing from a series have NaN).
+
+    OUTPUT:
+        table: pandas dataframe
+            with columns [clinical_case, P, R, F1].
+    '''
+    table = pd.concat({'P': P_per_cc, 'R': R_per_cc, 'F1': F1_per_cc}, axis=1)
+    table.index.name = 'clinical_case'
+    return table.reset_index()
+
+
+def summary(P, R, F1):
+    '''
+    DESCRIPTION: Micro-average metrics as a dict of floats (None if not
+    defined).
+    '''
+    return {name: None if math.isnan(value) else float(value)
+            for name, value in (('P', P), ('R', R), ('F1', F1))}
+
+
+def write_table(table, path, fmt=None, summary=None):
+    '''
+    DESCRIPTION: Write a result table.
+
+    INPUT:
+        table: pandas dataframe
+            one row per clinical case, tolerance or granularity level.
+        path: str
+            route to the result file ('-': standard output, JSON or TSV).
+        fmt: str
+            json, tsv or parquet. If None, it is taken from the extension.
+        summary: dict
+            micro-average metrics (see summary), or None.
+    '''
+    fmt = output_format(path, fmt)
+    if fmt == 'json':
+        columns = table.astype(object).where(table.notna(), None).to_dict(orient='list')
+        document = {'table': columns} if summary is None else {'summary': summary,
+                                                               'table': columns}
+        _write_text(json.dumps(document) + '\n', path)
+        return
+
+    if summary is not None:
+        table = pd.concat([table, pd.DataFrame([dict(summary, clinical_case=MICRO_AVERAGE)])],
+                          ignore_index=True)
+    if fmt == 'tsv':
+        _write_text(table.to_csv(sep='\t', index=False), path)
+    else:
+        table.to_parquet(path, index=False)
+
+
+def _write_text(text, path):
+    if path == '-':
+        sys.stdout.write(text)
+    else:
+        with open(path, 'w') as f:
+            f.write(text)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-stage profiling of the evaluation pipelines.
+
+The evaluation functions wrap every pipeline stage (reading the GS, reading
+and filtering the predictions, matching, counting, printing...) in
+profiling.stage(name). When no Profiler is active this is a no-op. While a
+Profiler is active, it records for every stage the number of calls, the wall
+time, the rows in and out and the peak memory, and it can also run cProfile
+and tracemalloc over the whole evaluation. The report is a JSON document.
+"""
+
+import contextlib
+import cProfile
+import json
+import platform
+import pstats
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+REPORT_VERSION = 1
+
+# Profiler receiving the stages, if any
+_active = None
+
+
+def _peak_rss_mb():
+    '''
+    DESCRIPTION: High-water mark of the resident memory of the process, in
+    MiB (None where it is not available).
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Profiler:
+    '''
+    DESCRIPTION: Collect per-stage timings and memory of an evaluation.
+
+    INPUT:
+        cprofile: bool
+            whether to run cProfile over the whole evaluation.
+        trace_memory: bool
+            whether to trace Python allocations with tracemalloc, so that
+            the peak memory of every stage is measured (slower).
+    '''
+
+    def __init__(self, cprofile=False, trace_memory=False):
+        self.cprofile = cprofile
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._peaks = []
+        self._profile = None
+        self._start = None
+        self.wall_time = None
+
+    def start(self):
+        global _active
+        _active = self
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._start = time.perf_counter()
+
+    def stop(self):
+        global _active
+        self.wall_time = time.perf_counter() - self._start
+        if self._profile is not None:
+            self._profile.disable()
+        if self.trace_memory:
+            self.peak_traced = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if _active is self:
+            _active = None
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        '''
+        DESCRIPTION: Measure one call of a stage. The caller may set
+        record['rows_out'] (and record['rows_in']) on the yielded dict.
+        '''
+        record = {'rows_in': rows_in, 'rows_out': None}
+        if self.trace_memory:
+            # The peak of an enclosing stage must survive the reset
+            current_peak = tracemalloc.get_traced_memory()[1]
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], current_peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                # Python >= 3.9; before, stage peaks are cumulative
+                tracemalloc.reset_peak()
+            self._peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            elapsed = time.perf_counter() - start
+            peak_traced = None
+            if self.trace_memory:
+                peak_traced = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak_traced)
+            self._add(name, elapsed, record, peak_traced)
+
+    def _add(self, name, elapsed, record, peak_traced):
+        stats = self.stages.setdefault(name, {'name': name, 'calls': 0,
+                                              'wall_time_s': 0.0, 'rows_in': None,
+                                              'rows_out': None, 'peak_rss_mb': None,
+                                              'peak_traced_mb': None})
+        stats['calls'] += 1
+        stats['wall_time_s'] += elapsed
+        for key in ('rows_in', 'rows_out'):
+            if record[key] is not None:
+                stats[key] = (stats[key] or 0) + int(record[key])
+        stats['peak_rss_mb'] = _peak_rss_mb()
+        if peak_traced is not None:
+            stats['peak_traced_mb'] = max(stats['peak_traced_mb'] or 0,
+                                          peak_traced / (1024 * 1024))
+
+    def report(self, top=30, **metadata):
+        '''
+        DESCRIPTION: JSON-serializable report of the evaluation.
+
+        INPUT:
+            top: int
+                number of functions (by cumulative time) of the cProfile
+                capture included in the report.
+            metadata: dict
+                extra fields (command line, subtask...).
+
+        OUTPUT:
+            report: dict
+        '''
+        report = dict(metadata, version=REPORT_VERSION,
+                      python=platform.python_version(),
+                      wall_time_s=self.wall_time, peak_rss_mb=_peak_rss_mb(),
+                      stages=list(self.stages.values()))
+        if 'pandas' in sys.modules:
+            report['pandas'] = sys.modules['pandas'].__version__
+        if self.trace_memory:
+            report['peak_traced_mb'] = self.peak_traced / (1024 * 1024)
+        if self._profile is not None:
+            stats = pstats.Stats(self._profile)
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+            report['cprofile'] = [
+                {'function': '{}:{}({})'.format(*key), 'ncalls': value[1],
+                 'tottime_s': value[2], 'cumtime_s': value[3]}
+                for key, value in rows[:top]]
+        return report
+
+
+def stage(name, rows_in=None):
+    '''
+    DESCRIPTION: Context manager measuring one call of a pipeline stage in
+    the active Profiler. Without an active Profiler it does nothing.
+
+    INPUT:
+        name: str
+            stage name. Calls with the same name are added up.
+        rows_in: int
+            number of rows the stage receives.
+
+    OUTPUT:
+        record: dict
+            set record['rows_out'] to the number of rows the stage outputs.
+    '''
+    if _active is None:
+        return contextlib.nullcontext({'rows_in': rows_in, 'rows_out': None})
+    return _active.stage(name, rows_in)
+
+
+def write_report(report, path):
+    '''
+    DESCRIPTION: Write a profiling report as JSON ('-': standard error).
+    '''
+    text = json.dumps(report, indent=2)
+    if path == '-':
+        sys.stderr.write(text + '\n')
+    else:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
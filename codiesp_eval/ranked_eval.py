@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ranked evaluation of CodiEsp-D and CodiEsp-P runs.
+
+A run is encoded once as integer arrays sorted by query (clinical case) and
+rank: the query id and the rank of every distinct valid predicted code, and
+whether the code is in the Gold Standard. Ranks are the order
+map_eval.format_predictions assigns (file order inside every clinical case,
+after removing repeated and invalid codes). MAP, MAP@k, P@k, R-precision,
+nDCG, nDCG@k and the set-based Precision, Recall and F-score are all
+computed from those arrays with per-query sums.
+
+As in map_eval.calculate_map (and trectools), ranked metrics are averaged
+over the clinical cases of the predictions: cases that are not in the Gold
+Standard count as zero, cases of the Gold Standard that are not predicted
+are ignored. Precision, Recall and F-score are those of
+f1_eval.calculate_metrics.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from . import profiling
+from .encoding import DistinctKeys, Encoding, isin, key_cases
+from .streaming import DEFAULT_CHUNKSIZE, read_predictions
+
+# Encoded run: per prediction row (sorted by query, then rank) the query id,
+# rank and relevance; per query its name and number of GS codes; and the
+# number of distinct GS codes of the whole Gold Standard.
+RankedRun = namedtuple('RankedRun', ['query', 'rank', 'is_rel', 'query_names',
+                                     'n_rel', 'GS_Pos'])
+
+
+def encode_run(gs, pred, valid_codes=None):
+    '''
+    DESCRIPTION: Encode a run as rank arrays with relevance flags.
+
+    INPUT:
+        gs: pandas dataframe
+            with the Gold Standard, as output by map_eval.format_gs.
+        pred: pandas dataframe
+            with the distinct valid predictions, as output by
+            map_eval.format_predictions (or with columns query and docid,
+            in rank order).
+        valid_codes: set
+            set of valid codes of this subtask (first ids of the code
+            vocabulary, see encoding.Encoding).
+
+    OUTPUT:
+        run: RankedRun
+    '''
+    if 'rank' in pred.columns:
+        # Order assigned by format_predictions (stable inside every query)
+        pred = pred.sort_values('rank', kind='mergesort')
+    encoding = Encoding(valid_codes, gs['qid'], gs['docno'])
+    relevant = encoding.encode(gs, 'qid', 'docno')
+    return encode_keys(gs, encoding, relevant, encoding.encode(pred, 'query', 'docid'))
+
+
+def encode_keys(gs, encoding, relevant, keys):
+    '''
+    DESCRIPTION: Encode the packed (query, code) keys of a run as rank
+    arrays with relevance flags.
+
+    INPUT:
+        gs: pandas dataframe
+            with the Gold Standard, as output by map_eval.format_gs.
+        encoding: encoding.Encoding
+            vocabularies of the queries and codes of gs and keys.
+        relevant: numpy array
+            key of every GS row.
+        keys: numpy array
+            distinct keys of the predictions, in rank order.
+
+    OUTPUT:
+        run: RankedRun
+    '''
+    with profiling.stage('encode_run', keys.shape[0]):
+        # Queries are numbered in order of first appearance in the run
+        query_ids, query_cases = pd.factorize(key_cases(keys))
+        query_ids = query_ids.astype(np.int32)
+        query_names = encoding.case_names(query_cases)
+        is_rel = isin(keys, relevant)
+
+        # Sort by query, keeping the rank order, and number the rows of
+        # every query from 1
+        order = np.argsort(query_ids, kind='stable')
+        query_ids = query_ids[order]
+        n_rows = np.bincount(query_ids, minlength=len(query_names))
+        first_row = np.cumsum(n_rows) - n_rows
+        rank = (np.arange(query_ids.size) - first_row[query_ids] + 1).astype(np.int32)
+
+        n_rel = (gs.groupby('qid')['docno'].count()
+                 .reindex(query_names, fill_value=0).to_numpy(dtype=np.int32))
+
+    return RankedRun(query_ids, rank, is_rel[order], np.asarray(query_names, dtype=object),
+                     n_rel, gs.shape[0])
+
+
+def read_ranked_run(gs, filepath, valid_codes, chunksize=DEFAULT_CHUNKSIZE):
+    '''
+    DESCRIPTION: Read a predictions file in chunks and encode it. Only the
+    distinct (query, code) pairs are kept in memory, as packed integer keys
+    (see encoding.Encoding).
+
+    INPUT:
+        gs: pandas dataframe
+            with the Gold Standard, as output by map_eval.format_gs.
+        filepath: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        chunksize: int
+            number of rows read at once.
+
+    OUTPUT:
+        run: RankedRun
+    '''
+    encoding = Encoding(valid_codes, gs['qid'], gs['docno'])
+    relevant = encoding.encode(gs, 'qid', 'docno')
+    pairs = DistinctKeys()
+    for chunk in read_predictions(filepath, ['query', 'docid'], valid_codes,
+                                  code_column='docid', chunksize=chunksize):
+        pairs.update(encoding.encode(chunk, 'query', 'docid'))
+    return encode_keys(gs, encoding, relevant, pairs.keys)
+
+
+def ranked_metrics(run, ks=(5, 10), depth=1000, per_query=False):
+    '''
+    DESCRIPTION: Compute every ranked and set-based metric of an encoded run.
+
+    INPUT:
+        run: RankedRun
+            as output by encode_run or read_ranked_run.
+        ks: list
+            cutoffs of P@k, MAP@k and nDCG@k.
+        depth: int
+            evaluation depth of MAP and nDCG.
+        per_query: bool
+            if True, also return the ranked metrics of every query.
+
+    OUTPUT:
+        metrics: dict
+            metric name -> value: MAP, MAP@k, P@k, R-prec, nDCG, nDCG@k, P,
+            R and F1.
+        and, if per_query is True,
+        metrics_per_query: pandas dataframe
+            ranked metrics per query (index contains clinical case names).
+            Queries that are not in the Gold Standard have NaN MAP, MAP@k,
+            R-prec, nDCG and nDCG@k.
+    '''
+    with profiling.stage('ranked_metrics', run.rank.shape[0]):
+        n_queries = run.query_names.shape[0]
+        query, rank, is_rel, n_rel = run.query, run.rank, run.is_rel, run.n_rel
+
+        def per_query_sum(weights):
+            return np.bincount(query, weights=weights, minlength=n_queries)
+
+        # Relevant codes up to every row, inside its query
+        rel = is_rel.astype(np.int64)
+        n_rel_run = np.bincount(query, weights=rel, minlength=n_queries).astype(np.int64)
+        cum_rel = np.cumsum(rel) - (np.cumsum(n_rel_run) - n_rel_run)[query]
+        prec_at_rel = np.where(is_rel, cum_rel / rank, 0)
+        gain = np.where(is_rel, 1 / np.log2(rank + 1), 0)
+        ideal_gain = np.cumsum(1 / np.log2(np.arange(2, max(depth, max(ks, default=0)) + 2)))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            no_gs = n_rel == 0
+            columns = {}
+            columns['MAP'] = np.where(no_gs, np.nan,
+                                      per_query_sum(prec_at_rel * (rank <= depth)) / n_rel)
+            for k in ks:
+                columns['MAP@{}'.format(k)] = np.where(
+                    no_gs, np.nan, per_query_sum(prec_at_rel * (rank <= k)) / n_rel)
+            for k in ks:
+                columns['P@{}'.format(k)] = per_query_sum(rel * (rank <= k)) / k
+            columns['R-prec'] = np.where(no_gs, np.nan,
+                                         per_query_sum(rel * (rank <= n_rel[query])) / n_rel)
+            for name, cutoff in [('nDCG', depth)] + [('nDCG@{}'.format(k), k) for k in ks]:
+                idcg = ideal_gain[np.minimum(n_rel, cutoff) - 1]
+                columns[name] = np.where(no_gs, np.nan,
+                                         per_query_sum(gain * (rank <= cutoff)) / idcg)
+
+        df = pd.DataFrame(columns, index=pd.Index(run.query_names, name='query'))
+        # Mean over the predicted queries, in the order of calculate_map
+        metrics = (df.sort_index().sum() / n_queries if n_queries > 0
+                   else pd.Series(0.0, index=df.columns)).to_dict()
+
+        # Set-based metrics, as f1_eval.calculate_metrics
+        TP = float(rel.sum())
+        Pred_Pos = rank.shape[0]
+        P = TP / Pred_Pos if Pred_Pos > 0 else np.nan
+        R = TP / run.GS_Pos if run.GS_Pos > 0 else np.nan
+        metrics['P'], metrics['R'] = P, R
+        metrics['F1'] = 0 if (P + R) == 0 else (2 * P * R) / (P + R)
+
+    if per_query:
+        return metrics, df
+    return metrics
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of evaluation results.
+
+Teams often resubmit byte-identical prediction files, or the same run under
+another name. The results of an evaluation only depend on the content of the
+predictions, Gold Standard and valid codes files, on the scoring semantics
+of the evaluator (SCORING_VERSION) and on its parameters (tolerance, strict mode...), so they are
+stored under the SHA-256 of all of them (see result_key) and a resubmission
+is answered from the cache without reading the predictions again.
+
+A result is the per-case and total counts of the run (metrics.Counts), its
+MAP for CodiEsp-D/P and the warnings raised while evaluating it, which are
+raised again on every hit. Results are stored in a SQLite database
+($CODIESP_CACHE_DIR/results.sqlite by default):
+
+    results(key, value, size, last_used)   value: zlib-compressed JSON
+
+The database is opened in WAL mode with a busy timeout, so several evaluator
+processes (the workers of the evaluation server, concurrent command line
+runs) can read and write it at the same time. When the stored values take
+more than max_bytes, the least recently used ones are evicted.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import warnings
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from . import profiling
+from .codes_cache import default_cache_dir
+from .metrics import Counts
+
+CACHE_VERSION = 1
+
+# Version of the scoring semantics: bumped whenever the results of the
+# evaluation change (not on every release), so that results stored by a
+# previous version are evaluated again
+SCORING_VERSION = 2
+
+# Default bound of the size of the stored values
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Seconds a process waits for the lock of a concurrent writer
+BUSY_TIMEOUT = 30
+
+
+def default_cache_path():
+    '''
+    DESCRIPTION: Route to the result cache database.
+    '''
+    return os.path.join(default_cache_dir(), 'results.sqlite')
+
+
+def result_key(command, pred_sha256, source_sha256, **params):
+    '''
+    DESCRIPTION: Key of the result of an evaluation.
+
+    INPUT:
+        command: str
+            evaluation (f1, map, x...), as the results of every command
+            differ.
+        pred_sha256: str
+            SHA-256 of the content of the predictions.
+        source_sha256: list
+            SHA-256 of the content of the Gold Standard and of every list
+            of valid codes, in order.
+        params: dict
+            parameters of the evaluation (tol, strict...).
+
+    OUTPUT:
+        key: str
+            hex digest.
+    '''
+    description = {'version': CACHE_VERSION, 'scoring': SCORING_VERSION, 'command': command,
+                   'pred': pred_sha256, 'source': list(source_sha256), 'params': params}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    '''
+    DESCRIPTION: Result cache of one process, backed by a SQLite database
+    shared with other processes.
+
+    INPUT:
+        path: str
+            route to the database. If None, default_cache_path().
+        max_bytes: int
+            bound of the size of the stored (compressed) values.
+    '''
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path if path is not None else default_cache_path()
+        self.max_bytes = max_bytes
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA busy_timeout = {}'.format(BUSY_TIMEOUT * 1000))
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, '
+                               'value BLOB NOT NULL, size INTEGER NOT NULL, '
+                               'last_used INTEGER NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_last_used '
+                               'ON results (last_used)')
+            self._connection = connection
+        return self._connection
+
+    def get(self, key):
+        '''
+        DESCRIPTION: Stored result of a key, or None (also when the database
+        cannot be read).
+        '''
+        try:
+            with profiling.stage('result_cache_get') as record:
+                connection = self._connect()
+                row = connection.execute('SELECT value FROM results WHERE key = ?',
+                                         (key,)).fetchone()
+                record['rows_out'] = 0 if row is None else 1
+                if row is None:
+                    return None
+                connection.execute('UPDATE results SET last_used = ? WHERE key = ?',
+                                   (time.time_ns(), key))
+                return decode_result(row[0])
+        except (sqlite3.Error, OSError, ValueError) as e:
+            warnings.warn('Result cache could not be read ({})'.format(e))
+            return None
+
+    def put(self, key, result):
+        '''
+        DESCRIPTION: Store the result of a key and evict the least recently
+        used results beyond max_bytes.
+        '''
+        try:
+            with profiling.stage('result_cache_put'):
+                value = encode_result(result)
+                connection = self._connect()
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                       (key, value, len(value), time.time_ns()))
+                    connection.execute(
+                        'DELETE FROM results WHERE key IN (SELECT key FROM (SELECT key, '
+                        'SUM(size) OVER (ORDER BY last_used DESC, key) AS total '
+                        'FROM results) WHERE total > ?)', (self.max_bytes,))
+                    connection.execute('COMMIT')
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+        except (sqlite3.Error, OSError) as e:
+            warnings.warn('Result cache could not be written ({})'.format(e))
+
+    def evaluate(self, key, compute):
+        '''
+        DESCRIPTION: Result of a key, from the cache or computed and stored.
+        The warnings of the evaluation are raised again on every hit.
+
+        INPUT:
+            key: str
+                as output by result_key. If None, the result is computed
+                and not stored.
+            compute: function
+                evaluation, returning a dict with (some of) the keys counts
+                (metrics.Counts) and MAP.
+
+        OUTPUT:
+            result: dict
+                with keys counts, MAP and warnings.
+        '''
+        result = self.get(key) if key is not None else None
+        if result is not None:
+            for message in result['warnings']:
+                warnings.warn(message)
+            return result
+
+        caught = []
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                result = dict({'counts': None, 'MAP': None}, **compute())
+        finally:
+            for w in caught:
+                warnings.warn_explicit(w.message, w.category, w.filename, w.lineno)
+        # Only the warnings of the evaluation itself, not library deprecations
+        result['warnings'] = [str(w.message) for w in caught if w.category is UserWarning]
+        if key is not None:
+            self.put(key, result)
+        return result
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def encode_result(result):
+    '''
+    DESCRIPTION: Serialize a result (see ResultCache.evaluate) as
+    compressed JSON.
+    '''
+    counts = result['counts']
+    if counts is not None:
+        counts = {name: (_encode_series(value) if isinstance(value, pd.Series)
+                         else _to_python(value))
+                  for name, value in counts._asdict().items()}
+    payload = {'counts': counts, 'MAP': _to_python(result['MAP']),
+               'warnings': result['warnings']}
+    return zlib.compress(json.dumps(payload).encode('utf-8'), 1)
+
+
+def decode_result(value):
+    '''
+    DESCRIPTION: Result serialized by encode_result.
+    '''
+    payload = json.loads(zlib.decompress(value).decode('utf-8'))
+    counts = payload['counts']
+    if counts is not None:
+        payload['counts'] = Counts(**{name: (_decode_series(value) if isinstance(value, dict)
+                                             else value)
+                                      for name, value in counts.items()})
+    return payload
+
+
+def _to_python(value):
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def _encode_series(series):
+    return {'name': series.name, 'index_name': series.index.name, 'dtype': str(series.dtype),
+            'index': series.index.tolist(), 'values': series.tolist()}
+
+
+def _decode_series(data):
+    return pd.Series(data['values'], index=pd.Index(data['index'], dtype=object,
+                                                    name=data['index_name']),
+                     name=data['name'], dtype=data['dtype'])
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local evaluation service.
+
+The Gold Standards and the lists of valid codes are parsed once, when the
+server starts, and stay resident in a pool of worker processes. Submissions
+are posted over HTTP (TCP on localhost or a Unix socket) and scored
+concurrently by the pool; results are returned as JSON.
+
+API:
+    GET  /health                      loaded subtasks
+    POST /evaluate/<task>[?per_cc=1]  body: predictions TSV; task: d, p or x
+
+As with the command line, a submission without valid codes is scored (null
+Precision and F-score) with a warning. Requests without Content-Length get
+411 and bodies larger than max_body_size get 413.
+
+With --result_cache, the counts and MAP of every submission are kept in a
+SQLite cache shared by the workers (see result_cache), keyed by the content
+of the submission, Gold Standard and valid codes: resubmitting identical
+predictions is answered without scoring them again.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import socketserver
+import stat
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from . import f1_eval, map_eval, x_eval
+from .codes_cache import file_sha256, load_valid_codes
+from .gold_cache import load_gs
+from .metrics import compute_metrics
+from .result_cache import DEFAULT_MAX_BYTES, ResultCache, result_key
+
+# Gold Standards and valid codes per subtask, set in every worker process by
+# _init_worker
+_state = {}
+
+# Result cache of every worker process (None if disabled), set by _init_worker
+_cache = {'result_cache': None}
+
+# Default bound of the size of a submission, in bytes
+DEFAULT_MAX_BODY_SIZE = 100 * 1024 * 1024
+
+
+def load_resources(gs_paths, codes_d_path=None, codes_p_path=None):
+    '''
+    DESCRIPTION: Parse the Gold Standards and valid codes lists served.
+
+    INPUT:
+        gs_paths: dict
+            route to the GS file of every subtask ('d', 'p', 'x').
+        codes_d_path: str
+            route to TSV with valid CIE10 Diagnostico codes.
+        codes_p_path: str
+            route to TSV with valid CIE10 Procedimiento codes.
+
+    OUTPUT:
+        resources: dict
+            for every subtask, its parsed GS, its set of valid codes and the
+            SHA-256 of the GS and valid codes files (sources, for the
+            result cache).
+    '''
+    codes = {}
+    if codes_d_path is not None:
+        codes['d'] = load_valid_codes(codes_d_path)
+    if codes_p_path is not None:
+        codes['p'] = load_valid_codes(codes_p_path)
+
+    resources = {}
+    for task, gs_path in gs_paths.items():
+        if task == 'x':
+            if ('d' not in codes) | ('p' not in codes):
+                raise ValueError('CodiEsp-X requires both valid codes lists')
+            resources[task] = {'gs': load_gs(gs_path, 'x'),
+                               'valid_codes': codes['d'].union(codes['p']),
+                               'sources': [file_sha256(path) for path in
+                                           (gs_path, codes_d_path, codes_p_path)]}
+        else:
+            if task not in codes:
+                raise ValueError('CodiEsp-{} requires its valid codes list'.format(
+                    task.upper()))
+            resources[task] = {'gs': load_gs(gs_path, 'f1'),
+                               'qrels': load_gs(gs_path, 'map'),
+                               'valid_codes': codes[task],
+                               'sources': [file_sha256(path) for path in
+                                           (gs_path, codes_d_path if task == 'd'
+                                            else codes_p_path)]}
+    return resources
+
+
+def _init_worker(resources, result_cache=None, result_cache_size=DEFAULT_MAX_BYTES):
+    _state.update(resources)
+    if result_cache is not None:
+        _cache['result_cache'] = ResultCache(result_cache or None, result_cache_size)
+
+
+def _to_json_number(value):
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def evaluate_submission(task, data, per_cc=False):
+    '''
+    DESCRIPTION: Score one submission against the resident Gold Standard.
+
+    INPUT:
+        task: str
+            'd', 'p' or 'x'.
+        data: bytes
+            content of the predictions TSV file.
+        per_cc: bool
+            whether to include the metrics per clinical case.
+
+    OUTPUT:
+        result: dict
+            JSON-serializable results, with the warnings raised while
+            evaluating.
+    '''
+    resources = _state[task]
+
+    def score():
+        if task == 'x':
+            return {'counts': x_eval.count_run(resources['gs'], io.BytesIO(data),
+                                               resources['valid_codes'])}
+        return {'counts': f1_eval.count_run(resources['gs'], io.BytesIO(data),
+                                            resources['valid_codes']),
+                'MAP': map_eval.calculate_map_from_file(
+                    resources['qrels'], io.BytesIO(data), resources['valid_codes'])}
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        cache = _cache['result_cache']
+        if cache is not None:
+            scores = cache.evaluate(result_key('server-' + task,
+                                               hashlib.sha256(data).hexdigest(),
+                                               resources['sources']), score)
+        else:
+            scores = score()
+        counts = scores['counts']
+        result = {'task': task}
+        if task != 'x':
+            result['MAP'] = _to_json_number(scores['MAP'])
+        P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = compute_metrics(counts)
+
+    result.update({'P': _to_json_number(P), 'R': _to_json_number(R),
+                   'F1': _to_json_number(F1)})
+    if per_cc:
+        result['per_cc'] = {name: {cc: _to_json_number(v) for cc, v in s.items()}
+                            for name, s in (('P', P_per_cc), ('R', R_per_cc),
+                                            ('F1', F1_per_cc))}
+    # Only the warnings of the evaluation itself, not library deprecations
+    result['warnings'] = sorted(set(str(w.message) for w in caught
+                                    if w.category is UserWarning))
+    return result
+
+
+class EvaluationHandler(BaseHTTPRequestHandler):
+    '''
+    DESCRIPTION: HTTP handler. Scoring is delegated to the worker pool of
+    the server (self.server.executor).
+    '''
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self._send_json(200, {'status': 'ok', 'tasks': sorted(self.server.tasks)})
+        else:
+            self._send_json(404, {'error': 'Unknown endpoint'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if (len(parts) != 2) | (parts[0] != 'evaluate'):
+            self._send_json(404, {'error': 'Unknown endpoint'})
+            return
+        task = parts[1].lower()
+        if task not in self.server.tasks:
+            self._send_json(404, {'error': 'No Gold Standard loaded for task {}'.format(task)})
+            return
+        per_cc = parse_qs(url.query).get('per_cc', ['0'])[0] in ('1', 'true')
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self._send_json(411, {'error': 'Content-Length required'})
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {'error': 'Invalid Content-Length'})
+            return
+        if length > self.server.max_body_size:
+            # The body is not read: close the connection instead
+            self.close_connection = True
+            self._send_json(413, {'error': 'Submissions are limited to {} bytes'.format(
+                self.server.max_body_size)})
+            return
+        data = self.rfile.read(length)
+
+        try:
+            result = self.server.executor.submit(evaluate_submission, task, data,
+                                                 per_cc).result()
+        except (ImportError, ValueError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': '{}: {}'.format(type(e).__name__, e)})
+            return
+        self._send_json(200, result)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix-socket'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+def make_server(resources, host='127.0.0.1', port=8000, socket_path=None,
+                workers=None, quiet=False, result_cache=None,
+                result_cache_size=DEFAULT_MAX_BYTES, max_body_size=DEFAULT_MAX_BODY_SIZE):
+    '''
+    DESCRIPTION: Create the evaluation server and its worker pool.
+
+    INPUT:
+        resources: dict
+            as output by load_resources.
+        host, port: str, int
+            TCP address (ignored if socket_path is given).
+        socket_path: str
+            route to a Unix socket to listen on. A socket left at that
+            route is replaced; any other file raises FileExistsError.
+        workers: int
+            size of the worker pool. If None, one worker per CPU.
+        quiet: bool
+            whether to disable request logging.
+        result_cache: str
+            route to the result cache database ('': the default one,
+            result_cache.default_cache_path()). If None, no result cache.
+        result_cache_size: int
+            bound of the size of the result cache, in bytes.
+        max_body_size: int
+            bound of the size of a submission, in bytes.
+
+    OUTPUT:
+        server: http server
+            call serve_forever() to start it and shutdown() and
+            executor.shutdown() to stop it.
+    '''
+    if socket_path is not None:
+        if os.path.lexists(socket_path):
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise FileExistsError('{} exists and is not a socket'.format(socket_path))
+            os.unlink(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, EvaluationHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), EvaluationHandler)
+    server.tasks = set(resources)
+    server.quiet = quiet
+    server.max_body_size = max_body_size
+    server.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                          initializer=_init_worker,
+                                          initargs=(resources, result_cache,
+                                                    result_cache_size))
+    return server
+
+
+def parse_arguments(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+
+    parser = argparse.ArgumentParser(description='process user given parameters')
+    parser.add_argument("-gD", "--gs_D_path", dest = "gs_D_path",
+                        help = "path to CodiEsp-D GS file")
+    parser.add_argument("-gP", "--gs_P_path", dest = "gs_P_path",
+                        help = "path to CodiEsp-P GS file")
+    parser.add_argument("-gX", "--gs_X_path", dest = "gs_X_path",
+                        help = "path to CodiEsp-X GS file")
+    parser.add_argument("-cD", "--valid_codes_D_path", dest = "codes_D_path",
+                        help = "path to valid CIE10 Diagnostico codes TSV")
+    parser.add_argument("-cP", "--valid_codes_P_path", dest = "codes_P_path",
+                        help = "path to valid CIE10 Procedimiento codes TSV")
+    parser.add_argument("--host", dest = "host", default = "127.0.0.1",
+                        help = "address to listen on")
+    parser.add_argument("--port", dest = "port", type = int, default = 8000,
+                        help = "TCP port to listen on")
+    parser.add_argument("--socket", dest = "socket_path", default = None,
+                        help = "listen on this Unix socket instead of TCP")
+    parser.add_argument("-w", "--workers", dest = "workers", type = int, default = None,
+                        help = "number of worker processes (default: number of CPUs)")
+    parser.add_argument("-q", "--quiet", dest = "quiet", action = "store_true",
+                        help = "do not log requests")
+    parser.add_argument("--max_body_size", dest = "max_body_size", type = int, default = 100,
+                        help = "largest submission accepted, in MiB (default: 100)")
+    parser.add_argument("--result_cache", dest = "result_cache", nargs = '?', const = '',
+                        default = None, metavar = "PATH",
+                        help = "answer resubmitted predictions from this SQLite result " +
+                        "cache (default PATH: $CODIESP_CACHE_DIR/results.sqlite)")
+    parser.add_argument("--result_cache_size", dest = "result_cache_size", type = int,
+                        default = 256,
+                        help = "size of the result cache, in MiB (default: 256)")
+
+    args = parser.parse_args(argv)
+    gs_paths = {task: path for task, path in (('d', args.gs_D_path), ('p', args.gs_P_path),
+                                              ('x', args.gs_X_path)) if path is not None}
+    if len(gs_paths) == 0:
+        parser.error('At least one GS file is required')
+    if args.max_body_size < 1:
+        parser.error('--max_body_size needs a number >= 1')
+    if args.result_cache_size < 1:
+        parser.error('--result_cache_size needs a number >= 1')
+
+    return args, gs_paths
+
+
+def main(argv=None):
+
+    args, gs_paths = parse_arguments(argv)
+
+    ###### 0. Load valid codes lists and GS: ######
+    resources = load_resources(gs_paths, args.codes_D_path, args.codes_P_path)
+
+    ###### 1. Serve ######
+    server = make_server(resources, args.host, args.port, args.socket_path,
+                         args.workers, args.quiet, args.result_cache,
+                         args.result_cache_size * 1024 * 1024,
+                         args.max_body_size * 1024 * 1024)
+    print('Serving CodiEsp evaluation ({}) on {}'.format(
+        ', '.join(sorted(resources)),
+        args.socket_path or 'http://{}:{}'.format(args.host, args.port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.executor.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parallel CodiEsp-X evaluation of one predictions file.
+
+Every count of CodiEsp-X decomposes per (clinical_case, code) pair: a GS
+reference is matched when some prediction of its pair covers it, and the
+predicted pairs are counted once. The predictions file is split into byte
+ranges that end at line boundaries, and a pool of worker processes reads,
+filters, splits and matches one range each (reading the file is most of
+the time of an evaluation). The parent merges the results:
+
+    matched references   logical or of the matches of every range
+    predicted pairs      distinct keys of every range, in file order
+
+The Gold Standard is encoded once by the parent. Its span arrays are saved
+as .npy files that the workers memory-map, so all the workers share the
+same pages, and its vocabularies are sent to every worker. Clinical cases
+and codes that are not in the vocabularies get ids in every worker; the
+parent adds their names to its vocabulary range by range, in file order,
+which gives the ids of a serial reading. The counts are identical to those
+of x_eval.count_run.
+"""
+
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import profiling
+from .encoding import DistinctKeys, pack, unpack
+from .span_matching import int32_offsets, match_groups, pred_groups
+from .streaming import DEFAULT_CHUNKSIZE, warn_predictions
+from .x_eval import count_encoded, count_run, encode_gs, iter_run, matched_references
+
+# Encoded Gold Standard and options of the evaluation, set in every worker
+# process by _init_worker
+_shared = {}
+
+
+def file_blocks(filepath, n_blocks):
+    '''
+    DESCRIPTION: Split a file into byte ranges of about the same size that
+    start at the beginning of a line.
+
+    INPUT:
+        filepath: str
+            route to the file.
+        n_blocks: int
+            number of ranges.
+
+    OUTPUT:
+        blocks: list
+            (offset, length) of every non-empty range, in file order.
+    '''
+    size = os.path.getsize(filepath)
+    bounds = [0]
+    with open(filepath, 'rb') as f:
+        for i in range(1, n_blocks):
+            f.seek(max(size * i // n_blocks, bounds[-1]))
+            f.readline()
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, end - start) for start, end in zip(bounds[:-1], bounds[1:])
+            if end > start]
+
+
+def count_run_sharded(df_gs, pred_path, valid_codes, tol = 10, chunksize=DEFAULT_CHUNKSIZE,
+                      strict=False, workers=None):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives of a predictions file with a pool of worker processes, one
+    range of the file each. The counts are identical to those of
+    x_eval.count_run.
+
+    INPUT:
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function
+            x_eval.read_gs.
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        tol: int
+            error tolerance, in characters.
+        chunksize: int
+            number of rows read at once by every worker.
+        strict: bool
+            if True, every fragment of a discontinuous reference has to be
+            matched.
+        workers: int
+            size of the process pool. If None, one worker per CPU.
+
+    OUTPUT:
+        counts: metrics.Counts
+    '''
+    workers = workers or os.cpu_count() or 1
+    blocks = file_blocks(pred_path, workers) if workers > 1 else []
+    if len(blocks) < 2:
+        return count_run(df_gs, pred_path, valid_codes, tol, chunksize, strict)
+
+    gs = encode_gs(df_gs, valid_codes, strict)
+    with tempfile.TemporaryDirectory() as tmp:
+        arrays = {}
+        for name in ('groups', 'group', 'start', 'end'):
+            arrays[name] = os.path.join(tmp, name + '.npy')
+            np.save(arrays[name], getattr(gs, name))
+        with profiling.stage('count_shards', len(blocks)):
+            with ProcessPoolExecutor(max_workers=min(workers, len(blocks)),
+                                     initializer=_init_worker,
+                                     initargs=(pred_path, gs.encoding, arrays, valid_codes,
+                                               tol, chunksize)) as executor:
+                results = list(executor.map(count_block, blocks))
+
+    with profiling.stage('merge_shards', len(blocks)):
+        encoding = gs.encoding
+        n_cases, n_codes = len(encoding.cases), len(encoding.codes)
+        is_valid = np.zeros(gs.start.shape[0], dtype=bool)
+        pairs = DistinctKeys()
+        n_rows, n_valid, wrong_types = 0, 0, False
+        for matched, keys, new_cases, new_codes, stats in results:
+            is_valid[matched] = True
+            # Ids of the new clinical cases and codes of the range in the
+            # vocabularies of the parent
+            case_ids = np.concatenate([np.arange(n_cases, dtype=np.int32),
+                                       encoding.encode_cases(new_cases)])
+            code_ids = np.concatenate([np.arange(n_codes, dtype=np.int32),
+                                       encoding.encode_codes(new_codes)])
+            block_cases, block_codes = unpack(keys)
+            pairs.update(pack(case_ids[block_cases], code_ids[block_codes]))
+            n_rows += stats['n_rows']
+            n_valid += stats['n_valid']
+            wrong_types |= stats['wrong_types']
+    warn_predictions(n_rows, n_valid, wrong_types)
+
+    with profiling.stage('calculate_counts', pairs.keys.shape[0]):
+        return count_encoded(df_gs, gs, matched_references(gs, is_valid), pairs.keys)
+
+
+def _init_worker(pred_path, encoding, arrays, valid_codes, tol, chunksize):
+    _shared['pred_path'] = pred_path
+    _shared['encoding'] = encoding
+    _shared['n_cases'], _shared['n_codes'] = len(encoding.cases), len(encoding.codes)
+    _shared.update({name: np.load(path, mmap_mode='r') for name, path in arrays.items()})
+    _shared['valid_codes'] = valid_codes
+    _shared['tol'] = tol
+    _shared['chunksize'] = chunksize
+
+
+def count_block(block):
+    '''
+    DESCRIPTION: Read and match one range of the predictions file, in a
+    worker process.
+
+    INPUT:
+        block: tuple
+            (offset, length) of the range, as output by file_blocks.
+
+    OUTPUT:
+        matched: numpy array
+            spans of the GS matched by the predictions of the range.
+        keys: numpy array
+            distinct keys of the predictions of the range, in order of
+            first appearance, with the ids of the worker.
+        new_cases: numpy array
+            clinical cases of the range that are not in the vocabulary of
+            the GS, in order of first appearance (ids of the worker).
+        new_codes: numpy array
+            the same for codes.
+        stats: dict
+            as filled by streaming.read_predictions.
+    '''
+    offset, length = block
+    with open(_shared['pred_path'], 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+
+    # Vocabularies of the GS, without the names of the previous ranges
+    encoding = _shared['encoding']
+    n_cases, n_codes = _shared['n_cases'], _shared['n_codes']
+    encoding.cases, encoding.codes = encoding.cases[:n_cases], encoding.codes[:n_codes]
+    is_valid = np.zeros(_shared['start'].shape[0], dtype=bool)
+    pairs = DistinctKeys()
+    stats = {'n_rows': 0, 'n_valid': 0, 'wrong_types': False}
+    try:
+        for chunk in iter_run(io.BytesIO(data), _shared['valid_codes'],
+                              _shared['chunksize'], stats=stats):
+            pred_keys = encoding.encode(chunk)
+            rows, group = pred_groups(_shared['groups'], pred_keys)
+            is_valid |= match_groups(_shared['group'], _shared['start'], _shared['end'],
+                                     group,
+                                     int32_offsets(chunk['start_pos_pred'])[rows],
+                                     int32_offsets(chunk['end_pos_pred'])[rows],
+                                     _shared['tol'])
+            pairs.update(pred_keys)
+    except pd.errors.EmptyDataError:
+        # A range of blank lines
+        pass
+    return (np.flatnonzero(is_valid), pairs.keys, encoding.cases[n_cases:].to_numpy(),
+            encoding.codes[n_codes:].to_numpy(), stats)
+
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bootstrap confidence intervals and paired significance tests.
+
+Resampling works on per-document counts (True Positives, Predicted Positives
+and Gold Standard Positives per clinical case, or Average Precision and
+query count per query for MAP). Every block of resamples is a matrix of
+document weights, so the resampled micro-averaged metrics are obtained with
+one matrix product per block instead of re-running the evaluation.
+"""
+
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import f1_eval, map_eval, x_eval
+from .codes_cache import load_valid_codes
+from .gold_cache import load_gs
+
+# Number of resamples drawn at once (and generated from one seed). The
+# results only depend on the seed, not on the number of workers.
+BLOCK_SIZE = 1000
+
+PRF_METRICS = ['P', 'R', 'F1']
+
+
+def prf_units(counts, index=None):
+    '''
+    DESCRIPTION: Per-document counts used to resample Precision, Recall and
+    F-score.
+
+    INPUT:
+        counts: metrics.Counts
+            as output by calculate_counts or count_run.
+        index: list
+            clinical cases used as resampling units. By default, those of
+            the Gold Standard.
+
+    OUTPUT:
+        units: numpy array
+            with shape (n_documents, 3): TP, Predicted and GS Positives.
+        offset: numpy array
+            Predicted Positives of documents that are not in the Gold
+            Standard. They are added to every resample, unchanged.
+    '''
+    index = counts.GS_Pos_per_cc.index if index is None else index
+    units = np.column_stack([
+        s.reindex(index).fillna(0).to_numpy(dtype=float)
+        for s in (counts.TP_per_cc, counts.Pred_Pos_per_cc, counts.GS_Pos_per_cc)])
+    offset = np.array([0, counts.Pred_Pos - units[:, 1].sum(), 0], dtype=float)
+    return units, offset
+
+
+def map_units(ap_per_query, index=None):
+    '''
+    DESCRIPTION: Per-query values used to resample Mean Average Precision.
+
+    INPUT:
+        ap_per_query: pandas series
+            as output by calculate_map(..., per_query=True).
+        index: list
+            queries used as resampling units. By default, those of the run.
+
+    OUTPUT:
+        units: numpy array
+            with shape (n_queries, 2): Average Precision, and 1 if the query
+            is ranked by the run (0 otherwise). MAP is the sum of the first
+            column divided by the sum of the second one, so a resample (or a
+            swap of queries between two runs with different queries in the
+            paired test) divides by its own number of ranked queries, and
+            the units of both runs stay on the same scale.
+        offset: numpy array
+            zeros.
+    '''
+    index = ap_per_query.index if index is None else index
+    units = np.column_stack([
+        ap_per_query.reindex(index).fillna(0).to_numpy(dtype=float),
+        pd.Index(index).isin(ap_per_query.index).astype(float)])
+    return units, np.zeros(2)
+
+
+def scores(totals, kind):
+    '''
+    DESCRIPTION: Micro-averaged metrics from (resampled) total counts.
+
+    INPUT:
+        totals: numpy array
+            with shape (n_resamples, n_counts).
+        kind: str
+            'prf' (totals are TP, Predicted and GS Positives) or 'map'
+            (totals are the sum of Average Precision and the number of
+            queries).
+
+    OUTPUT:
+        values: numpy array
+            with shape (n_resamples, n_metrics).
+    '''
+    if kind == 'map':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return totals[:, :1] / totals[:, 1:2]
+    tp, pred, gold = totals[:, 0], totals[:, 1], totals[:, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        P = tp / pred
+        R = tp / gold
+        F1 = np.where(tp > 0, 2 * tp / (pred + gold), 0.0)
+    return np.column_stack([P, R, F1])
+
+
+def _weights(rng, size, n):
+    '''
+    DESCRIPTION: Bootstrap weight matrix: how many times every document is
+    drawn in each of size resamples of n documents.
+    '''
+    draws = rng.integers(0, n, size=(size, n)) + (np.arange(size) * n)[:, None]
+    return np.bincount(draws.ravel(), minlength=size * n).reshape(size, n)
+
+
+def _bootstrap_block(args):
+    units, offset, kind, seed, size = args
+    rng = np.random.default_rng(seed)
+    return scores(_weights(rng, size, units.shape[0]) @ units + offset, kind)
+
+
+def _randomization_block(args):
+    units_a, offset_a, units_b, offset_b, kind, seed, size = args
+    rng = np.random.default_rng(seed)
+    # Swap the documents of both runs with probability 0.5
+    swap = (rng.random((size, units_a.shape[0])) < 0.5).astype(float)
+    moved = swap @ (units_b - units_a)
+    totals_a = units_a.sum(axis=0) + moved + offset_a
+    totals_b = units_b.sum(axis=0) - moved + offset_b
+    return scores(totals_a, kind) - scores(totals_b, kind)
+
+
+def _run_blocks(function, args, n_resamples, seed, workers):
+    '''
+    DESCRIPTION: Run resampling blocks, serially or in a process pool, and
+    stack their results.
+    '''
+    n_blocks = int(np.ceil(n_resamples / BLOCK_SIZE))
+    seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+    sizes = [min(BLOCK_SIZE, n_resamples - i * BLOCK_SIZE) for i in range(n_blocks)]
+    tasks = [args + (s, size) for s, size in zip(seeds, sizes)]
+
+    if (workers or 1) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            blocks = list(executor.map(function, tasks))
+    else:
+        blocks = [function(t) for t in tasks]
+    return np.vstack(blocks)
+
+
+def bootstrap(units, offset, kind, n_resamples=10000, alpha=0.05, seed=None,
+              workers=1):
+    '''
+    DESCRIPTION: Percentile bootstrap confidence intervals of the
+    micro-averaged metrics of one run, resampling documents.
+
+    INPUT:
+        units, offset: numpy arrays
+            as output by prf_units or map_units.
+        kind: str
+            'prf' or 'map'.
+        n_resamples: int
+            number of bootstrap resamples.
+        alpha: float
+            the intervals cover 1 - alpha.
+        seed: int
+            random seed.
+        workers: int
+            number of worker processes.
+
+    OUTPUT:
+        results: pandas dataframe
+            with columns ['metric', 'estimate', 'ci_low', 'ci_high'].
+    '''
+    estimate = scores((units.sum(axis=0) + offset)[None, :], kind)[0]
+    values = _run_blocks(_bootstrap_block, (units, offset, kind),
+                         n_resamples, seed, workers)
+    low, high = np.nanpercentile(values, [100 * alpha / 2, 100 * (1 - alpha / 2)],
+                                 axis=0)
+    return pd.DataFrame({'metric': PRF_METRICS if kind == 'prf' else ['MAP'],
+                         'estimate': estimate, 'ci_low': low, 'ci_high': high})
+
+
+def randomization_test(units_a, offset_a, units_b, offset_b, kind,
+                       n_resamples=10000, seed=None, workers=1):
+    '''
+    DESCRIPTION: Paired approximate randomization test between two runs
+    evaluated on the same documents.
+
+    INPUT:
+        units_a, offset_a: numpy arrays
+            of the first run, as output by prf_units or map_units.
+        units_b, offset_b: numpy arrays
+            of the second run, aligned with units_a.
+        kind: str
+            'prf' or 'map'.
+        n_resamples: int
+            number of random permutations.
+        seed: int
+            random seed.
+        workers: int
+            number of worker processes.
+
+    OUTPUT:
+        results: pandas dataframe
+            with columns ['metric', 'run_a', 'run_b', 'diff', 'p_value'].
+            p_value is two-sided.
+    '''
+    score_a = scores((units_a.sum(axis=0) + offset_a)[None, :], kind)[0]
+    score_b = scores((units_b.sum(axis=0) + offset_b)[None, :], kind)[0]
+    observed = np.abs(score_a - score_b)
+
+    diffs = _run_blocks(_randomization_block,
+                        (units_a, offset_a, units_b, offset_b, kind),
+                        n_resamples, seed, workers)
+    n_extreme = (np.abs(diffs) >= observed - 1e-12).sum(axis=0)
+    return pd.DataFrame({'metric': PRF_METRICS if kind == 'prf' else ['MAP'],
+                         'run_a': score_a, 'run_b': score_b,
+                         'diff': score_a - score_b,
+                         'p_value': (n_extreme + 1) / (n_resamples + 1)})
+
+
+def load_units(task, gold, pred_path, valid_codes):
+    '''
+    DESCRIPTION: Evaluate one run and return its per-document counts.
+
+    OUTPUT:
+        units: dict
+            'prf': counts (metrics.Counts), and for CodiEsp-D/P
+            'map': Average Precision per query (pandas series).
+    '''
+    if task == 'x':
+        return {'prf': x_eval.count_run(gold['gs'], pred_path, valid_codes)}
+    return {'prf': f1_eval.count_run(gold['gs'], pred_path, valid_codes),
+            'map': map_eval.calculate_map_from_file(
+                gold['qrels'], pred_path, valid_codes, per_query=True)}
+
+
+def parse_arguments(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+
+    parser = argparse.ArgumentParser(description='process user given parameters')
+    parser.add_argument("-t", "--task", required = True, dest = "task",
+                        choices = ['d', 'p', 'x'], help = "CodiEsp subtask")
+    parser.add_argument("-g", "--gs_path", required = True, dest = "gs_path",
+                        help = "path to GS file")
+    parser.add_argument("-p", "--pred_path", required = True, dest = "pred_path",
+                        help = "path to predictions file")
+    parser.add_argument("-p2", "--compare_pred_path", dest = "compare_pred_path",
+                        help = "path to a second predictions file (paired test)")
+    parser.add_argument("-c", "--valid_codes_path", dest = "codes_path",
+                        help = "path to valid codes TSV (CodiEsp-D and CodiEsp-P)")
+    parser.add_argument("-cD", "--valid_codes_D_path", dest = "codes_D_path",
+                        help = "path to valid CIE10 Diagnostico codes TSV (CodiEsp-X)")
+    parser.add_argument("-cP", "--valid_codes_P_path", dest = "codes_P_path",
+                        help = "path to valid CIE10 Procedimiento codes TSV (CodiEsp-X)")
+    parser.add_argument("-n", "--n_resamples", dest = "n_resamples", type = int,
+                        default = 10000, help = "number of resamples")
+    parser.add_argument("-a", "--alpha", dest = "alpha", type = float, default = 0.05,
+                        help = "confidence intervals cover 1 - alpha")
+    parser.add_argument("-s", "--seed", dest = "seed", type = int, default = 0,
+                        help = "random seed")
+    parser.add_argument("-w", "--workers", dest = "workers", type = int, default = 1,
+                        help = "number of worker processes")
+
+    args = parser.parse_args(argv)
+    if (args.task == 'x') & ((args.codes_D_path is None) | (args.codes_P_path is None)):
+        parser.error('CodiEsp-X requires --valid_codes_D_path and --valid_codes_P_path')
+    if (args.task != 'x') & (args.codes_path is None):
+        parser.error('CodiEsp-D and CodiEsp-P require --valid_codes_path')
+
+    return args
+
+
+def main(argv=None):
+
+    args = parse_arguments(argv)
+
+    ###### 0. Load valid codes lists and GS: ######
+    if args.task == 'x':
+        valid_codes = load_valid_codes(args.codes_D_path).union(
+            load_valid_codes(args.codes_P_path))
+        gold = {'gs': load_gs(args.gs_path, 'x')}
+    else:
+        valid_codes = load_valid_codes(args.codes_path)
+        gold = {'gs': load_gs(args.gs_path, 'f1'),
+                'qrels': load_gs(args.gs_path, 'map')}
+
+    ###### 1. Per-document counts ######
+    run_a = load_units(args.task, gold, args.pred_path, valid_codes)
+    run_b = (load_units(args.task, gold, args.compare_pred_path, valid_codes)
+             if args.compare_pred_path is not None else None)
+
+    ###### 2. Resampling ######
+    results = []
+    for kind in run_a:
+        if run_b is None:
+            units, offset = (prf_units if kind == 'prf' else map_units)(run_a[kind])
+            results.append(bootstrap(units, offset, kind, args.n_resamples,
+                                     args.alpha, args.seed, args.workers))
+        else:
+            if kind == 'prf':
+                units_a, offset_a = prf_units(run_a[kind])
+                units_b, offset_b = prf_units(run_b[kind])
+            else:
+                index = run_a[kind].index.union(run_b[kind].index)
+                units_a, offset_a = map_units(run_a[kind], index)
+                units_b, offset_b = map_units(run_b[kind], index)
+            results.append(randomization_test(units_a, offset_a, units_b, offset_b,
+                                              kind, args.n_resamples, args.seed,
+                                              args.workers))
+
+    ###### 3. Show results ######
+    pd.concat(results, ignore_index=True).to_csv(sys.stdout, sep='\t', index=False,
+                                                 float_format='%.4f')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
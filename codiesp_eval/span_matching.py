@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Interval-matching engine for CodiEsp-X.
+
+A Gold Standard reference is matched when some prediction with the same
+clinical case and code starts at most `tol` characters before the reference
+and ends at most `tol` characters after it. Instead of merging every
+prediction with every reference of its (clinical_case, code) group, the
+predictions are sorted by (group, start) and the candidate predictions of
+each reference are located with binary searches over the sorted offsets.
+
+Discontinuous references ("12 20;35 40") are parsed into flat arrays of
+fragments (parse_positions). By default a reference spans from the start of
+its first fragment to the end of its last one. In strict mode every
+fragment is matched on its own, through the same sorted index of the
+predictions of its clinical case and code, and a reference is matched when
+all its fragments are (all_fragments): a prediction that covers the gap
+between fragments does not match.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Offsets are shifted by this amount before being packed next to the group
+# id, so that negative offsets (start - tol) still sort correctly.
+_OFFSET_SHIFT = 2 ** 31
+
+# Offsets are stored as int32 and packed in the low 32 bits of a key
+MAX_OFFSET = 2 ** 31 - 1
+
+# Required tolerance of the references no prediction covers
+NOT_COVERED = np.iinfo(np.int64).max
+
+# Fragments of the references: those of reference i are
+# start[indptr[i]:indptr[i + 1]] and end[indptr[i]:indptr[i + 1]]
+Fragments = namedtuple('Fragments', ['indptr', 'start', 'end'])
+
+
+def parse_positions(pos):
+    '''
+    DESCRIPTION: Parse the positions of references ("start end", or
+    "start end;start end..." for discontinuous references) into flat arrays
+    of fragments, without a Python loop over the references.
+
+    INPUT:
+        pos: pandas series
+            positions of every reference.
+
+    OUTPUT:
+        fragments: Fragments
+            indptr (int64, one more than references), start and end (int64)
+            of every fragment.
+    '''
+    pos = pd.Series(pos, dtype=object).reset_index(drop=True)
+    if pos.isna().any():
+        raise ValueError('Missing positions in row {}'.format(
+            int(np.flatnonzero(pos.isna().to_numpy())[0])))
+    if pos.shape[0] == 0:
+        return Fragments(np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64),
+                         np.empty(0, dtype=np.int64))
+
+    # All the positions in one buffer, one line per reference. Every
+    # reference has one fragment more than ';' separators.
+    data = bytearray('\n'.join(pos.tolist()).encode('utf-8'))
+    chars = np.frombuffer(data, dtype=np.uint8)
+    is_separator = chars == ord(';')
+    line_start = np.r_[0, np.flatnonzero(chars == ord('\n')) + 1]
+    if line_start[-1] < chars.shape[0]:
+        n_fragments = np.add.reduceat(is_separator, line_start, dtype=np.int64) + 1
+        indptr = np.zeros(pos.shape[0] + 1, dtype=np.int64)
+        np.cumsum(n_fragments, out=indptr[1:])
+
+        # Parse every offset at once (a malformed one fails the whole parse)
+        chars[is_separator] = ord(' ')
+        try:
+            offsets = np.array(data.decode('utf-8', 'replace').split(), dtype=np.int64)
+        except (ValueError, OverflowError):
+            offsets = None
+        if (offsets is not None) and (offsets.shape[0] == 2 * indptr[-1]):
+            return Fragments(indptr, offsets[0::2], offsets[1::2])
+
+    # Locate the malformed positions
+    for row, value in pos.items():
+        try:
+            offsets = [int(offset) for offset in value.replace(';', ' ').split()]
+        except ValueError:
+            offsets = []
+        if ((len(offsets) != 2 * (value.count(';') + 1)) or
+                any(abs(offset) >= 2 ** 63 for offset in offsets)):
+            raise ValueError('Malformed positions in row {}: {!r}'.format(row, value))
+    raise ValueError('Malformed positions')
+
+
+def int32_offsets(values):
+    '''
+    DESCRIPTION: Offsets as an int32 array, checking that they fit in the 32
+    bits they are stored and packed in (see _group_candidates), instead of
+    letting larger offsets wrap around and match other spans.
+
+    INPUT:
+        values: numpy array or pandas series
+            integer offsets.
+
+    OUTPUT:
+        offsets: numpy array
+            int32 offsets.
+    '''
+    values = np.asarray(values, dtype=np.int64)
+    _check_offsets(values)
+    return values.astype(np.int32)
+
+
+def _check_offsets(values, tol=0):
+    '''
+    DESCRIPTION: Raise a ValueError if some offset (minus the tolerance)
+    does not fit in 32 bits.
+    '''
+    if values.shape[0] == 0:
+        return
+    low, high = values.min(), values.max()
+    if (low - tol < -_OFFSET_SHIFT) | (high > MAX_OFFSET):
+        raise ValueError('Offset {} out of range: offsets (minus the error tolerance) must '
+                         'be in [-2**31, 2**31 - 1]'.format(high if high > MAX_OFFSET else low))
+
+
+def all_fragments(is_valid, indptr):
+    '''
+    DESCRIPTION: Whether all the fragments of every reference are matched.
+
+    INPUT:
+        is_valid: numpy array
+            boolean array aligned with the fragments.
+        indptr: numpy array
+            as in Fragments.
+
+    OUTPUT:
+        is_valid: numpy array
+            boolean array aligned with the references.
+    '''
+    if indptr.shape[0] <= 1:
+        return np.zeros(0, dtype=bool)
+    return np.logical_and.reduceat(is_valid, indptr[:-1])
+
+
+def max_fragments(required, indptr):
+    '''
+    DESCRIPTION: Required tolerance of every reference in strict mode: the
+    largest required tolerance of its fragments.
+    '''
+    if indptr.shape[0] <= 1:
+        return np.zeros(0, dtype=np.int64)
+    return np.maximum.reduceat(required, indptr[:-1])
+
+
+def _group_keys(df_gs, df_pred):
+    '''
+    DESCRIPTION: Encode the (clinical_case, code) pair of every GS and
+    prediction row with a dense integer shared by both tables.
+
+    INPUT:
+        df_gs: pandas dataframe
+            with columns clinical_case and code.
+        df_pred: pandas dataframe
+            with columns clinical_case and code.
+
+    OUTPUT:
+        gs_keys: numpy array
+            group id of every GS row.
+        pred_keys: numpy array
+            group id of every prediction row.
+    '''
+    n_gs = df_gs.shape[0]
+    cases = pd.concat([df_gs['clinical_case'], df_pred['clinical_case']],
+                      ignore_index=True)
+    codes = pd.concat([df_gs['code'], df_pred['code']], ignore_index=True)
+
+    # Missing values are factorized to -1, shift them to a group of their own
+    case_ids, case_uniques = pd.factorize(cases)
+    code_ids, code_uniques = pd.factorize(codes)
+    keys = ((case_ids.astype(np.int64) + 1) * (len(code_uniques) + 1) +
+            (code_ids.astype(np.int64) + 1))
+
+    # Make the ids dense so that they can be packed with the offsets
+    _, keys = np.unique(keys, return_inverse=True)
+    keys = keys.astype(np.int64)
+
+    return keys[:n_gs], keys[n_gs:]
+
+
+def _candidates(df_gs, df_pred, tol):
+    '''
+    DESCRIPTION: Locate the candidate predictions of every Gold Standard
+    reference of dataframes (see _group_candidates).
+    '''
+    if (df_gs.shape[0] == 0) | (df_pred.shape[0] == 0) | (tol < 0):
+        return None, None, None
+
+    gs_keys, pred_keys = _group_keys(df_gs, df_pred)
+    return _group_candidates(gs_keys,
+                             df_gs['start_pos_gs'].to_numpy(dtype=np.int64),
+                             df_gs['end_pos_gs'].to_numpy(dtype=np.int64),
+                             pred_keys,
+                             df_pred['start_pos_pred'].to_numpy(dtype=np.int64),
+                             df_pred['end_pos_pred'].to_numpy(dtype=np.int64), tol)
+
+
+def _group_candidates(gs_keys, gs_start, gs_end, pred_keys, pred_start, pred_end, tol):
+    '''
+    DESCRIPTION: Locate the candidate predictions of every Gold Standard
+    reference: same (clinical_case, code) group, starting in
+    [start_pos_gs - tol, start_pos_gs].
+
+    INPUT:
+        gs_keys, pred_keys: numpy arrays
+            dense group id (< 2 ** 31) of every GS and prediction row.
+        gs_start, gs_end, pred_start, pred_end: numpy arrays
+            offsets of every GS and prediction row (checked to fit in 32
+            bits, see int32_offsets).
+        tol: int
+            error tolerance, in characters.
+
+    OUTPUT:
+        ref_idx: numpy array
+            GS row of every candidate (sorted), or None if there are no
+            candidates.
+        start_space: numpy array
+            start_pos_gs - start_pos_pred of every candidate (in [0, tol]).
+        end_space: numpy array
+            end_pos_pred - end_pos_gs of every candidate.
+    '''
+    n_gs = gs_keys.shape[0]
+    if (n_gs == 0) | (pred_keys.shape[0] == 0) | (tol < 0):
+        return None, None, None
+
+    gs_keys = gs_keys.astype(np.int64)
+    pred_keys = pred_keys.astype(np.int64)
+    gs_start = gs_start.astype(np.int64)
+    pred_start = pred_start.astype(np.int64)
+    _check_offsets(gs_start, tol)
+    _check_offsets(pred_start)
+
+    # Sort predictions by group and starting position. Pack both in a single
+    # int64 so that one searchsorted locates a start window inside a group.
+    order = np.lexsort((pred_start, pred_keys))
+    packed_pred = (pred_keys[order] << 32) | (pred_start[order] + _OFFSET_SHIFT)
+    sorted_start = pred_start[order]
+    sorted_end = pred_end[order]
+
+    # Candidate predictions start in [start_pos_gs - tol, start_pos_gs]
+    lo = np.searchsorted(packed_pred,
+                         (gs_keys << 32) | (gs_start - tol + _OFFSET_SHIFT),
+                         side='left')
+    hi = np.searchsorted(packed_pred,
+                         (gs_keys << 32) | (gs_start + _OFFSET_SHIFT),
+                         side='right')
+    n_candidates = hi - lo
+    total = n_candidates.sum()
+    if total == 0:
+        return None, None, None
+
+    # Expand the candidate windows without a Python loop
+    ref_idx = np.repeat(np.arange(n_gs), n_candidates)
+    window_start = np.cumsum(n_candidates) - n_candidates
+    cand_idx = (np.arange(total) - np.repeat(window_start, n_candidates) +
+                np.repeat(lo, n_candidates))
+
+    start_space = gs_start[ref_idx] - sorted_start[cand_idx]
+    end_space = sorted_end[cand_idx].astype(np.int64) - gs_end[ref_idx]
+    return ref_idx, start_space, end_space
+
+
+def gs_groups(gs_keys):
+    '''
+    DESCRIPTION: Dense group ids of the packed (clinical_case, code) keys of
+    the Gold Standard references (see encoding.Encoding).
+
+    INPUT:
+        gs_keys: numpy array
+            key of every GS reference.
+
+    OUTPUT:
+        groups: numpy array
+            sorted distinct keys (group id -> key).
+        gs_group: numpy array
+            group of every GS reference.
+    '''
+    groups = np.unique(gs_keys)
+    return groups, np.searchsorted(groups, gs_keys)
+
+
+def pred_groups(groups, pred_keys):
+    '''
+    DESCRIPTION: Groups of the prediction rows whose (clinical_case, code)
+    pair is in the Gold Standard. Predictions of other pairs can not match
+    any reference and are left out.
+
+    INPUT:
+        groups: numpy array
+            as output by gs_groups.
+        pred_keys: numpy array
+            key of every prediction row.
+
+    OUTPUT:
+        pred_rows: numpy array
+            rows of the predictions whose pair is in the GS.
+        pred_group: numpy array
+            group of every one of those rows.
+    '''
+    if groups.shape[0] == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(groups, pred_keys), groups.shape[0] - 1)
+    pred_rows = np.flatnonzero(groups[pos] == pred_keys)
+    return pred_rows, pos[pred_rows]
+
+
+def match_references(df_gs, df_pred, tol=10):
+    '''
+    DESCRIPTION: Check, for every Gold Standard reference, whether any
+    prediction with the same clinical case and code covers it within the
+    error tolerance.
+
+    A reference is covered when 0 <= start_pos_gs - start_pos_pred <= tol
+    and 0 <= end_pos_pred - end_pos_gs <= tol.
+
+    INPUT:
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function
+            codiespX_evaluation.read_gs.
+        df_pred: pandas dataframe
+            with the predictions. Columns are those output by the function
+            codiespX_evaluation.read_run.
+        tol: int
+            error tolerance, in characters.
+
+    OUTPUT:
+        is_valid: numpy array
+            boolean array aligned with the rows of df_gs.
+    '''
+    return _valid_candidates(df_gs.shape[0], _candidates(df_gs, df_pred, tol), tol)
+
+
+def match_groups(gs_group, gs_start, gs_end, pred_group, pred_start, pred_end, tol=10):
+    '''
+    DESCRIPTION: match_references on integer arrays: dense (clinical_case,
+    code) group ids (as output by gs_groups and pred_groups) and offsets of
+    the GS references and of the predictions.
+
+    OUTPUT:
+        is_valid: numpy array
+            boolean array aligned with the GS references.
+    '''
+    return _valid_candidates(gs_group.shape[0], _group_candidates(
+        gs_group, gs_start, gs_end, pred_group, pred_start, pred_end, tol), tol)
+
+
+def _valid_candidates(n_gs, candidates, tol):
+    '''
+    DESCRIPTION: GS references with a candidate that also ends within the
+    tolerance.
+    '''
+    is_valid = np.zeros(n_gs, dtype=bool)
+    ref_idx, _, end_space = candidates
+    if ref_idx is None:
+        return is_valid
+
+    # Check the end positions of the candidates
+    ok = (end_space >= 0) & (end_space <= tol)
+    is_valid[ref_idx[ok]] = True
+
+    return is_valid
+
+
+def required_tolerance(df_gs, df_pred, max_tol=50):
+    '''
+    DESCRIPTION: Smallest error tolerance with which every Gold Standard
+    reference is covered by a prediction: the minimum, over the predictions
+    of the same clinical case and code that start before and end after the
+    reference, of max(start_space, end_space). A reference is covered with
+    tolerance tol (see match_references) exactly when its required
+    tolerance is <= tol.
+
+    INPUT:
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function
+            codiespX_evaluation.read_gs.
+        df_pred: pandas dataframe
+            with the predictions. Columns are those output by the function
+            codiespX_evaluation.read_run.
+        max_tol: int
+            largest tolerance of interest. Candidates needing more are
+            not looked up.
+
+    OUTPUT:
+        required: numpy array
+            int64 array aligned with the rows of df_gs. References not
+            covered with max_tol get NOT_COVERED.
+    '''
+    return _required_candidates(df_gs.shape[0], _candidates(df_gs, df_pred, max_tol),
+                                max_tol)
+
+
+def required_tolerance_groups(gs_group, gs_start, gs_end, pred_group, pred_start,
+                              pred_end, max_tol=50):
+    '''
+    DESCRIPTION: required_tolerance on integer arrays (see match_groups).
+
+    OUTPUT:
+        required: numpy array
+            int64 array aligned with the GS references.
+    '''
+    return _required_candidates(gs_group.shape[0], _group_candidates(
+        gs_group, gs_start, gs_end, pred_group, pred_start, pred_end, max_tol), max_tol)
+
+
+def _required_candidates(n_gs, candidates, max_tol):
+    '''
+    DESCRIPTION: Smallest tolerance of the candidates of every GS reference.
+    '''
+    required = np.full(n_gs, NOT_COVERED, dtype=np.int64)
+    ref_idx, start_space, end_space = candidates
+    if ref_idx is None:
+        return required
+
+    ok = (end_space >= 0) & (end_space <= max_tol)
+    if not ok.any():
+        return required
+    # Candidates are sorted by reference: reduce every run of a reference
+    ref_idx = ref_idx[ok]
+    needed = np.maximum(start_space[ok], end_space[ok])
+    first = np.flatnonzero(np.r_[True, ref_idx[1:] != ref_idx[:-1]])
+    required[ref_idx[first]] = np.minimum.reduceat(needed, first)
+
+    return required
+
+
+def covered_codes(df_gs, df_pred, tol=10):
+    '''
+    DESCRIPTION: Check which (clinical_case, code) pairs of the Gold Standard
+    are correctly predicted. In case a code has several references, just
+    acknowledging one is enough.
+
+    INPUT:
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function
+            codiespX_evaluation.read_gs.
+        df_pred: pandas dataframe
+            with the predictions. Columns are those output by the function
+            codiespX_evaluation.read_run.
+        tol: int
+            error tolerance, in characters.
+
+    OUTPUT:
+        df_final: pandas dataframe
+            one row per (clinical_case, code) pair in the GS, with columns
+            ['clinical_case', 'code', 'is_valid'].
+    '''
+    return reduce_matches(df_gs, match_references(df_gs, df_pred, tol))
+
+
+def reduce_matches(df_gs, is_valid):
+    '''
+    DESCRIPTION: Reduce the matches of the Gold Standard references to one
+    row per (clinical_case, code) pair. In case a code has several
+    references, just acknowledging one is enough.
+
+    INPUT:
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function
+            codiespX_evaluation.read_gs.
+        is_valid: numpy array
+            boolean array aligned with the rows of df_gs, as output by the
+            function match_references.
+
+    OUTPUT:
+        df_final: pandas dataframe
+            one row per (clinical_case, code) pair in the GS, with columns
+            ['clinical_case', 'code', 'is_valid'].
+    '''
+    df_final = df_gs[['clinical_case', 'code']].copy()
+    df_final['is_valid'] = is_valid
+
+    # In case just one of the references is predicted, mark the code as True
+    df_final = df_final.sort_values(by="is_valid", ascending=True,
+                                    kind='mergesort').drop_duplicates(
+                                        subset=["clinical_case", "code"],
+                                        keep="last")
+    return df_final
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Evaluate a system on every split of every subtask in one invocation.
+
+The Gold Standards are organised as gold/codiesp-{D,P,X}/<split>/<file>.tsv
+(sample, train, dev, test...) and the predictions of a system follow the
+same layout under another root directory. Every (subtask, split) pair found
+in both roots is scored, with every predictions file of the split:
+
+    gold/codiesp-D/dev/devD.tsv     system/codiesp-D/dev/run1.tsv
+    gold/codiesp-X/test/testX.tsv   system/codiesp-X/test/run1.tsv
+    ...
+
+The lists of valid codes are parsed once (CodiEsp-X takes their union) and
+every Gold Standard is compiled once into the memory-mapped cache (see
+gold_cache) before a pool of worker processes scores the pairs
+concurrently. Only the paths of the Gold Standards and runs go through the
+pool: every worker maps a Gold Standard once, for all the runs of its split
+it scores, and reads every run once (see batch.score_run). The output is a
+single table with one row per split, subtask and run. As in batch, a run
+that can not be read gets a row with its error and the command exits with
+status 1.
+
+    codiesp-eval splits -g gold -p system -cD codes-D.tsv -cP codes-P.tsv
+"""
+
+import argparse
+import glob
+import os
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from .batch import INPUT_ERRORS, load_gold, score_run
+from .codes_cache import load_valid_codes
+from .gold_cache import compile_gs
+
+# Subtask -> directory of its Gold Standards and predictions
+TASK_DIRS = {'d': 'codiesp-D', 'p': 'codiesp-P', 'x': 'codiesp-X'}
+
+# Valid codes of every subtask, set in every worker process by _init_worker,
+# and the Gold Standards loaded by the worker
+_shared = {}
+
+# Columns of the output table
+COLUMNS = ['split', 'subtask', 'run', 'P', 'R', 'F1', 'MAP', 'error']
+
+
+def find_pairs(gs_root, pred_root, tasks=('d', 'p', 'x'), splits=None):
+    '''
+    DESCRIPTION: List the (subtask, split) pairs with a Gold Standard and
+    predictions.
+
+    INPUT:
+        gs_root: str
+            directory with the codiesp-{D,P,X}/<split> directories of the
+            Gold Standards (one TSV file per split).
+        pred_root: str
+            directory with the same layout, with the predictions files.
+        tasks: list
+            subtasks to evaluate ('d', 'p', 'x').
+        splits: list
+            splits to evaluate. If None, all the splits found.
+
+    OUTPUT:
+        jobs: list
+            (task, split, gs_path, pred_path) of every predictions file,
+            sorted by split, subtask and predictions file.
+    '''
+    jobs = []
+    for task in tasks:
+        task_dir = os.path.join(gs_root, TASK_DIRS[task])
+        if not os.path.isdir(task_dir):
+            continue
+        for split in sorted(os.listdir(task_dir)):
+            if (not os.path.isdir(os.path.join(task_dir, split))) or (
+                    (splits is not None) and (split not in splits)):
+                continue
+            gs_paths = sorted(glob.glob(os.path.join(task_dir, split, '*.tsv')))
+            if len(gs_paths) != 1:
+                warnings.warn('{} has {} GS files instead of 1. It is not evaluated'.format(
+                    os.path.join(task_dir, split), len(gs_paths)))
+                continue
+            runs = sorted(glob.glob(os.path.join(pred_root, TASK_DIRS[task], split, '*.tsv')))
+            if len(runs) == 0:
+                warnings.warn('No predictions for {}/{}'.format(TASK_DIRS[task], split))
+            jobs.extend((task, split, gs_paths[0], run) for run in runs)
+    if len(jobs) == 0:
+        raise FileNotFoundError('No predictions in {} match a GS in {}'.format(pred_root,
+                                                                              gs_root))
+    order = {task: i for i, task in enumerate(TASK_DIRS)}
+    return sorted(jobs, key=lambda job: (job[1], order[job[0]], job[3]))
+
+
+def load_codes(tasks, codes_d_path=None, codes_p_path=None):
+    '''
+    DESCRIPTION: Parse every list of valid codes once.
+
+    INPUT:
+        tasks: set
+            subtasks to evaluate.
+        codes_d_path: str
+            route to TSV with valid CIE10 Diagnostico codes.
+        codes_p_path: str
+            route to TSV with valid CIE10 Procedimiento codes.
+
+    OUTPUT:
+        valid_codes: dict
+            subtask -> set of valid codes.
+    '''
+    codes = {}
+    if codes_d_path is not None:
+        codes['d'] = load_valid_codes(codes_d_path)
+    if codes_p_path is not None:
+        codes['p'] = load_valid_codes(codes_p_path)
+    for task in sorted(tasks):
+        if task == 'x':
+            if ('d' not in codes) | ('p' not in codes):
+                raise ValueError('CodiEsp-X requires both valid codes lists')
+            codes['x'] = codes['d'].union(codes['p'])
+        elif task not in codes:
+            raise ValueError('CodiEsp-{} requires its valid codes list'.format(task.upper()))
+    return {task: codes[task] for task in tasks}
+
+
+def _init_worker(valid_codes):
+    _shared['valid_codes'] = valid_codes
+    _shared['gold'] = {}
+
+
+def _load_gold(task, gs_path):
+    '''
+    DESCRIPTION: Gold Standard of a split, loaded from the compiled cache the
+    first time a worker scores a run of the split.
+    '''
+    if (task, gs_path) not in _shared['gold']:
+        _shared['gold'][task, gs_path] = load_gold(task, gs_path)
+    return _shared['gold'][task, gs_path]
+
+
+def evaluate_pair(job):
+    '''
+    DESCRIPTION: Score one predictions file against the Gold Standard of
+    its split.
+
+    INPUT:
+        job: tuple
+            (task, split, gs_path, pred_path), as output by find_pairs.
+
+    OUTPUT:
+        row: dict
+            with keys split, subtask, run, P, R, F1, MAP (None for
+            CodiEsp-X) and error (None, or the error of a run that could
+            not be evaluated).
+    '''
+    task, split, gs_path, pred_path = job
+    valid_codes = _shared['valid_codes'][task]
+    row = {'split': split, 'subtask': task.upper(), 'run': os.path.basename(pred_path),
+           'P': None, 'R': None, 'F1': None, 'MAP': None, 'error': None}
+    try:
+        row.update(score_run(task, _load_gold(task, gs_path), pred_path, valid_codes))
+    except INPUT_ERRORS as e:
+        warnings.warn('{} was not evaluated: {}'.format(pred_path, e))
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+    return row
+
+
+def evaluate_splits(jobs, valid_codes, workers=None):
+    '''
+    DESCRIPTION: Score several (subtask, split) pairs in parallel.
+
+    INPUT:
+        jobs: list
+            as output by find_pairs.
+        valid_codes: dict
+            as output by load_codes.
+        workers: int
+            size of the process pool. If None, one worker per CPU.
+
+    OUTPUT:
+        results: pandas dataframe
+            one row per job, with columns
+            ['split', 'subtask', 'run', 'P', 'R', 'F1', 'MAP', 'error'].
+    '''
+    # Every Gold Standard is parsed once, here, and mapped by the workers
+    for gs_path, task in sorted(set((job[2], job[0]) for job in jobs)):
+        compile_gs(gs_path, task)
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+
+    if workers == 1:
+        _init_worker(valid_codes)
+        rows = [evaluate_pair(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(valid_codes,)) as executor:
+            rows = list(executor.map(evaluate_pair, jobs))
+
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def parse_arguments(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+
+    parser = argparse.ArgumentParser(
+        prog='codiesp-eval splits',
+        description='evaluate a system on every split of CodiEsp-D, CodiEsp-P and CodiEsp-X')
+    parser.add_argument("-g", "--gs_root", required = True, dest = "gs_root",
+                        help = "directory with the codiesp-{D,P,X}/<split> GS directories")
+    parser.add_argument("-p", "--pred_root", required = True, dest = "pred_root",
+                        help = "directory with the predictions, in the same layout")
+    parser.add_argument("-cD", "--valid_codes_D_path", dest = "codes_D_path",
+                        help = "path to valid CIE10 Diagnostico codes TSV")
+    parser.add_argument("-cP", "--valid_codes_P_path", dest = "codes_P_path",
+                        help = "path to valid CIE10 Procedimiento codes TSV")
+    parser.add_argument("-t", "--tasks", dest = "tasks", nargs = '+',
+                        choices = ['d', 'p', 'x'], default = ['d', 'p', 'x'],
+                        help = "subtasks to evaluate (default: all)")
+    parser.add_argument("-s", "--splits", dest = "splits", nargs = '+', default = None,
+                        help = "splits to evaluate (default: all)")
+    parser.add_argument("-w", "--workers", dest = "workers", type = int, default = None,
+                        help = "number of worker processes (default: number of CPUs)")
+    parser.add_argument("-o", "--output", dest = "output", default = None,
+                        help = "path to output TSV (default: standard output)")
+
+    args = parser.parse_args(argv)
+    if (args.workers is not None) and (args.workers < 1):
+        parser.error('--workers must be at least 1')
+    if (set(args.tasks) & {'d', 'x'}) and (args.codes_D_path is None):
+        parser.error('CodiEsp-D and CodiEsp-X require --valid_codes_D_path ' +
+                     '(select the subtasks with --tasks)')
+    if (set(args.tasks) & {'p', 'x'}) and (args.codes_P_path is None):
+        parser.error('CodiEsp-P and CodiEsp-X require --valid_codes_P_path ' +
+                     '(select the subtasks with --tasks)')
+
+    return args
+
+
+def main(argv=None):
+
+    args = parse_arguments(argv)
+
+    ###### 0. Find the splits and load valid codes lists: ######
+    jobs = find_pairs(args.gs_root, args.pred_root, args.tasks, args.splits)
+    valid_codes = load_codes(set(job[0] for job in jobs), args.codes_D_path,
+                             args.codes_P_path)
+
+    ###### 1. Evaluate the splits ######
+    results = evaluate_splits(jobs, valid_codes, args.workers)
+
+    ###### 2. Show results ######
+    results.to_csv(args.output if args.output is not None else sys.stdout,
+                   sep='\t', index=False, float_format='%.3f')
+    return 1 if results['error'].notna().any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
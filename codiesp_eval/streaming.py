@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chunked, single-pass readers for prediction files.
+
+Prediction files are read once, in chunks of bounded size. Every chunk is
+validated, lowercased and filtered against the valid codes before it is
+handed to the metric accumulators, so the full predictions table is never
+held in memory.
+"""
+
+import warnings
+
+import pandas as pd
+
+from . import profiling
+
+DEFAULT_CHUNKSIZE = 500000
+
+
+def read_chunks(filepath, names, chunksize=DEFAULT_CHUNKSIZE, file_type='predictions',
+                dtype=None):
+    '''
+    DESCRIPTION: Read a TSV file in chunks, checking the number of columns
+    on the first one.
+
+    INPUT:
+        filepath: str
+            route to TSV file.
+        names: list
+            column names. The file must have exactly len(names) columns.
+        chunksize: int
+            number of rows per chunk.
+        file_type: str
+            name of the file in error messages.
+        dtype: dict
+            column types, by column position.
+
+    OUTPUT:
+        chunks: iterator of pandas dataframes
+            with columns names.
+    '''
+    reader = iter(pd.read_csv(filepath, sep='\t', header=None, chunksize=chunksize,
+                              dtype=dtype))
+    while True:
+        with profiling.stage('read_' + file_type) as record:
+            chunk = next(reader, None)
+            if chunk is None:
+                return
+            record['rows_out'] = chunk.shape[0]
+        if chunk.shape[1] != len(names):
+            raise ImportError('The {} file does not have {} columns. '.format(
+                file_type, len(names)) + 'Then, it was not imported')
+        chunk.columns = names
+        yield chunk
+
+
+def read_predictions(filepath, names, valid_codes, code_column='code',
+                     chunksize=DEFAULT_CHUNKSIZE, check_types=True, dtype=None, stats=None):
+    '''
+    DESCRIPTION: Read a predictions file in chunks, with lowercased codes and
+    only valid codes kept.
+
+    The warnings of the whole-file readers (wrong types, empty file, no valid
+    codes) are raised as well; the last two once the file is exhausted.
+
+    INPUT:
+        filepath: str
+            route to TSV file with Predictions.
+        names: list
+            column names of the predictions file.
+        valid_codes: set
+            set of valid codes of this subtask.
+        code_column: str
+            name of the column with the codes.
+        chunksize: int
+            number of rows per chunk.
+        check_types: bool
+            whether to warn when some column is not read as text.
+        dtype: dict
+            column types, by column name.
+        stats: dict
+            if given, the number of rows (n_rows) and valid rows (n_valid)
+            and whether some column was not read as text (wrong_types) are
+            stored in it, and the warnings are left to the caller (see
+            warn_predictions). Used to read a file in several pieces.
+
+    OUTPUT:
+        chunks: iterator of pandas dataframes
+            with columns names.
+    '''
+    # Codes are always text (some procedure codes only contain digits)
+    dtype = dict(dtype or {}, **{code_column: str})
+    dtype = {names.index(k): v for k, v in dtype.items()}
+
+    n_rows = 0
+    n_valid = 0
+    wrong_types = False
+    for chunk in read_chunks(filepath, names, chunksize, dtype=dtype):
+        if check_types & (wrong_types == False) & any(chunk.dtypes != object):
+            wrong_types = True
+            if stats is None:
+                warnings.warn('The predictions file has wrong types')
+        n_rows += chunk.shape[0]
+
+        with profiling.stage('filter_valid_codes', chunk.shape[0]) as record:
+            chunk[code_column] = chunk[code_column].str.lower()
+            chunk = chunk[chunk[code_column].isin(valid_codes)]
+            record['rows_out'] = chunk.shape[0]
+        n_valid += chunk.shape[0]
+        yield chunk
+
+    if stats is None:
+        warn_predictions(n_rows, n_valid)
+    else:
+        stats.update(n_rows=n_rows, n_valid=n_valid, wrong_types=wrong_types)
+
+
+def warn_predictions(n_rows, n_valid, wrong_types=False):
+    '''
+    DESCRIPTION: Warnings of a predictions file with n_rows rows, n_valid of
+    them with valid codes (see read_predictions).
+    '''
+    if wrong_types:
+        warnings.warn('The predictions file has wrong types')
+    if n_rows == 0:
+        warnings.warn('The predictions file is empty')
+    elif n_valid == 0:
+        warnings.warn('None of the predicted codes are considered valid codes')
+
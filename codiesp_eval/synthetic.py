@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic CodiEsp corpora.
+
+A corpus has the same files as the CodiEsp track, in the same formats: the
+lists of valid codes (code, Spanish and English descriptions), the
+CodiEsp-D/P Gold Standards and predictions (clinical case, code) and the
+CodiEsp-X Gold Standard (clinical case, label, code, reference, positions)
+and predictions (clinical case, positions, label, code). The same parameters
+and seed always produce the same files.
+
+Usage:
+    python -m codiesp_eval.synthetic -o /path/to/corpus --n_docs 10000
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from .span_matching import parse_positions
+
+# Characters of ICD-10-PCS codes (no I nor O)
+_PCS_CHARS = np.array(list('0123456789ABCDEFGHJKLMNPQRSTUVWXYZ'))
+
+
+def make_code_lists(n_codes=5000, seed=0):
+    '''
+    DESCRIPTION: Synthetic lists of valid CIE10 Diagnostico and
+    Procedimiento codes, with ICD-10-like structure: diagnoses are a letter,
+    two digits and an optional subcode (A01, A01.2, ...); procedures have 7
+    characters.
+
+    INPUT:
+        n_codes: int
+            number of codes of every list.
+        seed: int
+            random seed.
+
+    OUTPUT:
+        codes_D, codes_P: numpy arrays
+            uppercase codes.
+    '''
+    rng = np.random.default_rng(seed)
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    categories = np.char.add(np.repeat(letters, 100),
+                             np.char.zfill(np.tile(np.arange(100), 26).astype(str), 2))
+    subcodes = np.char.add(np.repeat(categories, 10),
+                           np.char.add('.', np.tile(np.arange(10), categories.size).astype(str)))
+    all_d = np.concatenate([categories, subcodes])
+    codes_D = np.sort(rng.choice(all_d, size=min(n_codes, all_d.size), replace=False))
+
+    codes_P = np.array([], dtype=str)
+    while codes_P.size < n_codes:
+        chars = _PCS_CHARS[rng.integers(0, _PCS_CHARS.size, (n_codes, 7))]
+        new = np.array([''.join(row) for row in chars])
+        codes_P = np.unique(np.concatenate([codes_P, new]))
+    codes_P = np.sort(rng.choice(codes_P, size=n_codes, replace=False))
+
+    return codes_D, codes_P
+
+
+def make_corpus(n_docs, codes_per_doc=8, refs_per_code=2, n_codes=5000,
+                p_procedure=0.3, discontinuous=0.1, invalid=0.02, recall=0.8,
+                false_positives=0.25, noise=1.0, tol=10, doc_length=5000, seed=0):
+    '''
+    DESCRIPTION: Build a synthetic corpus: valid codes lists, Gold Standards
+    and predictions of the three subtasks.
+
+    INPUT:
+        n_docs: int
+            number of clinical cases.
+        codes_per_doc: int
+            number of codes annotated in every clinical case (drawn with
+            replacement, so a few may repeat).
+        refs_per_code: int
+            maximum number of references (CodiEsp-X) of every code; the
+            number of references is uniform in [1, refs_per_code].
+        n_codes: int
+            size of every valid codes list.
+        p_procedure: float
+            fraction of codes that are procedures.
+        discontinuous: float
+            fraction of references with two fragments ("s1 e1;s2 e2").
+        invalid: float
+            fraction of prediction rows with a code outside the lists.
+        recall: float
+            probability that a GS code (D/P) or reference (X) is predicted.
+        false_positives: float
+            extra random predictions, as a fraction of the GS rows.
+        noise: float
+            CodiEsp-X offset noise, in units of tol: predicted start and end
+            offsets are shifted by a uniform integer in [-noise*tol, noise*tol].
+        tol: int
+            error tolerance the noise is relative to.
+        doc_length: int
+            length of the clinical cases, in characters.
+        seed: int
+            random seed.
+
+    OUTPUT:
+        corpus: dict of pandas dataframes
+            'codes_D', 'codes_P', 'gs_D', 'gs_P', 'gs_X', 'pred_D',
+            'pred_P', 'pred_X', with the columns of the files (see
+            write_corpus).
+    '''
+    rng = np.random.default_rng(seed)
+    codes_D, codes_P = make_code_lists(n_codes, seed)
+    doc_names = np.array(['S0000-0000{:010d}-1'.format(i) for i in range(n_docs)],
+                         dtype=object)
+    labels = np.array(['DIAGNOSTICO', 'PROCEDIMIENTO'], dtype=object)
+
+    # GS codes: clinical case, label and code of every (case, code) annotation
+    n_pairs = n_docs * codes_per_doc
+    pair_doc = np.repeat(np.arange(n_docs), codes_per_doc)
+    is_proc = rng.random(n_pairs) < p_procedure
+    pair_code = np.where(is_proc, codes_P[rng.integers(0, codes_P.size, n_pairs)],
+                         codes_D[rng.integers(0, codes_D.size, n_pairs)]).astype(object)
+
+    # References of every annotation (CodiEsp-X)
+    n_refs_per_pair = rng.integers(1, refs_per_code + 1, n_pairs)
+    ref_pair = np.repeat(np.arange(n_pairs), n_refs_per_pair)
+    n_refs = ref_pair.size
+    start = rng.integers(0, doc_length, n_refs)
+    end = start + rng.integers(3, 40, n_refs)
+    # Discontinuous references: a second fragment after a gap
+    is_disc = rng.random(n_refs) < discontinuous
+    start2 = end + rng.integers(1, 20, n_refs)
+    end2 = start2 + rng.integers(3, 20, n_refs)
+    pos = _positions(start, end)
+    pos[is_disc] = pos[is_disc] + ';' + _positions(start2[is_disc], end2[is_disc])
+    last_end = np.where(is_disc, end2, end)
+
+    ref_doc = pair_doc[ref_pair]
+    ref_proc = is_proc[ref_pair]
+    gs_X = pd.DataFrame({'clinical_case': doc_names[ref_doc],
+                         'label': labels[ref_proc.astype(int)],
+                         'code': pair_code[ref_pair],
+                         'ref': 'referencia',
+                         'pos': pos})
+
+    gs_pairs = pd.DataFrame({'doc': pair_doc, 'code': pair_code, 'is_proc': is_proc})
+    gs_pairs = gs_pairs.drop_duplicates(subset=['doc', 'code'])
+    gs_pairs_D = gs_pairs[~gs_pairs['is_proc']]
+    gs_pairs_P = gs_pairs[gs_pairs['is_proc']]
+
+    # CodiEsp-D/P predictions: found GS codes and false positives, ranked
+    # in random order inside every clinical case
+    gs, preds = {}, {}
+    for suffix, pairs, codes in (('D', gs_pairs_D, codes_D), ('P', gs_pairs_P, codes_P)):
+        gs['gs_' + suffix] = pd.DataFrame({'clinical_case': doc_names[pairs['doc'].to_numpy()],
+                                           'code': pairs['code'].to_numpy()})
+        found = rng.random(pairs.shape[0]) < recall
+        n_fp = int(round(false_positives * pairs.shape[0]))
+        doc = np.concatenate([pairs['doc'].to_numpy()[found], rng.integers(0, n_docs, n_fp)])
+        code = np.concatenate([pairs['code'].to_numpy()[found],
+                               codes[rng.integers(0, codes.size, n_fp)].astype(object)])
+        order = _shuffle_within_cases(doc, rng)
+        preds['pred_' + suffix] = pd.DataFrame({
+            'clinical_case': doc_names[doc[order]],
+            'code': _make_invalid(code[order], rng, invalid)})
+
+    # CodiEsp-X predictions: found references with offset noise (covering
+    # the first and last fragment) and false positives
+    found = rng.random(n_refs) < recall
+    shift = int(round(noise * tol))
+    p_start = start[found] + rng.integers(-shift, shift + 1, found.sum())
+    p_end = last_end[found] + rng.integers(-shift, shift + 1, found.sum())
+    p_start = np.maximum(p_start, 0)
+    p_end = np.maximum(p_end, p_start + 1)
+    n_fp = int(round(false_positives * n_refs))
+    fp_proc = rng.random(n_fp) < p_procedure
+    fp_start = rng.integers(0, doc_length, n_fp)
+    fp_end = fp_start + rng.integers(3, 40, n_fp)
+    fp_code = np.where(fp_proc, codes_P[rng.integers(0, codes_P.size, n_fp)],
+                       codes_D[rng.integers(0, codes_D.size, n_fp)]).astype(object)
+    doc = np.concatenate([ref_doc[found], rng.integers(0, n_docs, n_fp)])
+    proc = np.concatenate([ref_proc[found], fp_proc])
+    code = np.concatenate([pair_code[ref_pair][found], fp_code])
+    order = _shuffle_within_cases(doc, rng)
+    pred_X = pd.DataFrame({'clinical_case': doc_names[doc[order]],
+                           'pos': _positions(np.concatenate([p_start, fp_start])[order],
+                                             np.concatenate([p_end, fp_end])[order]),
+                           'label': labels[proc[order].astype(int)],
+                           'code': _make_invalid(code[order], rng, invalid)})
+
+    code_lists = {'codes_' + k: pd.DataFrame({'code': v, 'es': 'descripción',
+                                              'en': 'description'})
+                  for k, v in (('D', codes_D), ('P', codes_P))}
+    return dict(code_lists, **gs, gs_X=gs_X, **preds, pred_X=pred_X)
+
+
+def _positions(start, end):
+    '''
+    DESCRIPTION: "start end" strings of arrays of offsets.
+    '''
+    return np.array(['{} {}'.format(s, e) for s, e in zip(start.tolist(), end.tolist())],
+                    dtype=object)
+
+
+def _shuffle_within_cases(doc, rng):
+    '''
+    DESCRIPTION: Order of the rows that keeps the clinical cases sorted and
+    shuffles the rows inside every clinical case.
+    '''
+    return np.lexsort((rng.random(doc.size), doc))
+
+
+def _make_invalid(code, rng, invalid):
+    '''
+    DESCRIPTION: Replace a fraction of the codes by codes outside the lists.
+    '''
+    code = code.copy()
+    is_invalid = rng.random(code.size) < invalid
+    code[is_invalid] = ['XX{}'.format(i) for i in range(is_invalid.sum())]
+    return code
+
+
+def to_frames(corpus, subtask):
+    '''
+    DESCRIPTION: GS and predictions of a subtask as the readers of the
+    evaluation return them: lowercased codes, only valid codes in the
+    predictions and, for CodiEsp-X, parsed offsets.
+
+    INPUT:
+        corpus: dict
+            as output by make_corpus.
+        subtask: str
+            'd', 'p' or 'x'.
+
+    OUTPUT:
+        df_gs, df_pred: pandas dataframes
+    '''
+    if subtask == 'x':
+        valid = set(np.char.lower(np.concatenate([corpus['codes_D']['code'].to_numpy(),
+                                                  corpus['codes_P']['code'].to_numpy()])
+                                  .astype(str)))
+        df_gs = corpus['gs_X'].rename(columns={'label': 'label_gs', 'pos': 'pos_gs'})
+        df_gs['code'] = df_gs['code'].str.lower()
+        fragments = parse_positions(df_gs['pos_gs'])
+        df_gs['start_pos_gs'] = fragments.start[fragments.indptr[:-1]]
+        df_gs['end_pos_gs'] = fragments.end[fragments.indptr[1:] - 1]
+        df_pred = corpus['pred_X'].rename(columns={'label': 'label_pred'})
+        df_pred['code'] = df_pred['code'].str.lower()
+        df_pred = df_pred[df_pred['code'].isin(valid)]
+        pos = df_pred['pos'].str.split(' ', n=1, expand=True)
+        df_pred = df_pred.drop('pos', axis=1).assign(start_pos_pred=pos[0].astype(int),
+                                                     end_pos_pred=pos[1].astype(int))
+        return df_gs, df_pred.reset_index(drop=True)
+
+    suffix = subtask.upper()
+    valid = set(corpus['codes_' + suffix]['code'].str.lower())
+    df_gs = corpus['gs_' + suffix].assign(code=lambda df: df['code'].str.lower())
+    df_pred = corpus['pred_' + suffix].assign(code=lambda df: df['code'].str.lower())
+    return df_gs, df_pred[df_pred['code'].isin(valid)].reset_index(drop=True)
+
+
+def write_corpus(corpus, out_dir):
+    '''
+    DESCRIPTION: Write a corpus as headerless TSV files, in the formats of
+    the CodiEsp track: codes_D.tsv, codes_P.tsv, gs_D.tsv, gs_P.tsv,
+    gs_X.tsv, pred_D.tsv, pred_P.tsv and pred_X.tsv.
+
+    OUTPUT:
+        paths: dict
+            route of every file, by name.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name, df in corpus.items():
+        paths[name] = os.path.join(out_dir, name + '.tsv')
+        df.to_csv(paths[name], sep='\t', header=False, index=False)
+    return paths
+
+
+def parse_arguments(argv=None):
+    '''
+    DESCRIPTION: Parse command line arguments
+    '''
+    parser = argparse.ArgumentParser(description='process user given parameters')
+    parser.add_argument("-o", "--output_dir", required = True, dest = "output_dir",
+                        help = "directory where the corpus is written")
+    parser.add_argument("-n", "--n_docs", dest = "n_docs", type = int, default = 1000,
+                        help = "number of clinical cases")
+    parser.add_argument("--codes_per_doc", dest = "codes_per_doc", type = int, default = 8,
+                        help = "codes annotated per clinical case")
+    parser.add_argument("--refs_per_code", dest = "refs_per_code", type = int, default = 2,
+                        help = "maximum references per code (CodiEsp-X)")
+    parser.add_argument("--n_codes", dest = "n_codes", type = int, default = 5000,
+                        help = "size of every valid codes list")
+    parser.add_argument("--discontinuous", dest = "discontinuous", type = float,
+                        default = 0.1, help = "fraction of discontinuous references")
+    parser.add_argument("--invalid", dest = "invalid", type = float, default = 0.02,
+                        help = "fraction of predictions with invalid codes")
+    parser.add_argument("--recall", dest = "recall", type = float, default = 0.8,
+                        help = "probability that a GS code or reference is predicted")
+    parser.add_argument("--false_positives", dest = "false_positives", type = float,
+                        default = 0.25, help = "extra random predictions per GS row")
+    parser.add_argument("--noise", dest = "noise", type = float, default = 1.0,
+                        help = "CodiEsp-X offset noise, in units of --tol")
+    parser.add_argument("--tol", dest = "tol", type = int, default = 10,
+                        help = "error tolerance the noise is relative to")
+    parser.add_argument("-s", "--seed", dest = "seed", type = int, default = 0,
+                        help = "random seed")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    args = parse_arguments(argv)
+
+    corpus = make_corpus(args.n_docs, args.codes_per_doc, args.refs_per_code,
+                         args.n_codes, discontinuous=args.discontinuous,
+                         invalid=args.invalid, recall=args.recall,
+                         false_positives=args.false_positives, noise=args.noise,
+                         tol=args.tol, seed=args.seed)
+    for name, path in write_corpus(corpus, args.output_dir).items():
+        print('{}\t{}\t{}'.format(name, corpus[name].shape[0], path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Jan  8 16:11:51 2020
+
+@author: antonio
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from . import profiling
+from .encoding import DistinctKeys, Encoding, span_counts
+from .error_analysis import analyse_spans
+from .hierarchy import DEFAULT_LEVELS, PrefixIndex, parse_level
+from .metrics import Counts, compute_metrics
+from .span_matching import (NOT_COVERED, all_fragments, gs_groups, int32_offsets,
+                            match_groups, max_fragments, parse_positions, pred_groups,
+                            reduce_matches, required_tolerance_groups)
+from .streaming import DEFAULT_CHUNKSIZE, read_predictions
+
+# Gold Standard of an evaluation, encoded once: packed (clinical_case, code)
+# key of every reference, and dense group and int32 offsets of every
+# matched span: the references, or in strict mode their fragments (indptr
+# gives the fragments of every reference, None otherwise)
+EncodedGS = namedtuple('EncodedGS', ['encoding', 'keys', 'groups', 'group',
+                                     'start', 'end', 'indptr'])
+
+def read_gs(filepath, gs_headers=["clinical_case","label_gs", "code", "ref", "pos_gs"]):
+    '''
+    DESCRIPTION: Load Gold Standard table
+    
+    INPUT: 
+        filepath: str
+            route to TSV file with Gold Standard.
+    
+    OUTPUT: 
+        gs_data: pandas dataframe
+            with columns:['clinical_case','label_gs','code','ref','pos_gs',
+                          'start_pos_gs','end_pos_gs']
+    '''
+    # Check GS format:
+    check = pd.read_csv(filepath, sep='\t', header = None, nrows=1)
+    if check.shape[1] != 5:
+        raise ImportError('The GS file does not have 4 columns. Then, it was not imported')
+    
+    gs_data = pd.read_csv(filepath, sep="\t", names=gs_headers)
+    gs_data.code = gs_data.code.str.lower()
+    
+    # In case there are discontinuous annotations, just keep the first and 
+    # last offset and consider everything in between as part of the reference
+    # (the fragments are parsed again by the strict mode, see encode_gs).
+    fragments = parse_positions(gs_data['pos_gs'])
+    gs_data['start_pos_gs'] = fragments.start[fragments.indptr[:-1]]
+    gs_data['end_pos_gs'] = fragments.end[fragments.indptr[1:] - 1]
+    
+    return gs_data
+
+def iter_run(filepath, valid_codes, chunksize=DEFAULT_CHUNKSIZE,
+             run_headers=["clinical_case","pos_pred","label_pred", "code"], stats=None):
+    '''
+    DESCRIPTION: Load Predictions table in chunks. The file is read once:
+    every chunk is validated, lowercased, filtered and its positions are
+    split before the next one is read.
+        
+    INPUT: 
+        filepath: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        chunksize: int
+            number of rows per chunk.
+        stats: dict
+            as taken by streaming.read_predictions.
+    
+    OUTPUT: 
+        chunks: iterator of pandas dataframes
+            with columns:[clinical_case, label_pred, code, start_pos_pred, end_pos_pred]
+    '''
+    for run_data in read_predictions(filepath, run_headers, valid_codes,
+                                     chunksize=chunksize, stats=stats):
+        # Split position into starting and end positions
+        with profiling.stage('split_positions', run_data.shape[0]):
+            pos = (run_data['pos_pred'].str.split(' ', n=1, expand=True)
+                   .reindex(columns=[0, 1]))
+            run_data = run_data.drop("pos_pred", axis=1)
+            run_data['start_pos_pred'] = pos[0].astype("int")
+            run_data['end_pos_pred'] = pos[1].astype("int")
+        yield run_data
+
+def read_run(filepath, valid_codes, chunksize=DEFAULT_CHUNKSIZE,
+             run_headers=["clinical_case","pos_pred","label_pred", "code"]):
+    '''
+    DESCRIPTION: Load Predictions table
+        
+    INPUT: 
+        filepath: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        chunksize: int
+            number of rows read at once.
+    
+    OUTPUT: 
+        run_data: pandas dataframe
+            with columns:[clinical_case, label_pred, code, start_pos_pred, end_pos_pred]
+    '''
+    return pd.concat(list(iter_run(filepath, valid_codes, chunksize, run_headers)))
+
+def calculate_metrics(df_gs, df_pred, tol = 10, strict=False):
+    '''       
+    DESCRIPTION: Calculate task X metrics:
+    
+    Two type of metrics are calculated: per document and micro-average.
+    In case a code has several references, just acknowledging one is enough.
+    In case of discontinuous references, the reference is considered to 
+    start and the start position of the first part of the reference and to 
+    end at the final position of the last part of the reference.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        df_pred: pandas dataframe
+            with the predictions. Columns are those output by the function read_run.
+        tol: int
+            error tolerance, in characters.
+        strict: bool
+            if True, every fragment of a discontinuous reference has to be
+            matched (see span_matching).
+    
+    OUTPUT: 
+        P_per_cc: pandas series
+            Precision per clinical case (index contains clinical case names)
+        P: float
+            Micro-average precision
+        R_per_cc: pandas series
+            Recall per clinical case (index contains clinical case names)
+        R: float
+            Micro-average recall
+        F1_per_cc: pandas series
+            F-score per clinical case (index contains clinical case names)
+        F1: float
+            Micro-average F-score
+    '''
+    
+    # Check if GS references are inside predicted intervals. Predictions not
+    # in GS are never candidates, and codes with several references in GS
+    # are marked as True when just one of the references is predicted
+    gs = encode_gs(df_gs, strict=strict)
+    pred_keys, spans = encode_predictions(gs, df_pred)
+    is_valid = matched_references(gs, match_groups(gs.group, gs.start, gs.end, *spans, tol))
+    
+    return compute_metrics(count_encoded(df_gs, gs, is_valid, pred_keys))
+
+def count_run(df_gs, pred_path, valid_codes, tol = 10, chunksize=DEFAULT_CHUNKSIZE,
+              strict=False):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives of a predictions file, reading it in chunks. Every chunk is 
+    matched against the GS as soon as it is read; only the matched GS 
+    references and the distinct (clinical_case, code) pairs of the 
+    predictions are kept in memory.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        tol: int
+            error tolerance, in characters.
+        chunksize: int
+            number of rows read at once.
+        strict: bool
+            if True, every fragment of a discontinuous reference has to be
+            matched.
+    
+    OUTPUT: 
+        counts: metrics.Counts
+    '''
+    gs = encode_gs(df_gs, valid_codes, strict)
+    is_valid = np.zeros(gs.start.shape[0], dtype=bool)
+    pairs = DistinctKeys()
+    for chunk in iter_run(pred_path, valid_codes, chunksize):
+        with profiling.stage('match_references', chunk.shape[0]):
+            pred_keys, spans = encode_predictions(gs, chunk)
+            is_valid |= match_groups(gs.group, gs.start, gs.end, *spans, tol)
+        pairs.update(pred_keys)
+    
+    with profiling.stage('calculate_counts', pairs.keys.shape[0]):
+        return count_encoded(df_gs, gs, matched_references(gs, is_valid), pairs.keys)
+
+def analyse_run(df_gs, pred_path, valid_codes, tol = 10, chunksize=DEFAULT_CHUNKSIZE,
+                strict=False, code_types=None):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives of a predictions file, as count_run, and analyse its errors
+    per code (see error_analysis). The keys and offsets of the valid 
+    prediction rows are kept to list the spans of the False Positives.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        tol: int
+            error tolerance, in characters.
+        chunksize: int
+            number of rows read at once.
+        strict: bool
+            if True, every fragment of a discontinuous reference has to be
+            matched.
+        code_types: dict
+            type name -> set of codes (DIAGNOSTICO and PROCEDIMIENTO), or None.
+    
+    OUTPUT: 
+        counts: metrics.Counts
+        analysis: error_analysis.ErrorAnalysis
+    '''
+    gs = encode_gs(df_gs, valid_codes, strict)
+    is_valid = np.zeros(gs.start.shape[0], dtype=bool)
+    pairs = DistinctKeys()
+    rows = []
+    for chunk in iter_run(pred_path, valid_codes, chunksize):
+        with profiling.stage('match_references', chunk.shape[0]):
+            pred_keys, spans = encode_predictions(gs, chunk)
+            is_valid |= match_groups(gs.group, gs.start, gs.end, *spans, tol)
+        pairs.update(pred_keys)
+        rows.append((pred_keys, int32_offsets(chunk['start_pos_pred']),
+                     int32_offsets(chunk['end_pos_pred'])))
+    is_valid = matched_references(gs, is_valid)
+    
+    with profiling.stage('calculate_counts', pairs.keys.shape[0]):
+        counts = count_encoded(df_gs, gs, is_valid, pairs.keys)
+    pred_keys, pred_start, pred_end = (
+        [np.concatenate([r[i] for r in rows]) if rows else np.empty(0, dtype=dtype)
+         for i, dtype in enumerate([np.int64, np.int32, np.int32])])
+    with profiling.stage('error_analysis', pred_keys.shape[0]):
+        analysis = analyse_spans(gs.encoding, gs.keys, is_valid, df_gs, pred_keys,
+                                 pred_start, pred_end, code_types)
+    return counts, analysis
+
+def count_run_levels(df_gs, pred_path, valid_codes, levels=DEFAULT_LEVELS, tol = 10,
+                     chunksize=DEFAULT_CHUNKSIZE, strict=False):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives of a predictions file at several granularity levels (see
+    hierarchy), reading it once. Codes are replaced by their prefix at 
+    every level: a GS reference is matched at the category level by a
+    prediction of any code of the same category that covers it.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        levels: list
+            granularity levels, as taken by hierarchy.parse_level.
+        tol: int
+            error tolerance, in characters.
+        chunksize: int
+            number of rows read at once.
+        strict: bool
+            if True, every fragment of a discontinuous reference has to be
+            matched.
+    
+    OUTPUT: 
+        counts: dict
+            level name -> metrics.Counts, in the order of levels.
+    '''
+    names, lengths = zip(*map(parse_level, levels))
+    gs = encode_gs(df_gs, valid_codes, strict)
+    index = PrefixIndex(lengths)
+    level_gs = []
+    for level in range(len(names)):
+        keys = index.map_keys(gs.encoding, gs.keys, level)
+        groups, group = gs_groups(keys)
+        if gs.indptr is not None:
+            group = np.repeat(group, np.diff(gs.indptr))
+        level_gs.append(gs._replace(keys=keys, groups=groups, group=group))
+    is_valid = [np.zeros(gs.start.shape[0], dtype=bool) for _ in names]
+    pairs = DistinctKeys()
+    for chunk in iter_run(pred_path, valid_codes, chunksize):
+        with profiling.stage('match_references', chunk.shape[0]):
+            pred_keys = gs.encoding.encode(chunk)
+            for level, lgs in enumerate(level_gs):
+                spans = prediction_spans(lgs, index.map_keys(gs.encoding, pred_keys, level),
+                                         chunk)
+                is_valid[level] |= match_groups(lgs.group, lgs.start, lgs.end, *spans, tol)
+        pairs.update(pred_keys)
+    
+    counts = {}
+    with profiling.stage('calculate_counts', pairs.keys.shape[0] * len(names)):
+        for level, name in enumerate(names):
+            is_valid[level] = matched_references(gs, is_valid[level])
+            pred_keys = index.map_keys(gs.encoding, pairs.keys, level)
+            if gs.encoding.has_missing:
+                df_level = df_gs.assign(code=index.decode(gs.encoding, level_gs[level].keys,
+                                                          level)['code'].to_numpy())
+                counts[name] = calculate_counts(
+                    df_level, index.decode(gs.encoding, pd.unique(pred_keys), level),
+                    reduce_matches(df_level, is_valid[level]))
+            else:
+                counts[name] = span_counts(gs.encoding, level_gs[level].keys,
+                                           is_valid[level], pred_keys)
+    return counts
+
+def encode_gs(df_gs, valid_codes=None, strict=False):
+    '''
+    DESCRIPTION: Encode the Gold Standard of an evaluation (see
+    encoding.Encoding).
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        valid_codes: set
+            set of valid codes of this subtask (code vocabulary), or None.
+        strict: bool
+            if True, the fragments of the references (column pos_gs) are
+            matched instead of the references.
+    
+    OUTPUT: 
+        gs: EncodedGS
+    '''
+    encoding = Encoding(valid_codes, df_gs['clinical_case'], df_gs['code'])
+    keys = encoding.encode(df_gs)
+    groups, group = gs_groups(keys)
+    if not strict:
+        return EncodedGS(encoding, keys, groups, group,
+                         int32_offsets(df_gs['start_pos_gs']),
+                         int32_offsets(df_gs['end_pos_gs']), None)
+    
+    fragments = parse_positions(df_gs['pos_gs'])
+    return EncodedGS(encoding, keys, groups, np.repeat(group, np.diff(fragments.indptr)),
+                     int32_offsets(fragments.start), int32_offsets(fragments.end),
+                     fragments.indptr)
+
+def matched_references(gs, is_valid):
+    '''
+    DESCRIPTION: Whether every GS reference is matched, from the matches of
+    the spans of an encoded GS (in strict mode, all the fragments of a
+    reference have to be matched).
+    '''
+    if gs.indptr is None:
+        return is_valid
+    return all_fragments(is_valid, gs.indptr)
+
+def encode_predictions(gs, df_pred):
+    '''
+    DESCRIPTION: Encode predictions with the vocabularies of an encoded Gold
+    Standard. 
+    
+    INPUT: 
+        gs: EncodedGS
+            as output by encode_gs.
+        df_pred: pandas dataframe
+            with the predictions. Columns are those output by the function read_run.
+    
+    OUTPUT: 
+        pred_keys: numpy array
+            key of every prediction row.
+        spans: tuple
+            group, start and end offsets of the predictions whose
+            (clinical_case, code) pair is in the GS, as taken by
+            span_matching.match_groups.
+    '''
+    pred_keys = gs.encoding.encode(df_pred)
+    return pred_keys, prediction_spans(gs, pred_keys, df_pred)
+
+def prediction_spans(gs, pred_keys, df_pred):
+    '''
+    DESCRIPTION: Group, start and end offsets of the predictions whose key
+    is a key of an encoded GS (see encode_predictions).
+    '''
+    rows, group = pred_groups(gs.groups, pred_keys)
+    start = int32_offsets(df_pred['start_pos_pred'])[rows]
+    end = int32_offsets(df_pred['end_pos_pred'])[rows]
+    return group, start, end
+
+def count_encoded(df_gs, gs, is_valid, pred_keys):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives from the matched GS references and the prediction keys. When a
+    clinical case or code is missing, the predictions are decoded and
+    counted by calculate_counts.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        gs: EncodedGS
+            as output by encode_gs.
+        is_valid: numpy array
+            whether every GS reference is matched.
+        pred_keys: numpy array
+            keys of the predictions.
+    
+    OUTPUT: 
+        counts: metrics.Counts
+    '''
+    if gs.encoding.has_missing:
+        return calculate_counts(df_gs, gs.encoding.decode(pd.unique(pred_keys)),
+                                reduce_matches(df_gs, is_valid))
+    return span_counts(gs.encoding, gs.keys, is_valid, pred_keys)
+
+def calculate_counts(df_gs, df_pred, df_final):
+    '''
+    DESCRIPTION: Count True Positives, Predicted Positives and Gold Standard
+    Positives, per document and in total.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        df_pred: pandas dataframe
+            with (at least) the distinct (clinical_case, code) pairs of the
+            predictions.
+        df_final: pandas dataframe
+            one row per (clinical_case, code) pair of the GS, telling whether
+            it was correctly predicted. As output by span_matching.covered_codes.
+    
+    OUTPUT: 
+        counts: metrics.Counts
+    '''
+    
+    # Predicted Positives:
+    Pred_Pos_per_cc = df_pred.drop_duplicates(subset=['clinical_case', 
+                                                  "code"]).groupby("clinical_case")["code"].count()
+    Pred_Pos = df_pred.drop_duplicates(subset=['clinical_case', "code"]).shape[0]
+    
+    # Gold Standard Positives:
+    GS_Pos_per_cc = df_gs.drop_duplicates(subset=['clinical_case', 
+                                               "code"]).groupby("clinical_case")["code"].count()
+    GS_Pos = df_gs.drop_duplicates(subset=['clinical_case', "code"]).shape[0]
+    
+    # True Positives:
+    TP_per_cc = (df_final[df_final["is_valid"] == True]
+                 .groupby("clinical_case")["is_valid"].count())
+    TP = df_final[df_final["is_valid"] == True].shape[0]
+    
+    # Add entries for clinical cases that are not in predictions but are present
+    # in the GS
+    cc_not_predicted = (df_pred.drop_duplicates(subset=["clinical_case"])
+                        .merge(df_gs.drop_duplicates(subset=["clinical_case"]), 
+                              on='clinical_case',
+                              how='right', indicator=True)
+                        .query('_merge == "right_only"')
+                        .drop('_merge', axis=1))['clinical_case'].to_list()
+    for cc in cc_not_predicted:
+        TP_per_cc[cc] = 0
+    
+    # Remove entries for clinical cases that are not in GS but are present
+    # in the predictions
+    cc_not_GS = (df_gs.drop_duplicates(subset=["clinical_case"])
+                .merge(df_pred.drop_duplicates(subset=["clinical_case"]), 
+                      on='clinical_case',
+                      how='right', indicator=True)
+                .query('_merge == "right_only"')
+                .drop('_merge', axis=1))['clinical_case'].to_list()
+    Pred_Pos_per_cc = Pred_Pos_per_cc.drop(cc_not_GS)
+
+    return Counts(TP_per_cc, Pred_Pos_per_cc, GS_Pos_per_cc, TP, Pred_Pos, GS_Pos)
+
+def tolerance_curve(df_gs, df_pred, required, tols):
+    '''
+    DESCRIPTION: Micro-average metrics for every error tolerance, from the
+    required tolerance of every GS reference. A (clinical_case, code) pair
+    of the GS needs the smallest tolerance of its references, and its True
+    Positive count at every tolerance is read from the cumulative histogram
+    of those tolerances.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        df_pred: pandas dataframe
+            with (at least) the distinct (clinical_case, code) pairs of the
+            predictions.
+        required: numpy array
+            required tolerance of every GS reference, as output by
+            span_matching.required_tolerance with max_tol >= max(tols).
+        tols: list
+            non-negative error tolerances, in characters.
+    
+    OUTPUT: 
+        curve: pandas dataframe
+            one row per tolerance, with columns
+            ['tol', 'TP', 'Pred_Pos', 'GS_Pos', 'P', 'R', 'F1'].
+    '''
+    encoding = Encoding(None, df_gs['clinical_case'], df_gs['code'])
+    gs_keys = encoding.encode(df_gs)
+    Pred_Pos = pd.unique(encoding.encode(df_pred)).shape[0]
+    return curve_from_keys(gs_keys, required, Pred_Pos, tols)
+
+def curve_from_keys(gs_keys, required, Pred_Pos, tols):
+    '''
+    DESCRIPTION: tolerance_curve from the keys of the GS references (see
+    encoding.Encoding) and the number of distinct predicted pairs.
+    '''
+    tols = np.asarray(tols, dtype=np.int64)
+    max_tol = int(tols.max()) if tols.size > 0 else 0
+    
+    # Smallest required tolerance of every (clinical_case, code) pair: sort
+    # the references by key and reduce every run of a key
+    order = np.argsort(gs_keys, kind='stable')
+    sorted_keys = gs_keys[order]
+    first = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    pair_required = (np.minimum.reduceat(required[order], first) if first.size > 0
+                     else np.empty(0, dtype=np.int64))
+    
+    # Pairs not covered with max_tol go to the last bin
+    hist = np.bincount(np.minimum(pair_required, max_tol + 1), minlength=max_tol + 2)
+    TP = np.cumsum(hist)[tols]
+    GS_Pos = pair_required.shape[0]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        P = TP / Pred_Pos
+        R = TP / GS_Pos
+        F1 = np.where(P + R == 0, 0, (2 * P * R) / (P + R))
+    
+    return pd.DataFrame({'tol': tols, 'TP': TP, 'Pred_Pos': Pred_Pos, 'GS_Pos': GS_Pos,
+                         'P': P, 'R': R, 'F1': F1})
+
+def check_tolerances(tols):
+    '''
+    DESCRIPTION: Raise ValueError if a list of error tolerances is empty or
+    has negative ones.
+    '''
+    if (len(tols) == 0) or (min(tols) < 0):
+        raise ValueError('error tolerances must be non-negative: got {}'.format(list(tols)))
+
+def calculate_tolerance_curve(df_gs, df_pred, tols=range(0, 51), strict=False):
+    '''
+    DESCRIPTION: Micro-average Precision, Recall and F-score of task X for a
+    range of error tolerances, with a single matching pass. Every row gives
+    the same micro-averages as calculate_metrics(df_gs, df_pred, tol).
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        df_pred: pandas dataframe
+            with the predictions. Columns are those output by the function read_run.
+        tols: list
+            non-negative error tolerances, in characters.
+        strict: bool
+            if True, every fragment of a discontinuous reference has to be
+            matched.
+    
+    OUTPUT: 
+        curve: pandas dataframe
+            as output by tolerance_curve.
+    '''
+    check_tolerances(tols)
+    gs = encode_gs(df_gs, strict=strict)
+    pred_keys, spans = encode_predictions(gs, df_pred)
+    required = required_references(gs, required_tolerance_groups(gs.group, gs.start, gs.end,
+                                                                 *spans, max(tols)))
+    return curve_from_keys(gs.keys, required, pd.unique(pred_keys).shape[0], tols)
+
+def sweep_run(df_gs, pred_path, valid_codes, tols=range(0, 51), chunksize=DEFAULT_CHUNKSIZE,
+              strict=False):
+    '''
+    DESCRIPTION: Micro-average Precision, Recall and F-score of a predictions
+    file for a range of error tolerances, reading it once in chunks. The 
+    required tolerance of every GS reference is computed once (as the 
+    minimum over the chunks) and every tolerance is derived from it.
+    
+    INPUT: 
+        df_gs: pandas dataframe
+            with the Gold Standard. Columns are those output by the function read_gs.
+        pred_path: str
+            route to TSV file with Predictions.
+        valid_codes: set
+            set of valid codes of this subtask
+        tols: list
+            non-negative error tolerances, in characters.
+        chunksize: int
+            number of rows read at once.
+        strict: bool
+            if True, every fragment of a discontinuous reference has to be
+            matched.
+    
+    OUTPUT: 
+        curve: pandas dataframe
+            as output by tolerance_curve.
+    '''
+    check_tolerances(tols)
+    max_tol = max(tols)
+    gs = encode_gs(df_gs, valid_codes, strict)
+    required = np.full(gs.start.shape[0], NOT_COVERED, dtype=np.int64)
+    pairs = DistinctKeys()
+    for chunk in iter_run(pred_path, valid_codes, chunksize):
+        with profiling.stage('required_tolerance', chunk.shape[0]):
+            pred_keys, spans = encode_predictions(gs, chunk)
+            np.minimum(required, required_tolerance_groups(gs.group, gs.start, gs.end,
+                                                           *spans, max_tol), out=required)
+        pairs.update(pred_keys)
+    
+    with profiling.stage('tolerance_curve', pairs.keys.shape[0]):
+        return curve_from_keys(gs.keys, required_references(gs, required),
+                               pairs.keys.shape[0], tols)
+
+def required_references(gs, required):
+    '''
+    DESCRIPTION: Required tolerance of every GS reference, from those of the
+    spans of an encoded GS (in strict mode, the largest of its fragments).
+    '''
+    if gs.indptr is None:
+        return required
+    return max_fragments(required, gs.indptr)
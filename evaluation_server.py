@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local evaluation server. The implementation is in codiesp_eval.server;
+this script is equivalent to:
+
+    codiesp-eval serve [options]
+"""
+
+import sys
+
+from codiesp_eval.server import *  # noqa: F401,F403
+
+
+if __name__ == '__main__':
+    from codiesp_eval.server import main
+    sys.exit(main())
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bootstrap confidence intervals and paired significance tests. The
+implementation is in codiesp_eval.significance; this script is equivalent
+to:
+
+    codiesp-eval significance [options]
+"""
+
+import sys
+
+from codiesp_eval.significance import *  # noqa: F401,F403
+
+
+if __name__ == '__main__':
+    from codiesp_eval.significance import main
+    sys.exit(main())
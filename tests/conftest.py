@@ -0,0 +1,115 @@
+"""
+Shared fixtures of the test suite: small deterministic synthetic corpora
+(see codiesp_eval.synthetic), a private cache directory for every test and a
+runner of the evaluation scripts in a fresh process.
+
+tests/data/corpus holds a small synthetic corpus and tests/data/golden the
+output of the original evaluation scripts on it (the scripts of the
+baseline revision of the repository): the reference of the byte-for-byte
+comparisons.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from codiesp_eval import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'tests', 'data')
+
+# Files of the stored corpus, written by
+# synthetic.write_corpus(synthetic.make_corpus(40, n_codes=300, seed=7), ...)
+CORPUS_FILES = ['codes_D', 'codes_P', 'gs_D', 'gs_P', 'gs_X', 'pred_D', 'pred_P', 'pred_X']
+
+CLI = ['-m', 'codiesp_eval.cli']
+
+
+def read_golden(name):
+    '''
+    DESCRIPTION: Standard output of an original script on the stored corpus.
+    '''
+    with open(os.path.join(DATA_DIR, 'golden', name + '.txt'), encoding='utf-8') as f:
+        return f.read()
+
+
+def arguments(corpus, task, pred_path=None):
+    '''
+    DESCRIPTION: Gold Standard, predictions and valid codes options of the
+    evaluation of a subtask ('D', 'P' or 'X') of a synthetic corpus.
+    '''
+    pred_path = pred_path or corpus['pred_' + task]
+    if task == 'X':
+        return ['-g', corpus['gs_X'], '-p', pred_path,
+                '-cD', corpus['codes_D'], '-cP', corpus['codes_P']]
+    return ['-g', corpus['gs_' + task], '-p', pred_path, '-c', corpus['codes_' + task]]
+
+
+def edit_predictions(pred_path, out_path):
+    '''
+    DESCRIPTION: Copy of a predictions file without the first clinical case
+    and with an invalid code in the first prediction of the second one.
+    '''
+    with open(pred_path, encoding='utf-8') as f:
+        rows = [line.rstrip('\n').split('\t') for line in f]
+    cases = sorted(set(row[0] for row in rows))
+    rows = [row for row in rows if row[0] != cases[0]]
+    next(row for row in rows if row[0] == cases[1])[-1] = 'zzz'
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.writelines('\t'.join(row) + '\n' for row in rows)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    '''
+    DESCRIPTION: Compiled valid codes and Gold Standards of every test (and
+    of the scripts it runs) go to its own cache directory.
+    '''
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('CODIESP_CACHE_DIR', str(path))
+    return path
+
+
+@pytest.fixture(scope='session', params=[0, 1], ids=['seed0', 'seed1'])
+def corpus(request, tmp_path_factory):
+    '''
+    DESCRIPTION: Synthetic corpus of 60 clinical cases, with discontinuous
+    references, invalid codes, false positives and offset noise.
+
+    OUTPUT:
+        paths: dict
+            as output by synthetic.write_corpus.
+    '''
+    out_dir = tmp_path_factory.mktemp('corpus_{}'.format(request.param))
+    return synthetic.write_corpus(synthetic.make_corpus(60, seed=request.param),
+                                  str(out_dir))
+
+
+@pytest.fixture(scope='session')
+def stored_corpus():
+    '''
+    DESCRIPTION: Routes of the stored corpus (tests/data/corpus), the input
+    of the golden outputs, with the keys of synthetic.write_corpus.
+    '''
+    return {name: os.path.join(DATA_DIR, 'corpus', name + '.tsv') for name in CORPUS_FILES}
+
+
+@pytest.fixture
+def run(tmp_path):
+    '''
+    DESCRIPTION: Run a Python script (route relative to the repository root)
+    or module (-m name) in a fresh process, check its exit status and
+    return its standard output. The working directory is the temporary
+    directory of the test.
+    '''
+    def run_script(script, *args, status=0):
+        if script != '-m':
+            script = os.path.join(ROOT, script)
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        result = subprocess.run([sys.executable, script] + [str(a) for a in args],
+                                cwd=str(tmp_path), env=env, capture_output=True, text=True)
+        assert result.returncode == status, result.stderr
+        return result.stdout
+    return run_script
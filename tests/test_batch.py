@@ -0,0 +1,61 @@
+"""
+Batch evaluation: every run gets the scores of its own evaluation, runs that
+can not be read get their error, and the exit status reports both.
+"""
+
+import io
+import shutil
+
+import pandas as pd
+import pytest
+
+from codiesp_eval import batch, f1_eval, map_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from codiesp_eval.metrics import compute_metrics
+
+
+@pytest.fixture
+def runs(corpus, tmp_path):
+    '''
+    DESCRIPTION: Directory with a full CodiEsp-D run, a partial one and one
+    with the wrong number of columns.
+    '''
+    runs_dir = tmp_path / 'runs'
+    runs_dir.mkdir()
+    shutil.copy(corpus['pred_D'], str(runs_dir / 'a.tsv'))
+    with open(corpus['pred_D'], encoding='utf-8') as f:
+        (runs_dir / 'b.tsv').write_text(''.join(f.readlines()[:50]))
+    (runs_dir / 'c.tsv').write_text('S0000-00000000000000-1\tr69\tr69\n')
+    return runs_dir
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_evaluate_batch(corpus, runs, workers):
+    valid_codes = load_valid_codes(corpus['codes_D'])
+    paths = batch.find_runs(str(runs))
+    results = batch.evaluate_batch('d', corpus['gs_D'], paths, valid_codes, workers)
+
+    assert results.columns.tolist() == batch.COLUMNS
+    assert results['run'].tolist() == paths
+    df_gs, qrels = f1_eval.read_gs(corpus['gs_D']), map_eval.format_gs(corpus['gs_D'])
+    for _, row in results.iloc[:2].iterrows():
+        _, P, _, R, _, F1 = compute_metrics(f1_eval.count_run(df_gs, row['run'], valid_codes))
+        MAP = map_eval.calculate_map_from_file(qrels, row['run'], valid_codes)
+        assert [row['P'], row['R'], row['F1'], row['MAP']] == pytest.approx([P, R, F1, MAP])
+        assert pd.isna(row['error'])
+    assert results.loc[2, ['P', 'R', 'F1', 'MAP']].isna().all()
+    assert results.loc[2, 'error'].startswith('ImportError: The predictions file does not have')
+
+
+@pytest.mark.parametrize('script', [['batch_evaluation.py'], ['-m', 'codiesp_eval.batch']])
+def test_exit_status(corpus, runs, run, script):
+    args = script + ['-t', 'd', '-g', corpus['gs_D'], '-p', runs, '-c', corpus['codes_D'],
+                     '-w', 1]
+    results = pd.read_csv(io.StringIO(run(*args, status=1)), sep='\t')
+    assert results['error'].notna().tolist() == [False, False, True]
+
+    (runs / 'c.tsv').unlink()
+    run(*args, status=0)
+
+    # Invalid arguments
+    run(*args[:-4], status=2)
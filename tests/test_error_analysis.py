@@ -0,0 +1,157 @@
+"""
+Per-code error analysis (--per_code, --errors): the counts of every code,
+its macro-averages and the False Positives and False Negatives of every
+clinical case, against the sets of (clinical case, code) pairs of the run.
+"""
+
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval import f1_eval, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from conftest import CLI, arguments
+from test_x_eval import brute_force
+
+
+def expected_codes(gs_pairs, pred_pairs, tp_pairs):
+    '''
+    DESCRIPTION: TP, FP and FN of every code from sets of (clinical case,
+    code) pairs.
+    '''
+    codes = sorted(set(code for _, code in gs_pairs | pred_pairs))
+    rows = []
+    for code in codes:
+        TP = sum(1 for pair in tp_pairs if pair[1] == code)
+        n_pred = sum(1 for pair in pred_pairs if pair[1] == code)
+        n_gs = sum(1 for pair in gs_pairs if pair[1] == code)
+        rows.append((code, TP, n_pred - TP, n_gs - TP))
+    return pd.DataFrame(rows, columns=['code', 'TP', 'FP', 'FN'])
+
+
+def check_codes(codes, expected):
+    assert codes['code'].tolist() == expected['code'].tolist()
+    for column in ('TP', 'FP', 'FN'):
+        assert codes[column].tolist() == expected[column].tolist()
+    TP, FP, FN = (expected[column].to_numpy() for column in ('TP', 'FP', 'FN'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        assert np.allclose(codes['P'], TP / (TP + FP), equal_nan=True)
+        assert np.allclose(codes['R'], TP / (TP + FN), equal_nan=True)
+        assert np.allclose(codes['F1'], 2 * TP / (2 * TP + FP + FN))
+
+
+def check_macro(analysis, code_types):
+    macro = analysis.macro.set_index('group')
+    groups = {'all': analysis.codes}
+    for name, type_codes in code_types.items():
+        groups[name] = analysis.codes[analysis.codes['code'].isin(type_codes)]
+    assert sorted(macro.index) == sorted(name for name, codes in groups.items()
+                                         if codes.shape[0] > 0)
+    for name in macro.index:
+        assert macro.loc[name, 'codes'] == groups[name].shape[0]
+        assert macro.loc[name, ['P', 'R', 'F1']].tolist() == pytest.approx(
+            [groups[name][metric].dropna().mean() for metric in ('P', 'R', 'F1')])
+
+
+def test_f1_analysis(corpus):
+    valid_codes = load_valid_codes(corpus['codes_D'])
+    df_gs = f1_eval.read_gs(corpus['gs_D'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        df_pred = f1_eval.read_run(corpus['pred_D'], valid_codes)
+        counts, analysis = f1_eval.analyse_run(df_gs, corpus['pred_D'], valid_codes,
+                                               chunksize=13,
+                                               code_types={'DIAGNOSTICO': valid_codes})
+    gs_pairs = set(zip(df_gs['clinical_case'], df_gs['code']))
+    pred_pairs = set(zip(df_pred['clinical_case'], df_pred['code']))
+    tp_pairs = gs_pairs & pred_pairs
+
+    check_codes(analysis.codes, expected_codes(gs_pairs, pred_pairs, tp_pairs))
+    assert (analysis.codes['type'] == 'DIAGNOSTICO').all()
+    check_macro(analysis, {'DIAGNOSTICO': valid_codes})
+    assert (counts.TP, counts.Pred_Pos, counts.GS_Pos) == (
+        len(tp_pairs), len(pred_pairs), len(gs_pairs))
+
+    errors = sorted([(cc, 'FP', code) for cc, code in pred_pairs - tp_pairs] +
+                    [(cc, 'FN', code) for cc, code in gs_pairs - tp_pairs])
+    assert list(analysis.errors.itertuples(index=False, name=None)) == errors
+
+
+def test_x_analysis(corpus):
+    valid_codes_D = load_valid_codes(corpus['codes_D'])
+    valid_codes_P = load_valid_codes(corpus['codes_P'])
+    code_types = {'DIAGNOSTICO': valid_codes_D, 'PROCEDIMIENTO': valid_codes_P}
+    df_gs = x_eval.read_gs(corpus['gs_X'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        df_pred = x_eval.read_run(corpus['pred_X'], valid_codes_D | valid_codes_P)
+        counts, analysis = x_eval.analyse_run(df_gs, corpus['pred_X'],
+                                              valid_codes_D | valid_codes_P, tol=3,
+                                              chunksize=13, code_types=code_types)
+
+    # A pair is a True Positive when one of its references is matched
+    pairs = sorted(set(zip(df_gs['clinical_case'], df_gs['code'])) |
+                   set(zip(df_pred['clinical_case'], df_pred['code'])))
+    group_ids = {pair: i for i, pair in enumerate(pairs)}
+    gs_group = [group_ids[pair] for pair in zip(df_gs['clinical_case'], df_gs['code'])]
+    pred_group = [group_ids[pair] for pair in zip(df_pred['clinical_case'], df_pred['code'])]
+    matched = brute_force(gs_group, df_gs['start_pos_gs'], df_gs['end_pos_gs'], pred_group,
+                          df_pred['start_pos_pred'], df_pred['end_pos_pred'], 3)
+    gs_pairs = set(zip(df_gs['clinical_case'], df_gs['code']))
+    pred_pairs = set(zip(df_pred['clinical_case'], df_pred['code']))
+    tp_pairs = set(pair for pair, is_valid in zip(zip(df_gs['clinical_case'], df_gs['code']),
+                                                  matched) if is_valid)
+
+    check_codes(analysis.codes, expected_codes(gs_pairs, pred_pairs, tp_pairs))
+    check_macro(analysis, code_types)
+    assert counts.TP == len(tp_pairs)
+
+    # Spans of the predictions and references of the other pairs
+    fp = df_pred[[pair not in tp_pairs for pair in zip(df_pred['clinical_case'],
+                                                       df_pred['code'])]]
+    fn = df_gs[[pair not in tp_pairs for pair in zip(df_gs['clinical_case'], df_gs['code'])]]
+    errors = analysis.errors
+    assert sorted(errors.loc[errors['error'] == 'FP', ['clinical_case', 'code', 'start', 'end']]
+                  .itertuples(index=False, name=None)) == sorted(
+        fp[['clinical_case', 'code', 'start_pos_pred', 'end_pos_pred']]
+        .itertuples(index=False, name=None))
+    assert sorted(errors.loc[errors['error'] == 'FN', ['clinical_case', 'code', 'start', 'end',
+                                                       'reference']]
+                  .itertuples(index=False, name=None)) == sorted(
+        fn[['clinical_case', 'code', 'start_pos_gs', 'end_pos_gs', 'ref']]
+        .itertuples(index=False, name=None))
+
+
+@pytest.mark.parametrize('command, task', [('f1', 'D'), ('x', 'X')])
+def test_command_line(corpus, run, tmp_path, command, task):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if task == 'X':
+            valid_codes = (load_valid_codes(corpus['codes_D']) |
+                           load_valid_codes(corpus['codes_P']))
+            _, analysis = x_eval.analyse_run(x_eval.read_gs(corpus['gs_X']), corpus['pred_X'],
+                                             valid_codes)
+        else:
+            _, analysis = f1_eval.analyse_run(f1_eval.read_gs(corpus['gs_D']),
+                                              corpus['pred_D'],
+                                              load_valid_codes(corpus['codes_D']))
+
+    stdout = run(*CLI, command, *arguments(corpus, task), '--per_code',
+                 tmp_path / 'codes.tsv', '--errors', tmp_path / 'errors.json')
+    assert '\nMACRO-AVERAGE STATISTICS (over codes):\n' in stdout
+    codes = pd.read_csv(tmp_path / 'codes.tsv', sep='\t', dtype={'code': object})
+    assert codes['code'].tolist() == analysis.codes['code'].tolist()
+    for column in ('TP', 'FP', 'FN'):
+        assert codes[column].tolist() == analysis.codes[column].tolist()
+    with open(tmp_path / 'errors.json') as f:
+        errors = pd.DataFrame(json.load(f)['table'])
+    assert errors.columns.tolist() == analysis.errors.columns.tolist()
+    assert errors[['clinical_case', 'error', 'code']].equals(
+        analysis.errors[['clinical_case', 'error', 'code']])
+
+    # Per-code table on the standard output, after the results
+    stdout = run(*CLI, command, *arguments(corpus, task), '--per_code', '-', '-q')
+    assert stdout.split('\n')[-2].startswith(analysis.codes['code'].iloc[-1] + '\t')
@@ -0,0 +1,148 @@
+"""
+In-memory Evaluator: the scores of predictions given as a dataframe, arrays
+or rows are those of the evaluation of the same predictions written to a
+file, also when none of them has a valid code.
+"""
+
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval import f1_eval, map_eval, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from codiesp_eval.evaluator import Evaluator
+from codiesp_eval.metrics import compute_metrics
+
+
+def read_raw(pred_path, task):
+    '''
+    DESCRIPTION: Predictions file as a dataframe, without lowercasing or
+    filtering its codes.
+    '''
+    if task != 'x':
+        return pd.read_csv(pred_path, sep='\t', header=None, names=['clinical_case', 'code'])
+    df = pd.read_csv(pred_path, sep='\t', header=None,
+                     names=['clinical_case', 'pos_pred', 'label_pred', 'code'])
+    pos = df['pos_pred'].str.split(' ', expand=True).astype(int)
+    return df.assign(start_pos_pred=pos[0], end_pos_pred=pos[1])
+
+
+def file_scores(corpus, task, pred_path, tol=10):
+    '''
+    DESCRIPTION: Scores and counts of the evaluation of a predictions file.
+    '''
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if task == 'x':
+            valid_codes = (load_valid_codes(corpus['codes_D']) |
+                           load_valid_codes(corpus['codes_P']))
+            counts = x_eval.count_run(x_eval.read_gs(corpus['gs_X']), pred_path, valid_codes,
+                                      tol)
+            MAP = None
+        else:
+            valid_codes = load_valid_codes(corpus['codes_' + task.upper()])
+            gs_path = corpus['gs_' + task.upper()]
+            counts = f1_eval.count_run(f1_eval.read_gs(gs_path), pred_path, valid_codes)
+            MAP = map_eval.calculate_map_from_file(map_eval.format_gs(gs_path), pred_path,
+                                                   valid_codes)
+    _, P, _, R, _, F1 = compute_metrics(counts)
+    return [P, R, F1, MAP], counts
+
+
+def make_evaluator(corpus, task):
+    if task == 'x':
+        valid_codes = load_valid_codes(corpus['codes_D']) | load_valid_codes(corpus['codes_P'])
+        return Evaluator('x', corpus['gs_X'], valid_codes)
+    return Evaluator(task, corpus['gs_' + task.upper()], corpus['codes_' + task.upper()])
+
+
+def same_scores(scores, expected):
+    assert len(scores) == len(expected)
+    for value, other in zip(scores, expected):
+        if other is None:
+            assert value is None
+        elif math.isnan(other):
+            assert math.isnan(value)
+        else:
+            assert value == pytest.approx(other, abs=1e-12)
+
+
+@pytest.mark.parametrize('task', ['d', 'p', 'x'])
+def test_same_scores_as_file(corpus, task):
+    pred_path = corpus['pred_' + task.upper()]
+    expected, expected_counts = file_scores(corpus, task, pred_path)
+    evaluator = make_evaluator(corpus, task)
+    df = read_raw(pred_path, task)
+    columns = ['clinical_case', 'code'] + (['start_pos_pred', 'end_pos_pred']
+                                           if task == 'x' else [])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for predictions in (df, tuple(df[c].to_numpy() for c in columns),
+                            iter(list(df[columns].itertuples(index=False, name=None)))):
+            same_scores(evaluator.evaluate(predictions), expected)
+        counts = evaluator.counts(df)
+    assert counts[3:] == expected_counts[3:]
+    for computed, series in zip(counts[:3], expected_counts[:3]):
+        assert computed.sort_index().equals(series.sort_index())
+
+
+def test_tolerance(corpus):
+    evaluator = make_evaluator(corpus, 'x')
+    df = read_raw(corpus['pred_X'], 'x')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        same_scores(evaluator.evaluate(df, tol=0), file_scores(corpus, 'x', corpus['pred_X'],
+                                                               tol=0)[0])
+        # The tolerance of the evaluator is unchanged
+        same_scores(evaluator.evaluate(df), file_scores(corpus, 'x', corpus['pred_X'])[0])
+
+
+@pytest.mark.parametrize('task', ['d', 'x'])
+def test_no_valid_codes(corpus, tmp_path, task):
+    # Only invalid codes: Precision and F-score are NaN, as for a file
+    df = read_raw(corpus['pred_' + task.upper()], task).iloc[:20]
+    df = df.assign(code='zzz')
+    pred_path = str(tmp_path / 'invalid.tsv')
+    columns = (['clinical_case', 'pos_pred', 'label_pred', 'code'] if task == 'x'
+               else ['clinical_case', 'code'])
+    df[columns].to_csv(pred_path, sep='\t', header=False, index=False)
+    expected, _ = file_scores(corpus, task, pred_path)
+    assert math.isnan(expected[0]) and (expected[1] == 0) and math.isnan(expected[2])
+
+    evaluator = make_evaluator(corpus, task)
+    with pytest.warns(UserWarning, match='None of the predicted codes'):
+        same_scores(evaluator.evaluate(df), expected)
+    with pytest.warns(UserWarning, match='The predictions file is empty'):
+        same_scores(evaluator.evaluate(df.iloc[:0]), expected)
+
+
+def test_repeated_calls(corpus):
+    evaluator = make_evaluator(corpus, 'd')
+    df = read_raw(corpus['pred_D'], 'd')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = evaluator.evaluate(df)
+        # Clinical cases that are not in the GS do not stay in the vocabulary
+        evaluator.evaluate(df.assign(clinical_case='S' + df['clinical_case']))
+        assert evaluator.evaluate(df) == expected
+    assert len(evaluator.encoding.cases) == f1_eval.read_gs(
+        corpus['gs_D'])['clinical_case'].nunique()
+
+
+def test_invalid_predictions(corpus):
+    evaluator = make_evaluator(corpus, 'x')
+    with pytest.raises(ValueError):
+        Evaluator('q', corpus['gs_D'], corpus['codes_D'])
+    with pytest.raises(ValueError, match='columns'):
+        evaluator.evaluate(pd.DataFrame({'clinical_case': ['S1'], 'code': ['r69']}))
+    with pytest.raises(ValueError, match='4 columns'):
+        evaluator.evaluate((np.array(['S1']), np.array(['r69'])))
+    with pytest.raises(ValueError, match='same length'):
+        evaluator.evaluate((np.array(['S1']), np.array(['r69']), np.array([1, 2]),
+                            np.array([3])))
+    with pytest.raises(ValueError, match='4 columns'):
+        evaluator.evaluate([('S1', 'r69', 1)])
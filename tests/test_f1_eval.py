@@ -0,0 +1,62 @@
+"""
+CodiEsp-D/P Precision, Recall and F-score: output of comp_f1_diag_proc.py
+and f1_eval.calculate_counts against the code sets of every clinical case.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval import f1_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from conftest import read_golden
+
+
+def per_case_sets(df_gs, df_pred):
+    '''
+    DESCRIPTION: True Positives, Predicted Positives and Gold Standard
+    Positives per clinical case, from the sets of codes of every case.
+    '''
+    gs = df_gs.groupby('clinical_case')['code'].agg(set)
+    pred = df_pred.groupby('clinical_case')['code'].agg(set)
+    TP = {cc: len(codes & pred.get(cc, set())) for cc, codes in gs.items()}
+    return TP, pred.map(len).to_dict(), gs.map(len).to_dict()
+
+
+@pytest.mark.parametrize('task', ['D', 'P'])
+def test_same_output_as_original(stored_corpus, run, task):
+    c = stored_corpus
+    assert (run('comp_f1_diag_proc.py', '-g', c['gs_' + task], '-p', c['pred_' + task],
+                '-c', c['codes_' + task]) == read_golden('comp_f1_diag_proc_' + task))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_calculate_counts(seed):
+    rng = np.random.default_rng(seed)
+    cases = np.array(['S{}'.format(i) for i in range(12)], dtype=object)
+    codes = np.array(['c{}'.format(i) for i in range(15)], dtype=object)
+    # Cases 0-9 in the GS, 2-11 predicted, with repeated pairs in both
+    df_gs = pd.DataFrame({'clinical_case': cases[rng.integers(0, 10, 80)],
+                          'code': codes[rng.integers(0, 15, 80)]})
+    df_pred = pd.DataFrame({'clinical_case': cases[rng.integers(2, 12, 120)],
+                            'code': codes[rng.integers(0, 15, 120)]})
+
+    counts = f1_eval.calculate_counts(df_gs, df_pred)
+    TP, Pred_Pos, GS_Pos = per_case_sets(df_gs, df_pred)
+    assert counts.TP_per_cc.to_dict() == TP
+    assert counts.Pred_Pos_per_cc.to_dict() == Pred_Pos
+    assert counts.GS_Pos_per_cc.to_dict() == GS_Pos
+    assert (counts.TP, counts.Pred_Pos, counts.GS_Pos) == (
+        sum(TP.values()), sum(Pred_Pos.values()), sum(GS_Pos.values()))
+
+
+def test_count_run(corpus):
+    valid_codes = load_valid_codes(corpus['codes_D'])
+    df_gs = f1_eval.read_gs(corpus['gs_D'])
+    expected = f1_eval.calculate_counts(df_gs, f1_eval.read_run(corpus['pred_D'], valid_codes))
+
+    # Reading in chunks smaller than a clinical case
+    counts = f1_eval.count_run(df_gs, corpus['pred_D'], valid_codes, chunksize=7)
+    assert counts[3:] == expected[3:]
+    for computed, series in zip(counts[:3], expected[:3]):
+        assert computed.sort_index().equals(series.sort_index())
@@ -0,0 +1,121 @@
+"""
+Discontinuous CodiEsp-X references: parsing of their positions, and the
+default and strict (--strict) matching of their fragments against a
+brute-force check of every prediction of every reference.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval import span_matching, x_eval
+
+
+def covered(start, end, predictions, tol):
+    return any((0 <= start - ps <= tol) and (0 <= pe - end <= tol) for ps, pe in predictions)
+
+
+def expected_metrics(df_gs, df_pred, tol, strict):
+    '''
+    DESCRIPTION: Micro-average Precision, Recall and F-score of task X from
+    the fragments of every reference: in strict mode every fragment has to
+    be covered by a prediction, otherwise the span from the start of the
+    first one to the end of the last one.
+    '''
+    predictions = {}
+    for row in df_pred.itertuples():
+        predictions.setdefault((row.clinical_case, row.code), []).append(
+            (row.start_pos_pred, row.end_pos_pred))
+    found = set()
+    for row in df_gs.itertuples():
+        fragments = [tuple(map(int, f.split())) for f in row.pos_gs.split(';')]
+        pair_predictions = predictions.get((row.clinical_case, row.code), [])
+        if strict:
+            is_valid = all(covered(start, end, pair_predictions, tol)
+                           for start, end in fragments)
+        else:
+            is_valid = covered(fragments[0][0], fragments[-1][1], pair_predictions, tol)
+        if is_valid:
+            found.add((row.clinical_case, row.code))
+    TP = len(found)
+    P = TP / len(predictions)
+    R = TP / len(set(zip(df_gs['clinical_case'], df_gs['code'])))
+    return P, R, 0 if P + R == 0 else 2 * P * R / (P + R)
+
+
+def random_references(seed, n=300):
+    '''
+    DESCRIPTION: Gold Standard with references of one to three fragments, and
+    predictions close to the fragments, to their gaps or to whole references.
+    '''
+    rng = np.random.default_rng(seed)
+    cases = ['S{}'.format(i) for i in range(30)]
+    codes = ['r69', 'n20.0', 'bw03zzz', 'k59.00', 'i10']
+    gs, pred = [], []
+    for _ in range(n):
+        case, code = cases[rng.integers(len(cases))], codes[rng.integers(len(codes))]
+        starts = np.sort(rng.choice(500, rng.integers(1, 4), replace=False)) * 4
+        ends = starts + rng.integers(1, 4, starts.shape[0])
+        gs.append((case, 'label', code, 'ref', ';'.join('{} {}'.format(s, e)
+                                                        for s, e in zip(starts, ends))))
+        noise = lambda: int(rng.integers(-6, 7))
+        if rng.random() < 0.3:
+            spans = [(starts[0] + noise(), ends[-1] + noise())]
+        else:
+            spans = [(s + noise(), e + noise()) for s, e in zip(starts, ends)
+                     if rng.random() < 0.8]
+        pred += [(case, s, e, code) for s, e in spans]
+    df_gs = pd.DataFrame(gs, columns=['clinical_case', 'label_gs', 'code', 'ref', 'pos_gs'])
+    df_pred = pd.DataFrame(pred, columns=['clinical_case', 'start_pos_pred', 'end_pos_pred',
+                                          'code'])
+    return df_gs, df_pred
+
+
+def test_parse_positions():
+    fragments = span_matching.parse_positions(pd.Series(['12 20', '1 5;8 13;-2 40', '7 7']))
+    assert fragments.indptr.tolist() == [0, 1, 4, 5]
+    assert fragments.start.tolist() == [12, 1, 8, -2, 7]
+    assert fragments.end.tolist() == [20, 5, 13, 40, 7]
+
+    empty = span_matching.parse_positions(pd.Series([], dtype=object))
+    assert (empty.indptr.tolist(), empty.start.size) == ([0], 0)
+
+    for value in ('12', '12 a', '1 2;3', '1 2;', '', '99999999999999999999 1', None):
+        with pytest.raises(ValueError, match='row 1'):
+            span_matching.parse_positions(pd.Series(['3 4', value, '5 6']))
+
+
+def test_read_gs(tmp_path):
+    path = tmp_path / 'gs.tsv'
+    path.write_text('S1\tDIAGNOSTICO\tN20.0\tcalculo\t12 20;35 41\n'
+                    'S1\tPROCEDIMIENTO\tBW03ZZZ\trx\t50 60\n')
+    df_gs = x_eval.read_gs(str(path))
+    assert df_gs['code'].tolist() == ['n20.0', 'bw03zzz']
+    assert df_gs['start_pos_gs'].tolist() == [12, 50]
+    assert df_gs['end_pos_gs'].tolist() == [41, 60]
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('strict', [False, True])
+def test_matching(tmp_path, seed, strict):
+    df_gs, df_pred = random_references(seed)
+    path = tmp_path / 'gs.tsv'
+    df_gs.to_csv(path, sep='\t', header=False, index=False)
+    df_gs = x_eval.read_gs(str(path))
+
+    for tol in (0, 2, 5):
+        _, P, _, R, _, F1 = x_eval.calculate_metrics(df_gs, df_pred, tol, strict=strict)
+        assert [P, R, F1] == pytest.approx(expected_metrics(df_gs, df_pred, tol, strict))
+
+
+def test_gap_does_not_match():
+    df_gs = pd.DataFrame({'clinical_case': ['S1'], 'code': ['r69'], 'pos_gs': ['10 20;80 90'],
+                          'start_pos_gs': [10], 'end_pos_gs': [90]})
+    whole = pd.DataFrame({'clinical_case': ['S1'], 'code': ['r69'], 'start_pos_pred': [10],
+                          'end_pos_pred': [90]})
+    fragments = pd.DataFrame({'clinical_case': ['S1', 'S1'], 'code': ['r69', 'r69'],
+                              'start_pos_pred': [9, 80], 'end_pos_pred': [20, 92]})
+    assert x_eval.calculate_metrics(df_gs, whole, 0)[5] == 1
+    assert x_eval.calculate_metrics(df_gs, whole, 10, strict=True)[5] == 0
+    assert x_eval.calculate_metrics(df_gs, fragments, 2, strict=True)[3] == 1
+    assert x_eval.calculate_metrics(df_gs, fragments, 0, strict=True)[3] == 0
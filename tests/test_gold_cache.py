@@ -0,0 +1,103 @@
+"""
+Gold Standard cache: compiled tables hold the output of the readers, their
+columns are memory-mapped, and they are compiled again when the source or
+the version of the reader changes.
+"""
+
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval import f1_eval, gold_cache, map_eval, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+
+TASKS = {'f1': 'D', 'map': 'D', 'x': 'X'}
+
+
+def memory_map(values):
+    '''
+    DESCRIPTION: numpy memmap an array is a view of, or None.
+    '''
+    while (values is not None) and not isinstance(values, np.memmap):
+        values = values.base
+    return values
+
+
+def load_compiled(corpus, reader):
+    '''
+    DESCRIPTION: Output of the reader and table loaded from the cache.
+    '''
+    gs_path = corpus['gs_' + TASKS[reader]]
+    expected = gold_cache.READERS[reader](gs_path)
+    table_path = gold_cache.compile_gs(gs_path, TASKS[reader].lower())[reader]
+    assert os.path.isdir(table_path)
+    return expected, gold_cache.load_gs(gs_path, reader)
+
+
+@pytest.mark.parametrize('reader', ['f1', 'map', 'x'])
+def test_same_table(corpus, reader):
+    expected, gs = load_compiled(corpus, reader)
+    assert gs.columns.tolist() == expected.columns.tolist()
+    assert gs.index.equals(expected.index)
+    for name in gs.columns:
+        if expected[name].dtype == object:
+            # Strings as categories of the memory-mapped ids
+            assert gs[name].dtype == 'category'
+            assert isinstance(memory_map(gs[name].values.codes), np.memmap)
+            assert gs[name].astype(object).equals(expected[name])
+        else:
+            assert isinstance(memory_map(gs[name].to_numpy()), np.memmap)
+            assert gs[name].equals(expected[name])
+
+
+def test_same_results(corpus):
+    valid_codes = load_valid_codes(corpus['codes_D'])
+    valid_codes_X = valid_codes | load_valid_codes(corpus['codes_P'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for reader, evaluate in [
+                ('f1', lambda gs: f1_eval.count_run(gs, corpus['pred_D'], valid_codes)),
+                ('x', lambda gs: x_eval.count_run(gs, corpus['pred_X'], valid_codes_X))]:
+            expected, gs = [evaluate(table) for table in load_compiled(corpus, reader)]
+            assert gs[3:] == expected[3:]
+            for computed, series in zip(gs[:3], expected[:3]):
+                assert computed.sort_index().equals(series.sort_index())
+
+        expected, gs = load_compiled(corpus, 'map')
+        assert (map_eval.calculate_map_from_file(gs, corpus['pred_D'], valid_codes) ==
+                map_eval.calculate_map_from_file(expected, corpus['pred_D'], valid_codes))
+
+
+def test_reader_version(corpus, monkeypatch):
+    gs_path = corpus['gs_X']
+    table_path = gold_cache.compile_gs(gs_path, 'x')['x']
+    monkeypatch.setitem(gold_cache.READERS, 'x', lambda path: x_eval.read_gs(path).iloc[:5])
+
+    # Without a new version the stale table is still used...
+    assert gold_cache.load_gs(gs_path, 'x').shape[0] > 5
+    # ... and a new version compiles the output of the new reader
+    monkeypatch.setitem(gold_cache.READER_VERSIONS, 'x', gold_cache.READER_VERSIONS['x'] + 1)
+    assert gold_cache.load_gs(gs_path, 'x').shape[0] == 5
+    assert gold_cache.compile_gs(gs_path, 'x')['x'] != table_path
+
+
+def test_changed_source(tmp_path):
+    gs_path = tmp_path / 'gs.tsv'
+    gs_path.write_text('S1\tR69\nS1\tN20.0\n')
+    assert gold_cache.load_gs(str(gs_path), 'f1')['code'].astype(object).tolist() == [
+        'r69', 'n20.0']
+    gs_path.write_text('S1\tR69\nS2\tI10\nS2\tI10\n')
+    gs = gold_cache.load_gs(str(gs_path), 'f1')
+    assert gs.astype(object).equals(f1_eval.read_gs(str(gs_path)))
+
+
+def test_missing_values(tmp_path):
+    table = pd.DataFrame({'code': ['r69', None, 'i10'], 'n': [1, 2, 3]})
+    table_path = str(tmp_path / 'table')
+    gold_cache._write_table(table_path, table)
+    loaded = gold_cache._read_table(table_path)
+    assert loaded['code'].isna().tolist() == [False, True, False]
+    assert loaded['code'].astype(object).tolist()[::2] == ['r69', 'i10']
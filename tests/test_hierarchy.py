@@ -0,0 +1,91 @@
+"""
+Granularity levels: the counts of every level, read in a single pass,
+against an evaluation of the predictions and Gold Standard with their codes
+truncated to the prefix of that level.
+"""
+
+import warnings
+
+import pytest
+
+from codiesp_eval import f1_eval, hierarchy, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from codiesp_eval.metrics import compute_metrics
+from conftest import CLI, arguments
+
+LEVELS = ['category', 'subcategory', '1', '2', 'code']
+
+
+def truncate(df, length):
+    '''
+    DESCRIPTION: Copy of a dataframe with its codes truncated to their first
+    characters, without the dot.
+    '''
+    df = df.copy()
+    if length is not None:
+        df['code'] = [code.replace('.', '')[:length] for code in df['code']]
+    return df
+
+
+def same_counts(counts, expected):
+    assert counts[3:] == expected[3:]
+    for computed, series in zip(counts[:3], expected[:3]):
+        computed, series = computed.sort_index(), series.sort_index()
+        assert computed.index.tolist() == series.index.tolist()
+        assert computed.tolist() == series.tolist()
+
+
+def test_parse_level():
+    assert hierarchy.parse_level('category') == ('category', 3)
+    assert hierarchy.parse_level('code') == ('code', None)
+    assert hierarchy.parse_level('05') == ('5', 5)
+    for level in ('0', '-1', 'chapter', '2.5'):
+        with pytest.raises(ValueError):
+            hierarchy.parse_level(level)
+
+
+@pytest.mark.parametrize('task', ['D', 'P'])
+def test_f1_levels(corpus, task):
+    valid_codes = load_valid_codes(corpus['codes_' + task])
+    df_gs = f1_eval.read_gs(corpus['gs_' + task])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        df_pred = f1_eval.read_run(corpus['pred_' + task], valid_codes)
+        counts = f1_eval.count_run_levels(df_gs, corpus['pred_' + task], valid_codes, LEVELS,
+                                          chunksize=11)
+
+    assert list(counts) == ['category', 'subcategory', '1', '2', 'code']
+    for level in LEVELS:
+        length = hierarchy.parse_level(level)[1]
+        same_counts(counts[level], f1_eval.calculate_counts(truncate(df_gs, length),
+                                                            truncate(df_pred, length)))
+
+
+@pytest.mark.parametrize('strict', [False, True])
+def test_x_levels(corpus, strict):
+    valid_codes = load_valid_codes(corpus['codes_D']) | load_valid_codes(corpus['codes_P'])
+    df_gs = x_eval.read_gs(corpus['gs_X'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        df_pred = x_eval.read_run(corpus['pred_X'], valid_codes)
+        counts = x_eval.count_run_levels(df_gs, corpus['pred_X'], valid_codes, LEVELS, tol=3,
+                                         chunksize=11, strict=strict)
+        for level in LEVELS:
+            length = hierarchy.parse_level(level)[1]
+            expected = x_eval.calculate_metrics(truncate(df_gs, length),
+                                                truncate(df_pred, length), 3, strict)
+            computed = compute_metrics(counts[level])
+            assert computed[1::2] == pytest.approx(expected[1::2])
+            for per_cc, expected_per_cc in zip(computed[::2], expected[::2]):
+                assert per_cc.sort_index().equals(expected_per_cc.sort_index())
+
+        # The code level is the evaluation without levels
+        same_counts(counts['code'], x_eval.count_run(df_gs, corpus['pred_X'], valid_codes,
+                                                     3, strict=strict))
+
+
+def test_command_line(corpus, run):
+    output = run(*CLI, 'f1', *arguments(corpus, 'D'), '--levels', 'category', 'code')
+    rows = [line.split('\t') for line in output.strip().split('\n')]
+    assert [row[0] for row in rows] == ['level', 'category', 'code']
+    assert run(*CLI, 'f1', *arguments(corpus, 'D'), '--levels', 'chapter', status=2) == ''
@@ -0,0 +1,95 @@
+"""
+Incremental re-evaluation (--state_path) prints the same results as a full
+evaluation and only counts again the clinical cases whose predictions
+changed.
+"""
+
+import json
+import warnings
+
+import pytest
+
+from codiesp_eval import f1_eval, incremental, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from conftest import arguments, edit_predictions
+
+
+def load(corpus, task):
+    '''
+    DESCRIPTION: Valid codes and Gold Standard of a subtask of a corpus.
+    '''
+    if task == 'X':
+        valid_codes = (load_valid_codes(corpus['codes_D']) |
+                       load_valid_codes(corpus['codes_P']))
+        return valid_codes, x_eval.read_gs(corpus['gs_X'])
+    return load_valid_codes(corpus['codes_' + task]), f1_eval.read_gs(corpus['gs_' + task])
+
+
+def count_incremental(task, df_gs, pred_path, valid_codes, state_path):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return incremental.count_run_incremental(task.lower(), df_gs, pred_path, valid_codes,
+                                                 state_path)
+
+
+@pytest.mark.parametrize('script, task', [('comp_f1_diag_proc.py', 'D'),
+                                          ('comp_f1_diag_proc.py', 'P'),
+                                          ('codiespX_evaluation.py', 'X')])
+def test_state_path(corpus, run, tmp_path, script, task):
+    state_path = tmp_path / 'state.json'
+    edited_path = str(tmp_path / 'edited.tsv')
+    edit_predictions(corpus['pred_' + task], edited_path)
+
+    # First run (no state), same predictions, then edited predictions
+    assert (run(script, *arguments(corpus, task), '-s', state_path) ==
+            run(script, *arguments(corpus, task)))
+    assert (run(script, *arguments(corpus, task), '-s', state_path) ==
+            run(script, *arguments(corpus, task)))
+    assert (run(script, *arguments(corpus, task, edited_path), '-s', state_path) ==
+            run(script, *arguments(corpus, task, edited_path)))
+
+    # A state file that can not be parsed is ignored
+    state_path.write_text('{"version": 3, "fingerprint"')
+    assert (run(script, *arguments(corpus, task), '-s', state_path) ==
+            run(script, *arguments(corpus, task)))
+
+
+@pytest.mark.parametrize('task', ['D', 'X'])
+def test_only_counts_changed_cases(corpus, tmp_path, task):
+    state_path = str(tmp_path / 'state.json')
+    edited_path = str(tmp_path / 'edited.tsv')
+    edit_predictions(corpus['pred_' + task], edited_path)
+    valid_codes, df_gs = load(corpus, task)
+    count_run = x_eval.count_run if task == 'X' else f1_eval.count_run
+    full = count_run(df_gs, edited_path, valid_codes)
+
+    _, n_first = count_incremental(task, df_gs, corpus['pred_' + task], valid_codes,
+                                   state_path)
+    counts, n_recomputed = count_incremental(task, df_gs, edited_path, valid_codes,
+                                             state_path)
+    # Only the edited clinical case is counted again (the removed one is
+    # dropped from the state)
+    assert n_first > 1
+    assert n_recomputed == 1
+    assert counts[3:] == full[3:]
+    for computed, expected in zip(counts[:3], full[:3]):
+        assert computed.sort_index().equals(expected.sort_index())
+
+
+def test_state_of_another_version(corpus, tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    valid_codes, df_gs = load(corpus, 'X')
+    _, n_first = count_incremental('X', df_gs, corpus['pred_X'], valid_codes, state_path)
+
+    with open(state_path, encoding='utf-8') as f:
+        state = json.load(f)
+    assert state['version'] == incremental.STATE_VERSION
+    state['version'] = incremental.STATE_VERSION - 1
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+    # Every clinical case is counted again
+    _, n_recomputed = count_incremental('X', df_gs, corpus['pred_X'], valid_codes, state_path)
+    assert n_recomputed == n_first
+    _, n_recomputed = count_incremental('X', df_gs, corpus['pred_X'], valid_codes, state_path)
+    assert n_recomputed == 0
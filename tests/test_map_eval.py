@@ -0,0 +1,86 @@
+"""
+CodiEsp-D/P MAP: output of codiespD_P_evaluation.py, and the in-process MAP
+of map_eval against trectools and against a plain computation of the
+Average Precision of every query.
+"""
+
+import warnings
+
+import pytest
+
+from codiesp_eval import map_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from conftest import read_golden
+
+
+def average_precisions(gs, pred, depth=1000):
+    '''
+    DESCRIPTION: Average Precision of every predicted query, ranking its
+    codes in file order (NaN for queries that are not in the GS).
+    '''
+    relevant = {}
+    for qid, docno in zip(gs['qid'], gs['docno']):
+        relevant.setdefault(qid, set()).add(docno)
+    ranked = {}
+    for query, docid in zip(pred['query'], pred['docid']):
+        if docid not in ranked.setdefault(query, []):
+            ranked[query].append(docid)
+
+    ap = {}
+    for query, docids in ranked.items():
+        if query not in relevant:
+            ap[query] = float('nan')
+            continue
+        n_rel, total = 0, 0.0
+        for rank, docid in enumerate(docids[:depth], 1):
+            if docid in relevant[query]:
+                n_rel += 1
+                total += n_rel / rank
+        ap[query] = total / len(relevant[query])
+    return ap
+
+
+def load(corpus, task):
+    valid_codes = load_valid_codes(corpus['codes_' + task])
+    gs = map_eval.format_gs(corpus['gs_' + task])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        pred = map_eval.format_predictions(corpus['pred_' + task], None, valid_codes)
+    return valid_codes, gs, pred
+
+
+@pytest.mark.parametrize('task', ['D', 'P'])
+def test_same_output_as_original(stored_corpus, run, task):
+    c = stored_corpus
+    assert (run('codiespD_P_evaluation.py', '-g', c['gs_' + task], '-p', c['pred_' + task],
+                '-c', c['codes_' + task]) == read_golden('codiespD_P_evaluation_' + task))
+
+
+@pytest.mark.parametrize('task', ['D', 'P'])
+def test_same_map_as_trectools(corpus, task):
+    pytest.importorskip('trectools')
+    valid_codes, gs, pred = load(corpus, task)
+
+    MAP = map_eval.calculate_map_trectools(gs, pred)
+    assert map_eval.calculate_map(gs, pred) == pytest.approx(MAP, abs=1e-12)
+    assert (map_eval.calculate_map_from_file(gs, corpus['pred_' + task], valid_codes) ==
+            pytest.approx(MAP, abs=1e-12))
+
+
+@pytest.mark.parametrize('depth', [1, 3, 1000])
+def test_average_precision(corpus, depth):
+    valid_codes, gs, pred = load(corpus, 'D')
+    expected = average_precisions(gs, pred, depth)
+
+    for ap in (map_eval.calculate_map(gs, pred, depth, per_query=True),
+               map_eval.calculate_map_from_file(gs, corpus['pred_D'], valid_codes, depth,
+                                                chunksize=7, per_query=True)):
+        assert sorted(ap.index) == sorted(expected)
+        assert ap.fillna(-1).to_dict() == pytest.approx(
+            {query: -1 if value != value else value for query, value in expected.items()})
+
+    # Queries that are not in the GS count as zero
+    MAP = sum(value for value in expected.values() if value == value) / len(expected)
+    assert map_eval.calculate_map(gs, pred, depth) == pytest.approx(MAP)
+    assert (map_eval.calculate_map_from_file(gs, corpus['pred_D'], valid_codes, depth) ==
+            pytest.approx(MAP))
@@ -0,0 +1,54 @@
+"""
+Micro-averaged scores of metrics.compute_metrics, also when a total is zero.
+A run without valid predictions scores NaN Precision and F-score, as in the
+original scripts, whether the totals are Python or numpy numbers.
+"""
+
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval.metrics import Counts, compute_metrics
+
+
+def make_counts(TP, Pred_Pos, GS_Pos, number=float):
+    '''
+    DESCRIPTION: Counts of a run with one clinical case.
+    '''
+    index = pd.Index(['S0000-00000000000000-1'])
+    return Counts(pd.Series([float(TP)], index=index), pd.Series([Pred_Pos], index=index),
+                  pd.Series([GS_Pos], index=index), number(TP), number(Pred_Pos),
+                  number(GS_Pos))
+
+
+def micro_average(counts):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        _, P, _, R, _, F1 = compute_metrics(counts)
+    return P, R, F1
+
+
+@pytest.mark.parametrize('number', [int, float, np.int64, np.float64])
+def test_scores(number):
+    assert micro_average(make_counts(3, 4, 6, number)) == (0.75, 0.5, 0.6)
+
+
+@pytest.mark.parametrize('number', [int, float, np.int64, np.float64])
+def test_no_valid_predictions(number):
+    P, R, F1 = micro_average(make_counts(0, 0, 6, number))
+    assert math.isnan(P) and (R == 0) and math.isnan(F1)
+
+
+@pytest.mark.parametrize('number', [int, np.float64])
+def test_empty_gold_standard(number):
+    P, R, F1 = micro_average(make_counts(0, 4, 0, number))
+    assert (P == 0) and math.isnan(R) and math.isnan(F1)
+
+
+def test_no_true_positives():
+    with pytest.warns(UserWarning, match='Global F1 score automatically set to zero'):
+        _, P, _, R, _, F1 = compute_metrics(make_counts(0, 4, 6))
+    assert (P, R, F1) == (0, 0, 0)
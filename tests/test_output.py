@@ -0,0 +1,123 @@
+"""
+Result files (--output): the tables and micro-averages written in every
+format hold the results of the evaluation, and --quiet only prints the
+micro-averages.
+"""
+
+import io
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval import f1_eval, output, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from codiesp_eval.metrics import compute_metrics
+from conftest import CLI, arguments
+
+
+def expected_results(corpus, task):
+    '''
+    DESCRIPTION: Table and micro-averages of the evaluation of a subtask.
+    '''
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if task == 'X':
+            valid_codes = (load_valid_codes(corpus['codes_D']) |
+                           load_valid_codes(corpus['codes_P']))
+            counts = x_eval.count_run(x_eval.read_gs(corpus['gs_X']), corpus['pred_X'],
+                                      valid_codes)
+        else:
+            counts = f1_eval.count_run(f1_eval.read_gs(corpus['gs_' + task]),
+                                       corpus['pred_' + task],
+                                       load_valid_codes(corpus['codes_' + task]))
+        P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = compute_metrics(counts)
+    return output.results_table(P_per_cc, R_per_cc, F1_per_cc), output.summary(P, R, F1)
+
+
+def same_table(table, expected):
+    table = table.sort_values('clinical_case').reset_index(drop=True)
+    expected = expected.sort_values('clinical_case').reset_index(drop=True)
+    assert table['clinical_case'].tolist() == expected['clinical_case'].tolist()
+    for column in ('P', 'R', 'F1'):
+        assert np.allclose(table[column].astype(float), expected[column].astype(float),
+                           equal_nan=True)
+
+
+def test_output_format():
+    assert output.output_format('results.JSON') == 'json'
+    assert output.output_format('results.txt') == 'tsv'
+    assert output.output_format('results.pq') == 'parquet'
+    assert output.output_format('results', 'tsv') == 'tsv'
+    assert output.output_format('-', 'json') == 'json'
+    for path, fmt in [('results', None), ('results.csv', None), ('results.json', 'xml'),
+                      ('-', 'parquet')]:
+        with pytest.raises(ValueError):
+            output.output_format(path, fmt)
+
+
+def test_write_table(tmp_path):
+    table = pd.DataFrame({'clinical_case': ['S1', 'S2'], 'P': [0.5, np.nan],
+                          'R': [1.0, 0.0], 'F1': [2 / 3, np.nan]})
+    summary = output.summary(0.5, 0.25, np.nan)
+    assert summary == {'P': 0.5, 'R': 0.25, 'F1': None}
+
+    output.write_table(table, str(tmp_path / 'results.json'), summary=summary)
+    with open(tmp_path / 'results.json') as f:
+        assert json.load(f) == {'summary': summary,
+                                'table': {'clinical_case': ['S1', 'S2'], 'P': [0.5, None],
+                                          'R': [1.0, 0.0], 'F1': [2 / 3, None]}}
+
+    output.write_table(table, str(tmp_path / 'results.tsv'), summary=summary)
+    written = pd.read_csv(tmp_path / 'results.tsv', sep='\t')
+    assert written['clinical_case'].tolist() == ['S1', 'S2', output.MICRO_AVERAGE]
+    assert np.allclose(written[['P', 'R', 'F1']], [[0.5, 1, 2 / 3], [np.nan, 0, np.nan],
+                                                    [0.5, 0.25, np.nan]], equal_nan=True)
+
+
+@pytest.mark.parametrize('command, task', [('f1', 'D'), ('x', 'X')])
+def test_command_line(corpus, run, tmp_path, command, task):
+    table, summary = expected_results(corpus, task)
+
+    stdout = run(*CLI, command, *arguments(corpus, task), '-o', tmp_path / 'results.json')
+    with open(tmp_path / 'results.json') as f:
+        document = json.load(f)
+    assert document['summary'] == pytest.approx(summary)
+    same_table(pd.DataFrame(document['table']), table)
+
+    # Only the micro-averages with --quiet, then the same results in TSV on
+    # the standard output
+    micro_averages = run(*CLI, command, *arguments(corpus, task), '-q')
+    assert micro_averages == stdout[stdout.index('\n_'):]
+    quiet = run(*CLI, command, *arguments(corpus, task), '-o', '-', '--output_format', 'tsv',
+                '-q')
+    assert quiet.startswith(micro_averages)
+    written = pd.read_csv(io.StringIO(quiet[len(micro_averages):]), sep='\t')
+    assert written['clinical_case'].iloc[-1] == output.MICRO_AVERAGE
+    assert written.iloc[-1][['P', 'R', 'F1']].tolist() == pytest.approx(
+        list(summary.values()))
+    same_table(written.iloc[:-1], table)
+
+
+def test_parquet(corpus, run, tmp_path):
+    path = tmp_path / 'results.parquet'
+    try:
+        output.check_parquet_engine()
+    except ImportError:
+        run(*CLI, 'f1', *arguments(corpus, 'D'), '-o', path, status=2)
+        pytest.skip('no Parquet engine installed')
+    run(*CLI, 'f1', *arguments(corpus, 'D'), '-o', path)
+    table, summary = expected_results(corpus, 'D')
+    written = pd.read_parquet(path)
+    assert written['clinical_case'].iloc[-1] == output.MICRO_AVERAGE
+    same_table(written.iloc[:-1], table)
+
+
+def test_tol_sweep(corpus, run, tmp_path):
+    run(*CLI, 'x', *arguments(corpus, 'X'), '--tol_sweep', 0, 10, '-o', tmp_path / 'curve.tsv')
+    curve = pd.read_csv(tmp_path / 'curve.tsv', sep='\t')
+    assert curve['tol'].tolist() == list(range(11))
+    assert curve.iloc[-1][['P', 'R', 'F1']].tolist() == pytest.approx(
+        list(expected_results(corpus, 'X')[1].values()))
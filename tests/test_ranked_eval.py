@@ -0,0 +1,122 @@
+"""
+Ranked CodiEsp-D/P evaluation: every metric of ranked_eval against a plain
+computation from the ranked codes of every query, MAP against map_eval and
+the set-based scores against f1_eval.
+"""
+
+import math
+import warnings
+
+import pytest
+
+from codiesp_eval import f1_eval, map_eval, ranked_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from conftest import CLI
+
+KS = (1, 3, 5)
+
+
+def query_metrics(relevant, docids, depth=1000):
+    '''
+    DESCRIPTION: Ranked metrics of a query from its relevant codes and its
+    distinct predicted codes in rank order.
+    '''
+    is_rel = [docid in relevant for docid in docids]
+    n_rel = len(relevant)
+
+    def average_precision(cutoff):
+        hits = [sum(is_rel[:rank]) / rank for rank in range(1, len(is_rel) + 1)
+                if is_rel[rank - 1] and rank <= cutoff]
+        return sum(hits) / n_rel
+
+    def ndcg(cutoff):
+        dcg = sum(1 / math.log2(rank + 1) for rank in range(1, len(is_rel) + 1)
+                  if is_rel[rank - 1] and rank <= cutoff)
+        return dcg / sum(1 / math.log2(rank + 1) for rank in range(1, min(n_rel, cutoff) + 1))
+
+    metrics = {'P@{}'.format(k): sum(is_rel[:k]) / k for k in KS}
+    if n_rel == 0:
+        return metrics
+    metrics['MAP'] = average_precision(depth)
+    metrics['R-prec'] = sum(is_rel[:n_rel]) / n_rel
+    metrics['nDCG'] = ndcg(depth)
+    for k in KS:
+        metrics['MAP@{}'.format(k)] = average_precision(k)
+        metrics['nDCG@{}'.format(k)] = ndcg(k)
+    return metrics
+
+
+def load(corpus):
+    valid_codes = load_valid_codes(corpus['codes_D'])
+    gs = map_eval.format_gs(corpus['gs_D'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        pred = map_eval.format_predictions(corpus['pred_D'], None, valid_codes)
+    return valid_codes, gs, pred
+
+
+def with_repeated_codes(pred_path, out_path):
+    '''
+    DESCRIPTION: Copy of a predictions file with its first prediction
+    repeated right after itself and every prediction repeated, in reverse
+    order, at the end of the file.
+    '''
+    with open(pred_path, encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.writelines(lines[:1] + lines + lines[::-1])
+
+
+def test_ranked_metrics(corpus):
+    valid_codes, gs, pred = load(corpus)
+    relevant = {}
+    for qid, docno in zip(gs['qid'], gs['docno']):
+        relevant.setdefault(qid, set()).add(docno)
+    ranked = {}
+    for query, docid in zip(pred['query'], pred['docid']):
+        ranked.setdefault(query, []).append(docid)
+    expected = {query: query_metrics(relevant.get(query, set()), docids, depth=4)
+                for query, docids in ranked.items()}
+
+    for run in (ranked_eval.encode_run(gs, pred, valid_codes),
+                ranked_eval.read_ranked_run(gs, corpus['pred_D'], valid_codes, chunksize=7)):
+        metrics, per_query = ranked_eval.ranked_metrics(run, ks=KS, depth=4, per_query=True)
+        assert sorted(per_query.index) == sorted(expected)
+        for query, values in expected.items():
+            row = per_query.loc[query]
+            assert row[list(values)].tolist() == pytest.approx(list(values.values()))
+            assert row.drop(list(values)).isna().all()
+        # Queries that are not in the GS count as zero
+        for name in per_query.columns:
+            assert metrics[name] == pytest.approx(
+                sum(values.get(name, 0) for values in expected.values()) / len(expected))
+
+
+def test_same_scores_as_map_and_f1(corpus):
+    valid_codes, gs, pred = load(corpus)
+    metrics = ranked_eval.ranked_metrics(ranked_eval.encode_run(gs, pred, valid_codes))
+    assert metrics['MAP'] == pytest.approx(map_eval.calculate_map(gs, pred), abs=1e-12)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        _, P, _, R, _, F1 = f1_eval.calculate_metrics(f1_eval.read_gs(corpus['gs_D']),
+                                                      f1_eval.read_run(corpus['pred_D'],
+                                                                       valid_codes))
+    assert [metrics['P'], metrics['R'], metrics['F1']] == pytest.approx([P, R, F1])
+
+
+def test_repeated_codes(corpus, run, tmp_path):
+    valid_codes, gs, _ = load(corpus)
+    repeated_path = str(tmp_path / 'repeated.tsv')
+    with_repeated_codes(corpus['pred_D'], repeated_path)
+
+    # A repeated code keeps the rank of its first prediction
+    expected = ranked_eval.ranked_metrics(ranked_eval.read_ranked_run(gs, corpus['pred_D'],
+                                                                      valid_codes))
+    for chunksize in (5, 100000):
+        assert ranked_eval.ranked_metrics(ranked_eval.read_ranked_run(
+            gs, repeated_path, valid_codes, chunksize)) == pytest.approx(expected)
+
+    args = ['-g', corpus['gs_D'], '-c', corpus['codes_D']]
+    assert (run(*CLI, 'ranked', *args, '-p', repeated_path) ==
+            run(*CLI, 'ranked', *args, '-p', corpus['pred_D']))
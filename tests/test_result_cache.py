@@ -0,0 +1,69 @@
+"""
+The result cache (--result_cache) prints the same results as a plain
+evaluation, and its keys change with the content, the parameters and the
+scoring version of an evaluation.
+"""
+
+import json
+import warnings
+
+import pytest
+
+from codiesp_eval import result_cache
+from codiesp_eval.metrics import Counts
+from conftest import CLI, arguments
+
+
+def test_result_key(monkeypatch):
+    key = result_cache.result_key('x', 'a' * 64, ['b' * 64], tol=10, strict=False)
+    assert key == result_cache.result_key('x', 'a' * 64, ['b' * 64], strict=False, tol=10)
+    assert len({key, result_cache.result_key('x', 'a' * 64, ['b' * 64], tol=5, strict=False),
+                result_cache.result_key('x', 'a' * 64, ['b' * 64], tol=10, strict=True),
+                result_cache.result_key('d', 'a' * 64, ['b' * 64], tol=10, strict=False),
+                result_cache.result_key('x', 'c' * 64, ['b' * 64], tol=10, strict=False),
+                result_cache.result_key('x', 'a' * 64, ['c' * 64], tol=10, strict=False)}) == 6
+
+    # Only the scoring version, not the release, invalidates stored results
+    monkeypatch.setattr('codiesp_eval.__version__', '99.0.0')
+    assert key == result_cache.result_key('x', 'a' * 64, ['b' * 64], tol=10, strict=False)
+    monkeypatch.setattr(result_cache, 'SCORING_VERSION', result_cache.SCORING_VERSION + 1)
+    assert key != result_cache.result_key('x', 'a' * 64, ['b' * 64], tol=10, strict=False)
+
+
+def test_scoring_version(tmp_path, monkeypatch):
+    cache = result_cache.ResultCache(str(tmp_path / 'results.sqlite'))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        warnings.warn('2 invalid codes')
+        return {'counts': Counts(None, None, None, 0, 3, 4), 'MAP': 0.5}
+
+    with pytest.warns(UserWarning, match='2 invalid codes'):
+        for i in range(2):
+            result = cache.evaluate(result_cache.result_key('d', 'a' * 64, ['b' * 64]), compute)
+            assert result['counts'][3:] == (0, 3, 4) and result['MAP'] == 0.5
+    assert len(calls) == 1
+
+    monkeypatch.setattr(result_cache, 'SCORING_VERSION', result_cache.SCORING_VERSION + 1)
+    cache.evaluate(result_cache.result_key('d', 'a' * 64, ['b' * 64]), compute)
+    assert len(calls) == 2
+    cache.close()
+
+
+@pytest.mark.parametrize('command, task', [('f1', 'D'), ('d', 'D'), ('p', 'P'), ('x', 'X')])
+def test_result_cache(corpus, run, tmp_path, command, task):
+    db_path = tmp_path / 'results.sqlite'
+    expected = run(*CLI, command, *arguments(corpus, task))
+
+    stages = []
+    for i in range(2):
+        profile_path = tmp_path / 'profile{}.json'.format(i)
+        assert run(*CLI, command, *arguments(corpus, task), '--result_cache', db_path,
+                   '--profile', profile_path) == expected
+        with open(profile_path) as f:
+            stages.append([stage['name'] for stage in json.load(f)['stages']])
+
+    # The second evaluation is answered from the cache
+    assert 'read_predictions' in stages[0]
+    assert 'read_predictions' not in stages[1]
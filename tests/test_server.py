@@ -0,0 +1,204 @@
+"""
+The evaluation server, on a localhost port and on a Unix socket, returns the
+results of the command line evaluation of the same predictions.
+"""
+
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from codiesp_eval import map_eval, server as evaluation_server
+from codiesp_eval.codes_cache import load_valid_codes
+from conftest import ROOT
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    '''
+    DESCRIPTION: HTTP connection over a Unix socket.
+    '''
+
+    def __init__(self, socket_path):
+        http.client.HTTPConnection.__init__(self, 'localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+@pytest.fixture(scope='module', params=['tcp', 'unix'])
+def service(request, corpus, tmp_path_factory):
+    '''
+    DESCRIPTION: Evaluation server of the three subtasks of a corpus, running
+    in a thread, with one worker process.
+
+    OUTPUT:
+        server: http server
+        connect: function
+            new HTTP connection to the server.
+    '''
+    tmp_dir = tmp_path_factory.mktemp('server')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('CODIESP_CACHE_DIR', str(tmp_dir / 'cache'))
+        resources = evaluation_server.load_resources(
+            {'d': corpus['gs_D'], 'p': corpus['gs_P'], 'x': corpus['gs_X']},
+            corpus['codes_D'], corpus['codes_P'])
+    if request.param == 'unix':
+        socket_path = str(tmp_dir / 'evaluation.sock')
+        server = evaluation_server.make_server(resources, socket_path=socket_path,
+                                               workers=1, quiet=True)
+        connect = lambda: UnixHTTPConnection(socket_path)
+    else:
+        server = evaluation_server.make_server(resources, port=0, workers=1, quiet=True)
+        port = server.server_address[1]
+        connect = lambda: http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, connect
+    server.shutdown()
+    server.server_close()
+    server.executor.shutdown()
+    thread.join()
+
+
+def send(connect, method, path, body=None, headers={}):
+    '''
+    DESCRIPTION: Send a request and return its status and decoded JSON body.
+    '''
+    connection = connect()
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_health(service):
+    _, connect = service
+    assert send(connect, 'GET', '/health') == (200, {'status': 'ok', 'tasks': ['d', 'p', 'x']})
+
+
+@pytest.mark.parametrize('task', ['D', 'P'])
+def test_evaluate_d_p(service, corpus, run, tmp_path, task):
+    _, connect = service
+    status, result = send(connect, 'POST', '/evaluate/' + task.lower(),
+                          read_bytes(corpus['pred_' + task]))
+    assert status == 200
+
+    output_path = tmp_path / 'results.json'
+    run('-m', 'codiesp_eval.cli', 'f1', '-g', corpus['gs_' + task], '-p',
+        corpus['pred_' + task], '-c', corpus['codes_' + task], '-q', '-o', output_path)
+    with open(output_path) as f:
+        expected = json.load(f)['summary']
+    MAP = map_eval.calculate_map_from_file(map_eval.format_gs(corpus['gs_' + task]),
+                                           corpus['pred_' + task],
+                                           load_valid_codes(corpus['codes_' + task]))
+    assert result['task'] == task.lower()
+    assert [result['P'], result['R'], result['F1']] == [expected['P'], expected['R'],
+                                                       expected['F1']]
+    assert result['MAP'] == MAP
+
+
+def test_evaluate_x(service, corpus, run, tmp_path):
+    _, connect = service
+    status, result = send(connect, 'POST', '/evaluate/x?per_cc=1',
+                          read_bytes(corpus['pred_X']))
+    assert status == 200
+
+    output_path = tmp_path / 'results.json'
+    run('-m', 'codiesp_eval.cli', 'x', '-g', corpus['gs_X'], '-p', corpus['pred_X'],
+        '-cD', corpus['codes_D'], '-cP', corpus['codes_P'], '-q', '-o', output_path)
+    with open(output_path) as f:
+        expected = json.load(f)
+    assert 'MAP' not in result
+    assert [result['P'], result['R'], result['F1']] == [expected['summary']['P'],
+                                                       expected['summary']['R'],
+                                                       expected['summary']['F1']]
+    table = expected['table']
+    assert ({cc: F1 for cc, F1 in result['per_cc']['F1'].items() if F1 is not None} ==
+            {cc: F1 for cc, F1 in zip(table['clinical_case'], table['F1']) if F1 is not None})
+
+
+def test_evaluate_without_valid_codes(service, corpus):
+    _, connect = service
+    with open(corpus['pred_D'], encoding='utf-8') as f:
+        case = f.readline().split('\t')[0]
+    status, result = send(connect, 'POST', '/evaluate/d',
+                          '{}\tzzz\n'.format(case).encode('utf-8'))
+    assert status == 200
+    assert (result['P'], result['R'], result['F1'], result['MAP']) == (None, 0.0, None, 0.0)
+    assert 'None of the predicted codes are considered valid codes' in result['warnings']
+
+
+def send_headers(connect, path, headers):
+    '''
+    DESCRIPTION: Send the headers of a POST request, without a body, and
+    return the status of the response.
+    '''
+    connection = connect()
+    try:
+        connection.putrequest('POST', path)
+        for header, value in headers.items():
+            connection.putheader(header, value)
+        connection.endheaders()
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+def test_request_errors(service):
+    server, connect = service
+    assert send(connect, 'POST', '/evaluate/q', b'')[0] == 404
+    assert send(connect, 'GET', '/evaluate/d')[0] == 404
+    assert send_headers(connect, '/evaluate/d', {}) == 411
+    assert send_headers(connect, '/evaluate/d', {'Content-Length': '-1'}) == 400
+    assert send_headers(connect, '/evaluate/d', {'Content-Length': 'x'}) == 400
+    assert send_headers(connect, '/evaluate/d',
+                        {'Content-Length': str(server.max_body_size + 1)}) == 413
+
+
+def test_socket_path_is_not_a_socket(tmp_path):
+    path = tmp_path / 'results.tsv'
+    path.write_text('not a socket')
+    with pytest.raises(FileExistsError):
+        evaluation_server.make_server({}, socket_path=str(path))
+    assert path.read_text() == 'not a socket'
+
+
+def test_exit_status(corpus, run, tmp_path):
+    # Stopped with Ctrl-C
+    socket_path = str(tmp_path / 'evaluation.sock')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'codiesp_eval.server', '-gD', corpus['gs_D'],
+         '-cD', corpus['codes_D'], '--socket', socket_path, '-w', '1', '-q'],
+        cwd=str(tmp_path), env=dict(os.environ, PYTHONPATH=ROOT),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for _ in range(600):
+            if os.path.exists(socket_path) or process.poll() is not None:
+                break
+            time.sleep(0.1)
+        assert send(lambda: UnixHTTPConnection(socket_path), 'GET', '/health')[0] == 200
+        process.send_signal(signal.SIGINT)
+        assert process.wait(timeout=60) == 0
+    finally:
+        process.kill()
+        process.communicate()
+
+    # Invalid arguments
+    run('-m', 'codiesp_eval.server', '-cD', corpus['codes_D'], status=2)
@@ -0,0 +1,52 @@
+"""
+Parallel CodiEsp-X evaluation (--workers): the predictions file is split
+into ranges of whole lines, and the counts merged from the ranges are those
+of a serial evaluation.
+"""
+
+import warnings
+
+import pytest
+
+from codiesp_eval import shards, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from conftest import CLI, arguments
+
+
+@pytest.mark.parametrize('n_blocks', [1, 2, 3, 7, 1000])
+def test_file_blocks(tmp_path, n_blocks):
+    path = tmp_path / 'pred.tsv'
+    lines = ['S{}\t{} {}\tlabel\tr69\n'.format(i, i, i + 10 ** (i % 4)) for i in range(50)]
+    path.write_text(''.join(lines))
+    data = path.read_bytes()
+
+    blocks = shards.file_blocks(str(path), n_blocks)
+    assert len(blocks) <= n_blocks
+    # Contiguous ranges of whole lines that cover the file
+    assert blocks[0][0] == 0
+    assert sum(length for _, length in blocks) == len(data)
+    for (offset, length), (next_offset, _) in zip(blocks, blocks[1:]):
+        assert offset + length == next_offset
+        assert data[next_offset - 1:next_offset] == b'\n'
+
+
+@pytest.mark.parametrize('strict', [False, True])
+def test_count_run_sharded(corpus, strict):
+    valid_codes = load_valid_codes(corpus['codes_D']) | load_valid_codes(corpus['codes_P'])
+    df_gs = x_eval.read_gs(corpus['gs_X'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = x_eval.count_run(df_gs, corpus['pred_X'], valid_codes, 3, strict=strict)
+        counts = shards.count_run_sharded(df_gs, corpus['pred_X'], valid_codes, 3,
+                                          chunksize=17, strict=strict, workers=3)
+    assert counts[3:] == expected[3:]
+    for computed, series in zip(counts[:3], expected[:3]):
+        assert computed.sort_index().equals(series.sort_index())
+
+
+def test_x_workers(corpus, run):
+    serial = run(*CLI, 'x', *arguments(corpus, 'X'))
+    assert run(*CLI, 'x', *arguments(corpus, 'X'), '--workers', 2) == serial
+    assert run(*CLI, 'x', *arguments(corpus, 'X'), '--workers', 2, '--tol', 0,
+               '--strict') == run(*CLI, 'x', *arguments(corpus, 'X'), '--tol', 0, '--strict')
+    run(*CLI, 'x', *arguments(corpus, 'X'), '--workers', -1, status=2)
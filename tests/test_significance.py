@@ -0,0 +1,113 @@
+"""
+Bootstrap confidence intervals and paired randomization tests: the resampled
+metrics of the weight matrices against resamples drawn one at a time, and
+the estimates against the evaluation of the runs.
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval import f1_eval, map_eval, significance
+from codiesp_eval.codes_cache import load_valid_codes
+from codiesp_eval.metrics import compute_metrics
+
+
+@pytest.fixture
+def runs(corpus, tmp_path):
+    '''
+    DESCRIPTION: Counts and Average Precisions of the CodiEsp-D run of the
+    corpus and of a second run without its last 100 rows.
+    '''
+    valid_codes = load_valid_codes(corpus['codes_D'])
+    df_gs, qrels = f1_eval.read_gs(corpus['gs_D']), map_eval.format_gs(corpus['gs_D'])
+    second_path = tmp_path / 'second.tsv'
+    with open(corpus['pred_D'], encoding='utf-8') as f:
+        second_path.write_text(''.join(f.readlines()[:-100]))
+
+    gold = {'gs': df_gs, 'qrels': qrels}
+    return [significance.load_units('d', gold, path, valid_codes)
+            for path in (corpus['pred_D'], str(second_path))]
+
+
+def random_units(seed, n=30):
+    rng = np.random.default_rng(seed)
+    gold = rng.integers(1, 8, n).astype(float)
+    tp = np.minimum(gold, rng.integers(0, 6, n))
+    return np.column_stack([tp, tp + rng.integers(0, 4, n), gold]), np.array([0., 5., 0.])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_bootstrap_block(seed):
+    units, offset = random_units(seed)
+    values = significance._bootstrap_block((units, offset, 'prf', seed, 50))
+
+    # The same draws, one resample at a time
+    draws = np.random.default_rng(seed).integers(0, units.shape[0], size=(50, units.shape[0]))
+    expected = [significance.scores((units[d].sum(axis=0) + offset)[None, :], 'prf')[0]
+                for d in draws]
+    assert np.allclose(values, expected)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_randomization_block(seed):
+    units_a, offset = random_units(seed)
+    units_b, _ = random_units(seed + 10)
+    diffs = significance._randomization_block((units_a, offset, units_b, offset, 'prf',
+                                               seed, 50))
+
+    swaps = np.random.default_rng(seed).random((50, units_a.shape[0])) < 0.5
+    expected = []
+    for swap in swaps:
+        totals_a = np.where(swap[:, None], units_b, units_a).sum(axis=0) + offset
+        totals_b = np.where(swap[:, None], units_a, units_b).sum(axis=0) + offset
+        expected.append(significance.scores(totals_a[None, :], 'prf')[0] -
+                        significance.scores(totals_b[None, :], 'prf')[0])
+    assert np.allclose(diffs, expected)
+
+
+def test_bootstrap(runs):
+    counts, ap = runs[0]['prf'], runs[0]['map']
+    _, P, _, R, _, F1 = compute_metrics(counts)
+
+    results = significance.bootstrap(*significance.prf_units(counts), 'prf', 2500, seed=1)
+    assert results['metric'].tolist() == significance.PRF_METRICS
+    assert results['estimate'].tolist() == pytest.approx([P, R, F1])
+    assert ((results['ci_low'] < results['estimate']) &
+            (results['estimate'] < results['ci_high'])).all()
+
+    # MAP: the ranked queries of the run, queries not in the GS count as zero
+    results = significance.bootstrap(*significance.map_units(ap), 'map', 2500, seed=1)
+    assert results['estimate'].tolist() == pytest.approx([ap.fillna(0).mean()])
+
+    # The results only depend on the seed
+    assert results.equals(significance.bootstrap(*significance.map_units(ap), 'map', 2500,
+                                                 seed=1, workers=2))
+
+
+def test_randomization_test(runs):
+    a, b = runs
+    same = significance.randomization_test(*significance.prf_units(a['prf']),
+                                           *significance.prf_units(a['prf']), 'prf', 500,
+                                           seed=0)
+    assert (same['diff'] == 0).all() and (same['p_value'] == 1).all()
+
+    # MAP of runs ranking different queries, on the union of their queries
+    index = a['map'].index.union(b['map'].index)
+    results = significance.randomization_test(*significance.map_units(a['map'], index),
+                                              *significance.map_units(b['map'], index),
+                                              'map', 500, seed=0)
+    assert results.loc[0, ['run_a', 'run_b']].tolist() == pytest.approx(
+        [a['map'].fillna(0).mean(), b['map'].fillna(0).mean()])
+    assert 0 < results.loc[0, 'p_value'] <= 1
+
+
+def test_command_line(corpus, run):
+    output = run('-m', 'codiesp_eval.significance', '-t', 'd', '-g', corpus['gs_D'],
+                 '-p', corpus['pred_D'], '-c', corpus['codes_D'], '-n', 200)
+    results = pd.read_csv(io.StringIO(output), sep='\t')
+    assert results['metric'].tolist() == significance.PRF_METRICS + ['MAP']
+    run('-m', 'codiesp_eval.significance', '-t', 'd', '-g', corpus['gs_D'],
+        '-p', corpus['pred_D'], status=2)
@@ -0,0 +1,110 @@
+"""
+Evaluation of every split: every run gets the scores of its own evaluation
+against the Gold Standard of its split, whatever the number of workers, and
+the exit status reports the runs that could not be read.
+"""
+
+import io
+import shutil
+
+import pandas as pd
+import pytest
+
+from codiesp_eval import f1_eval, map_eval, splits, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from codiesp_eval.metrics import compute_metrics
+from conftest import edit_predictions
+
+
+@pytest.fixture
+def roots(corpus, tmp_path):
+    '''
+    DESCRIPTION: Gold Standard and system roots with a dev and a test split
+    of the three subtasks. The dev split has the predictions of the corpus,
+    the test split those and an edited copy of them.
+    '''
+    gold, system = tmp_path / 'gold', tmp_path / 'system'
+    for task in 'DPX':
+        for split in ('dev', 'test'):
+            gs_dir = gold / 'codiesp-{}'.format(task) / split
+            pred_dir = system / 'codiesp-{}'.format(task) / split
+            gs_dir.mkdir(parents=True)
+            pred_dir.mkdir(parents=True)
+            shutil.copy(corpus['gs_' + task], str(gs_dir / '{}{}.tsv'.format(split, task)))
+            shutil.copy(corpus['pred_' + task], str(pred_dir / 'run1.tsv'))
+        edit_predictions(corpus['pred_' + task], str(pred_dir / 'run2.tsv'))
+    return gold, system
+
+
+def expected_scores(corpus, task, pred_path):
+    '''
+    DESCRIPTION: P, R, F1 and MAP of a run, from the evaluation of each
+    metric on its own.
+    '''
+    codes_D = load_valid_codes(corpus['codes_D'])
+    codes_P = load_valid_codes(corpus['codes_P'])
+    if task == 'X':
+        counts = x_eval.count_run(x_eval.read_gs(corpus['gs_X']), pred_path,
+                                  codes_D.union(codes_P))
+        return list(compute_metrics(counts)[1::2]) + [None]
+    valid_codes = codes_D if task == 'D' else codes_P
+    counts = f1_eval.count_run(f1_eval.read_gs(corpus['gs_' + task]), pred_path, valid_codes)
+    MAP = map_eval.calculate_map_from_file(map_eval.format_gs(corpus['gs_' + task]),
+                                           pred_path, valid_codes)
+    return list(compute_metrics(counts)[1::2]) + [MAP]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_evaluate_splits(corpus, roots, workers):
+    gold, system = roots
+    jobs = splits.find_pairs(str(gold), str(system))
+    valid_codes = splits.load_codes({'d', 'p', 'x'}, corpus['codes_D'], corpus['codes_P'])
+    results = splits.evaluate_splits(jobs, valid_codes, workers)
+
+    assert results.columns.tolist() == splits.COLUMNS
+    assert results[['split', 'subtask', 'run']].values.tolist() == [
+        [split, task, run] for split, runs in (('dev', ['run1.tsv']),
+                                               ('test', ['run1.tsv', 'run2.tsv']))
+        for task in 'DPX' for run in runs]
+    assert results['error'].isna().all()
+    for job, (_, row) in zip(jobs, results.iterrows()):
+        expected = expected_scores(corpus, row['subtask'], job[3])
+        assert row[['P', 'R', 'F1']].tolist() == pytest.approx(expected[:3])
+        if row['subtask'] == 'X':
+            assert pd.isna(row['MAP'])
+        else:
+            assert row['MAP'] == pytest.approx(expected[3])
+
+
+def test_find_pairs(roots):
+    gold, system = roots
+    jobs = splits.find_pairs(str(gold), str(system), tasks=['p'], splits=['test'])
+    assert [(job[0], job[1], job[3].split('/')[-1]) for job in jobs] == [
+        ('p', 'test', 'run1.tsv'), ('p', 'test', 'run2.tsv')]
+    with pytest.raises(FileNotFoundError):
+        splits.find_pairs(str(gold), str(system), splits=['train'])
+
+
+def test_load_codes(corpus):
+    with pytest.raises(ValueError):
+        splits.load_codes({'x'}, corpus['codes_D'])
+    with pytest.raises(ValueError):
+        splits.load_codes({'p'}, corpus['codes_D'])
+
+
+def test_exit_status(corpus, roots, run):
+    gold, system = roots
+    args = ['-m', 'codiesp_eval.splits', '-g', gold, '-p', system,
+            '-cD', corpus['codes_D'], '-cP', corpus['codes_P'], '-w', 2]
+    run(*args, status=0)
+
+    # A run with the wrong number of columns
+    (system / 'codiesp-D' / 'dev' / 'run3.tsv').write_text('S0000-00000000000000-1\tr69\tr69\n')
+    results = pd.read_csv(io.StringIO(run(*args, status=1)), sep='\t')
+    assert results['error'].notna().sum() == 1
+    assert results.loc[results['error'].notna(), 'run'].tolist() == ['run3.tsv']
+
+    # CodiEsp-D alone does not need the codes of CodiEsp-P
+    results = pd.read_csv(io.StringIO(run(*args[:-4], '-t', 'd', '-s', 'test')), sep='\t')
+    assert results[['split', 'subtask']].drop_duplicates().values.tolist() == [['test', 'D']]
+    run(*args[:-4], status=2)
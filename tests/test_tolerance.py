@@ -0,0 +1,72 @@
+"""
+CodiEsp-X tolerance sweep: every row of the curve computed with a single
+matching pass gives the same results as an evaluation with that tolerance,
+and the required tolerance of every reference agrees with a brute-force
+check of every tolerance.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval import span_matching, x_eval
+from codiesp_eval.codes_cache import load_valid_codes
+from conftest import CLI, arguments
+from test_x_eval import brute_force, random_spans
+
+TOLS = [0, 1, 2, 5, 10, 20]
+
+
+@pytest.mark.parametrize('strict', [False, True])
+def test_sweep_run(corpus, strict):
+    valid_codes = load_valid_codes(corpus['codes_D']) | load_valid_codes(corpus['codes_P'])
+    df_gs = x_eval.read_gs(corpus['gs_X'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        df_pred = x_eval.read_run(corpus['pred_X'], valid_codes)
+        curves = [x_eval.sweep_run(df_gs, corpus['pred_X'], valid_codes, TOLS, chunksize=13,
+                                   strict=strict),
+                  x_eval.calculate_tolerance_curve(df_gs, df_pred, TOLS, strict=strict)]
+
+    for tol in TOLS:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            _, P, _, R, _, F1 = x_eval.calculate_metrics(df_gs, df_pred, tol, strict=strict)
+        for curve in curves:
+            row = curve.set_index('tol').loc[tol]
+            assert [row['P'], row['R'], row['F1']] == pytest.approx([P, R, F1])
+    # The F-score grows with the tolerance
+    assert (np.diff(curves[0]['F1']) >= 0).all() and curves[0]['F1'].iloc[-1] > 0
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_required_tolerance(seed):
+    rng = np.random.default_rng(seed)
+    gs = random_spans(rng, 200, 6)
+    pred = random_spans(rng, 400, 6)
+    df_gs = pd.DataFrame({'clinical_case': gs[0], 'code': 'r69', 'start_pos_gs': gs[1],
+                          'end_pos_gs': gs[2]})
+    df_pred = pd.DataFrame({'clinical_case': pred[0], 'code': 'r69',
+                            'start_pos_pred': pred[1], 'end_pos_pred': pred[2]})
+
+    # A reference is covered with tol exactly when its required tolerance is <= tol
+    for required in (span_matching.required_tolerance(df_gs, df_pred, 30),
+                     span_matching.required_tolerance_groups(*gs, *pred, 30)):
+        for tol in range(31):
+            assert ((required <= tol) == brute_force(*gs, *pred, tol)).all()
+        assert (required[required > 30] == span_matching.NOT_COVERED).all()
+
+
+def test_negative_tolerance(corpus, run):
+    df_gs = x_eval.read_gs(corpus['gs_X'])
+    valid_codes = load_valid_codes(corpus['codes_D']) | load_valid_codes(corpus['codes_P'])
+    with pytest.raises(ValueError):
+        x_eval.calculate_tolerance_curve(df_gs, df_gs.iloc[:0], [-1, 0, 1])
+    with pytest.raises(ValueError):
+        x_eval.sweep_run(df_gs, corpus['pred_X'], valid_codes, [])
+
+    run(*CLI, 'x', *arguments(corpus, 'X'), '--tol', -1, status=2)
+    run(*CLI, 'x', *arguments(corpus, 'X'), '--tol_sweep', -1, 5, status=2)
+    run('codiespX_evaluation.py', *arguments(corpus, 'X'), '--tol', -1, status=2)
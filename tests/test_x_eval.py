@@ -0,0 +1,84 @@
+"""
+CodiEsp-X evaluation: output of codiespX_evaluation.py and interval matching
+(span_matching.match_references and match_groups) against a brute-force
+check of every prediction of every reference.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from codiesp_eval import span_matching
+from conftest import read_golden
+
+
+def brute_force(gs_group, gs_start, gs_end, pred_group, pred_start, pred_end, tol):
+    '''
+    DESCRIPTION: Whether every GS reference is covered by some prediction of
+    its group: 0 <= start_gs - start_pred <= tol and 0 <= end_pred - end_gs <= tol.
+    '''
+    return np.array([any((g == pg) and (0 <= s - ps <= tol) and (0 <= pe - e <= tol)
+                         for pg, ps, pe in zip(pred_group, pred_start, pred_end))
+                     for g, s, e in zip(gs_group, gs_start, gs_end)], dtype=bool)
+
+
+def random_spans(rng, n, n_groups, offset=0):
+    group = rng.integers(0, n_groups, n)
+    start = rng.integers(offset, offset + 200, n)
+    return group, start, start + rng.integers(0, 30, n)
+
+
+def test_same_output_as_original(stored_corpus, run):
+    c = stored_corpus
+    assert run('codiespX_evaluation.py', '-g', c['gs_X'], '-p', c['pred_X'],
+               '-cD', c['codes_D'], '-cP', c['codes_P']) == read_golden('codiespX_evaluation_X')
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('tol', [0, 3, 10])
+def test_match_groups(seed, tol):
+    rng = np.random.default_rng(seed)
+    gs = random_spans(rng, 300, 8, offset=-100 * (seed % 2))
+    pred = random_spans(rng, 600, 10, offset=-100 * (seed % 2))
+    # Some predictions close to the references, within and beyond the tolerance
+    near = rng.integers(0, 300, 300)
+    pred = tuple(np.r_[p, g[near] + (rng.integers(-12, 13, 300) if i else 0)]
+                 for i, (p, g) in enumerate(zip(pred, gs)))
+
+    is_valid = span_matching.match_groups(*gs, *pred, tol)
+    assert is_valid.dtype == bool
+    assert (is_valid == brute_force(*gs, *pred, tol)).all()
+    assert is_valid.any()
+
+
+def test_match_references():
+    rng = np.random.default_rng(0)
+    cases = np.array(['S1', 'S2', 'S3'], dtype=object)
+    codes = np.array(['r69', 'n20.0', 'bw03zzz'], dtype=object)
+    gs = random_spans(rng, 200, 9)
+    pred = random_spans(rng, 400, 9)
+    df_gs = pd.DataFrame({'clinical_case': cases[gs[0] // 3], 'code': codes[gs[0] % 3],
+                          'start_pos_gs': gs[1], 'end_pos_gs': gs[2]})
+    df_pred = pd.DataFrame({'clinical_case': cases[pred[0] // 3], 'code': codes[pred[0] % 3],
+                            'start_pos_pred': pred[1], 'end_pos_pred': pred[2]})
+
+    for tol in (0, 10, 50):
+        assert (span_matching.match_references(df_gs, df_pred, tol) ==
+                brute_force(*gs, *pred, tol)).all()
+
+
+def test_no_candidates():
+    empty = np.empty(0, dtype=np.int64)
+    one = np.array([5])
+    assert span_matching.match_groups(one * 0, one, one, empty, empty, empty).tolist() == [False]
+    assert span_matching.match_groups(empty, empty, empty, one * 0, one, one).tolist() == []
+
+
+@pytest.mark.parametrize('offset', [2 ** 31, -2 ** 31 - 1])
+def test_offsets_out_of_range(offset):
+    # Larger offsets would wrap around in 32 bits and match other spans
+    group, ok = np.zeros(1, dtype=np.int64), np.array([10])
+    with pytest.raises(ValueError, match='out of range'):
+        span_matching.match_groups(group, ok, ok, group, np.array([offset]), ok)
+    with pytest.raises(ValueError, match='out of range'):
+        span_matching.int32_offsets(np.array([offset]))